@@ -1,9 +1,15 @@
 from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session
 import os
 import json
-import subprocess
 import uuid
 
+import llm_client
+from config import GENERATION_MODEL, MCQ_TIMEOUT, PREREQ_TIMEOUT
+from json_salvage import parse_json_object, salvage_objects
+from prompts import PREREQ_SYSTEM_PROMPT
+from prereq_pdf import cached_prerequisite_pdf
+import pdf_cache
+
 from utils import (
     read_json,
     write_json,
@@ -13,7 +19,6 @@ from utils import (
     build_selected_structure,
     build_prompt,
     generate_pdf,
-    generate_prerequisite_pdf,
     handle_final_level,
     build_prerequisite_tree,
     fetch_structured_previous_year_content,
@@ -153,22 +158,23 @@ def generate_questions():
         "total_questions": total_questions
     }
 
+    # Fixed instructions go in the system prompt so the backend can reuse their cached prefix
     system_prompt = (
         "You are an AI that only responds with valid JSON. "
         "Do not include any explanations or natural language text. "
         "Just return a JSON object with the format:\n"
         "{ 'class': '8', 'subject': ['Mathematics'], 'questions': [ { 'question': ..., 'options': [...], 'correct_answer': ... } ] }\n"
-        f"Generate exactly {total_questions} MCQs based on the prerequisite context provided below."
+        f"Generate exactly {total_questions} MCQs based on the prerequisite context provided."
     )
 
-    ollama_prompt = f"{system_prompt}\n\n---\n\n{json.dumps(prompt_data, indent=2)}"
-
     try:
-        result = subprocess.run(["ollama", "run", "llama3"], input=ollama_prompt, capture_output=True, text=True, timeout=1000000)
-        output = result.stdout.strip()
+        output = llm_client.generate(
+            GENERATION_MODEL, json.dumps(prompt_data, indent=2), call_site="mcq",
+            timeout=MCQ_TIMEOUT, system=system_prompt
+        )
         print("Ollama Output:", output)
-        paper_json = json.loads(output[output.find('{'):output.rfind('}') + 1]) if output else {}
-        if not paper_json.get("questions"):
+        paper_json, _ = parse_json_object(output)
+        if not paper_json or not paper_json.get("questions"):
             return "Error: Ollama did not return valid questions. Please retry."
     except Exception as e:
         return f"Error: Could not generate questions. Details: {str(e)}"
@@ -185,13 +191,8 @@ def download_prereqs():
     except FileNotFoundError:
         return "Prerequisite tree not found", 404
 
-    pdf_buffer = generate_prerequisite_pdf(tree)
-    return send_file(
-        pdf_buffer,
-        as_attachment=True,
-        download_name="Prerequisite_Tree.pdf",
-        mimetype="application/pdf"
-    )
+    pdf_path, pdf_key = cached_prerequisite_pdf(tree)
+    return pdf_cache.send_pdf(pdf_path, pdf_key, "Prerequisite_Tree.pdf")
 
 @app.route('/download_pdf')
 def download_pdf():
@@ -278,18 +279,12 @@ def recursive_prereq(level):
             prompt = build_prompt(subject, chapter_name, previous_year_chapters)
 
             try:
-                result = subprocess.run(
-                    ["ollama", "run", "llama3"],
-                    input=prompt,
-                    capture_output=True,
-                    text=True,
-                    timeout=1000000
+                output = llm_client.generate(
+                    GENERATION_MODEL, prompt, call_site="prereq", timeout=PREREQ_TIMEOUT, system=PREREQ_SYSTEM_PROMPT
                 )
-                output = result.stdout.strip()
                 print("📥 Ollama Output:\n", output[:300])
 
-                prereq_json = json.loads(output[output.find("{"):output.rfind("}") + 1]) if output else {}
-                prereqs = prereq_json.get("prerequisites", {}).get(subject, [])
+                prereqs, _ = salvage_objects(output, is_item=lambda o: "number" in o and "chapter" in o)
 
                 for req in prereqs:
                     chapter_num = req.get("number")
@@ -3,30 +3,55 @@ import os
 import json
 import pprint
 import requests
-import subprocess
 import io
 import uuid
-from fpdf import FPDF
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session,flash
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session, flash, g, Response, stream_with_context
 from markupsafe import Markup
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.units import mm
 from collections import defaultdict
 import csv
 from datetime import datetime
-import ollama
 from content_generate import fetch_textbooks_list, generate_educational_content, generate_content_with_ollama
 import logging
-from config import TEXTBOOKS_API, DATA_DIR, FONTS_DIR, CONTENT_DIR, TEXT_LIMIT
+from config import (
+    TEXTBOOKS_API, DATA_DIR, FONTS_DIR, CONTENT_DIR, TEXT_LIMIT,
+    VERIFY_MODELS, VERIFY_QUORUM, VERIFY_TIMEOUT,
+    LLM_MAX_WORKERS, MCQ_TIMEOUT, MCQ_OUTPUT_TOKENS_PER_ITEM,
+    MCQ_MAX_ITEMS_PER_CHUNK, MCQ_CHUNK_RETRIES, LLM_SCHEMA_RETRIES, PREREQ_TIMEOUT,
+    GENERATION_MODEL, SVG_EXPLAIN_MODEL, LLM_WARMUP_ON_START, REQUEST_DEADLINE,
+    PREREQ_GRAPH_PRECOMPUTE, PREREQ_GRAPH_DEPTH, PREREQ_GRAPH_DEADLINE, PREREQ_SHORTLIST_K,
+    PREREQ_ENGINE, PREREQ_LOCAL_MAX_ITEMS, PREREQ_STORE, PDF_FONT_PRELOAD, PAPER_VARIANT_MAX,
+)
 from flask import send_from_directory
 import os.path
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.lib.utils import ImageReader
 import traceback
+import threading
+import functools
+import itertools
+import math
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import llm_client
+import llm_telemetry
+import model_warmup
+import request_deadline
+import prereq_graph
+import prereq_store
+from json_salvage import parse_json_object, salvage_objects
+from prompts import PREREQ_SYSTEM_PROMPT, build_prereq_prompt
+from prereq_ranking import shortlist_chapters, suggest_prerequisites
+from prereq_tree import build_prerequisite_tree
+from prereq_pdf import cached_prerequisite_pdf
+import pdf_cache
+import pdf_fonts
+import paper_variants
+import exam_bundle
+from paper_pdf import cached_paper_pdf
+from study_pdf import StudyMaterialWriter
+from fib_pdf import generate_fib_pdfs
+from llm_schemas import (
+    MCQ_QUESTION_SCHEMA, PREREQ_ITEM_SCHEMA, FIB_WORKSHEET_SCHEMA,
+    mcq_group_schema, prereq_list_schema, validate,
+)
 
 
 # Imports for SVG Generation
@@ -50,6 +75,54 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
+# Not in PDF render worker processes (pdf_engine), which re-import this module when it is run as a script
+if multiprocessing.parent_process() is None:
+    if LLM_WARMUP_ON_START:
+        model_warmup.start()
+    if PDF_FONT_PRELOAD:
+        pdf_fonts.preload()
+
+
+# Every request carries a deadline for its LLM calls and is cancelled if the client disconnects
+@app.before_request
+def start_request_deadline():
+    g.deadline, g.deadline_token = request_deadline.start(REQUEST_DEADLINE)
+    sock = request_deadline.client_socket(request.environ)
+    if sock is not None:
+        request_deadline.watch(g.deadline, sock)
+
+
+@app.teardown_request
+def finish_request_deadline(exc):
+    deadline = g.pop("deadline", None)
+    if deadline is not None:
+        request_deadline.unwatch(deadline)
+        request_deadline.finish(g.pop("deadline_token"))
+
+
+# Every request is an LLM telemetry job; jobs that made LLM calls are kept for /llm_jobs
+@app.before_request
+def start_llm_job():
+    g.llm_job, g.llm_job_token = llm_telemetry.start_job(request.endpoint or request.path)
+
+
+@app.after_request
+def tag_llm_job(response):
+    job = g.get("llm_job")
+    if job is not None and (job["calls"] or job["counters"]):
+        response.headers["X-LLM-Job-Id"] = job["id"]
+    return response
+
+
+@app.teardown_request
+def finish_llm_job(exc):
+    job = g.pop("llm_job", None)
+    if job is not None:
+        summary = llm_telemetry.finish_job(job, g.pop("llm_job_token"))
+        if summary:
+            logger.info(f"LLM job {summary['id']} ({summary['name']}): {summary['calls']} call(s) "
+                        f"in {summary['duration_seconds']}s")
+
 
 TEXTBOOKS_API = "https://staticapis.pragament.com/textbooks/allbooks.json"
 SVG_DIR = os.path.join("static", "svgs") # Directory to store generated SVGs
@@ -66,43 +139,8 @@ SUBJECT_NAME_MAP_BY_CLASS = {
     }
 }
 
-def sanitize_ollama_json(raw_str):
-    """
-    Fixes malformed JSON responses from the Ollama model.
-    - Removes trailing commas
-    - Converts invalid answer objects to lists
-    """
-    # Fix trailing commas before } or ]
-    raw_str = re.sub(r',\s*([\]}])', r'\1', raw_str)
-
-    # Fix malformed 'answers' objects
-    def fix_answers_block(match):
-        answer_block = match.group(1)
-        tokens = re.findall(r'"([^"]+)"', answer_block)
-        all_items = []
-        for item in tokens:
-            all_items.extend([s.strip() for s in item.split(',')])
-        unique_items = list(dict.fromkeys(filter(None, all_items)))
-        return '"answers": ' + json.dumps(unique_items)
-
-    raw_str = re.sub(r'"answers"\s*:\s*\[({[^}]+})\]', fix_answers_block, raw_str)
-    return raw_str
-
 # ------------------------------- Fill in the Blanks (FIB) Generation Functions -------------------------------
 
-import json
-import logging
-import re
-import ollama
-
-# Setup a logger (if you don't have one already)
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
-
-def sanitize_ollama_json(raw_str):
-    # Fix trailing commas before a closing bracket or brace
-    return re.sub(r',\s*([\]}])', r'\1', raw_str)
-
 def generate_fib_content(subject, chapter, topic, subtopic):
     """
     Generates Fill-in-the-Blank content with a new constraint for answer length.
@@ -130,195 +168,29 @@ Return only JSON with these keys:
 - "answers"
 """
     try:
-        response = ollama.chat(model="llama3", messages=[{"role": "user", "content": prompt}])
-        raw_output = response['message']['content']
-        json_start = raw_output.find('{')
-        json_end = raw_output.rfind('}') + 1
+        error = {"error": "The AI model returned a malformed JSON object that could not be repaired."}
+        for attempt in range(LLM_SCHEMA_RETRIES + 1):
+            raw_output = llm_client.generate(GENERATION_MODEL, prompt, call_site="fib", format=FIB_WORKSHEET_SCHEMA)
+            parsed, report = parse_json_object(raw_output, list_fields=("word_bank", "questions", "answers"))
 
-        if json_start == -1 or json_end == 0:
-            return {"error": "The AI model's response did not contain a JSON object."}
+            if parsed is None:
+                logger.error(f"FIB response could not be parsed: {report}")
+                continue
+            if report["repairs"]:
+                logger.info(f"Repaired FIB response: {', '.join(report['repairs'])}")
 
-        json_str = raw_output[json_start:json_end]
-        cleaned_output = sanitize_ollama_json(json_str)
-        parsed = json.loads(cleaned_output)
-        
-        required_keys = ["paragraph", "word_bank", "questions", "answers"]
-        if all(k in parsed for k in required_keys):
-            return parsed
-        else:
-            return {"error": "The AI-generated JSON is missing required keys."}
+            errors = validate(parsed, FIB_WORKSHEET_SCHEMA)
+            if not errors:
+                return parsed
+            logger.warning(f"FIB response failed schema validation: {'; '.join(errors[:3])}")
+            error = {"error": "The AI-generated JSON is missing required keys."}
+        return error
 
     except Exception as e:
         logger.error(f"Error during FIB generation: {e}")
         return {"error": "The AI model returned a malformed JSON object that could not be repaired."} 
 
 
-def generate_fib_pdf_v2(content, filename, show_answers=False, marker_path=None):
-    """
-    Generates a Fill-in-the-Blank PDF.
-    - Student version uses a two-column layout with one set of 9 boxes at the rightmost, right-aligned text.
-    - Omits second line if answer is the last word.
-    - Dynamically adjusts question width, no space on right.
-    - Teacher version uses a simple answer list format.
-    - Updated layout: Instructions in a box with border, info boxes in a table with labels, paragraph and answer bank in separate sections, questions with boxes aligned right, footer with centered signatures.
-    """
-    from reportlab.lib.pagesizes import A4
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib import colors
-    from reportlab.lib.units import cm
-    import os
-
-    doc_width, doc_height = A4
-    margin = 2.5 * cm
-    doc = SimpleDocTemplate(filename, pagesize=A4, topMargin=margin, bottomMargin=margin, leftMargin=margin, rightMargin=margin)
-    styles = getSampleStyleSheet()
-
-    # Define custom styles
-    styles.add(ParagraphStyle(name='AnswerKeyTitle', fontSize=14, alignment=1, spaceAfter=12, fontName='Helvetica-Bold'))
-    styles.add(ParagraphStyle(name='SectionHeader', fontSize=10, fontName='Helvetica-Bold', spaceBefore=10, spaceAfter=4))
-    styles.add(ParagraphStyle(name='Instructions', fontSize=8, leading=10))
-    styles.add(ParagraphStyle(name='AnswerBank', fontSize=9, leading=12))
-    styles.add(ParagraphStyle(name='MainParagraph', fontSize=9, leading=11, spaceAfter=12))
-    styles.add(ParagraphStyle(name='QuestionStyle', fontSize=9, leading=12, alignment=0, spaceAfter=2))  # Left-aligned
-    styles.add(ParagraphStyle(name='PostBoxText', fontSize=9, leading=12, alignment=0, leftIndent=0, spaceBefore=0))
-
-    story = []
-    box_style = TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER')
-    ])
-    available_width = doc_width - (2 * margin)
-    box_width = 0.5 * cm
-    num_boxes = 9
-    blank_width = num_boxes * box_width
-
-    # === TEACHER'S ANSWER KEY (Simple List Format) ===
-    if show_answers:
-        story.append(Paragraph("Worksheet & Answer Key", styles['AnswerKeyTitle']))
-        story.append(Paragraph(content.get("paragraph", ""), styles['MainParagraph']))
-        story.append(Paragraph("Word Bank:", styles['SectionHeader']))
-        word_bank_str = ", ".join(content.get("word_bank", []))
-        story.append(Paragraph(word_bank_str, styles['AnswerBank']))
-        story.append(Spacer(1, 1 * cm))
-        story.append(Paragraph("Fill in the blanks:", styles['SectionHeader']))
-        questions = content.get("questions", [])
-        for i, q_text in enumerate(questions):
-            story.append(Paragraph(f"{i+1}. {q_text.replace('______', '___________')}", styles['QuestionStyle']))
-            story.append(Spacer(1, 0.2 * cm))
-        story.append(Spacer(1, 1.5 * cm))
-        story.append(Paragraph("■ Answer Key (for teachers only):", styles['SectionHeader']))
-        answers = content.get("answers", [])
-        for i, ans_text in enumerate(answers):
-            story.append(Paragraph(f"<b>{i+1}.</b> {ans_text}", styles['QuestionStyle']))
-        doc.build(story)
-        return
-
-    # === STUDENT WORKSHEET (Updated Two-Column Layout) ===
-    # 1. Instructions in a bordered box
-    instructions_text = """
-    <b>Instructions for filling the sheet:</b><br/>
-    • Don't fold the sheet. Use only ball pen. Read the given paragraph carefully.<br/>
-    • Below the paragraph, you will find questions with blanks.<br/>
-    • Use the Answer Bank provided to fill in the blanks with the most appropriate word(s).<br/>
-    • Each word/phrase from the Answer Bank can be used only once, unless stated otherwise.<br/>
-    • Write only the correct word(s) in the blank space provided.<br/>
-    • Spelling errors may result in the loss of marks.<br/>
-    • Do not use words that are not in the Answer Bank.<br/>
-    • <b>Only use <i>UPPER CASE CAPITAL LETTER ALPHABETS</i> in the boxes.</b>
-    """
-    instructions_table = Table([[Paragraph(instructions_text, styles['Instructions'])]], colWidths=[available_width], style=TableStyle([
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5)
-    ]))
-    story.append(instructions_table)
-    story.append(Spacer(1, 0.4 * cm))
-
-    # 2. Info Boxes in a table with labels
-    info_table_data = [
-        [Paragraph("<b>Admission number</b>", styles['Instructions']), Table([[''] * 12], colWidths=[0.5 * cm] * 12, rowHeights=0.5 * cm, style=box_style)],
-        [Paragraph("<b>Student Name</b>", styles['Instructions']), Table([[''] * 24], colWidths=[0.5 * cm] * 24, rowHeights=0.5 * cm, style=box_style)],
-        [Paragraph("<b>Class</b>", styles['Instructions']), Table([[''] * 2], colWidths=[0.5 * cm] * 2, rowHeights=0.5 * cm, style=box_style),
-         Paragraph("<b>Section</b>", styles['Instructions']), Table([[''] * 2], colWidths=[0.5 * cm] * 2, rowHeights=0.5 * cm, style=box_style),
-         Paragraph("<b>Date (ddmmyyyy)</b>", styles['Instructions']), Table([[''] * 8], colWidths=[0.5 * cm] * 8, rowHeights=0.5 * cm, style=box_style)]
-    ]
-    info_table = Table(info_table_data, colWidths=[2.5 * cm, 6 * cm, 1 * cm, 1 * cm, 2 * cm, 4 * cm])
-    info_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0)
-    ]))
-    story.append(info_table)
-    story.append(Spacer(1, 0.4 * cm))
-
-    # 3. Paragraph and Answer Bank in separate sections
-    story.append(Paragraph(f"<b>Paragraph:</b> {content.get('paragraph', '')}", styles['MainParagraph']))
-    story.append(Spacer(1, 0.3 * cm))
-    story.append(Paragraph(f"<b>Answer bank:</b> {', '.join(word.upper() for word in content.get('word_bank', []))}", styles['AnswerBank']))
-    story.append(Spacer(1, 0.5 * cm))
-
-    # 4. Questions with Two-Column Layout
-    questions = content.get("questions", [])
-    for i, sentence in enumerate(questions):
-        if '______' in sentence:
-            parts = sentence.split('______', 1)
-            pre_box_text = parts[0].rstrip()
-            post_box_text = parts[1].lstrip() if len(parts) > 1 else ''
-            show_post_box = bool(post_box_text and post_box_text.strip())
-        else:
-            pre_box_text = sentence
-            post_box_text = ''
-            show_post_box = False
-        
-        adjusted_question_width = available_width - blank_width
-        question_para = Paragraph(f"<b>Q{i+1}.</b> {pre_box_text}", styles['QuestionStyle'])
-        blank_table = Table([[''] * num_boxes], colWidths=[box_width] * num_boxes, rowHeights=0.5 * cm, style=box_style)
-        
-        question_data = [[question_para, blank_table]]
-        question_table = Table(question_data, colWidths=[adjusted_question_width, blank_width])
-        question_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0)
-        ]))
-        story.append(question_table)
-        
-        if show_post_box:
-            story.append(Paragraph(post_box_text, styles['PostBoxText']))
-        
-        story.append(Spacer(1, 0.3 * cm))
-
-    # 5. Footer with centered signatures
-    footer_data = [[Paragraph("", styles['Instructions'])],
-                   [Paragraph("Invigilator's Signature: __________________", styles['Instructions'])],
-                   [Paragraph("Student's Signature: ____________________", styles['Instructions'])]]
-    footer_table = Table(footer_data, colWidths=[available_width], style=TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP')
-    ]))
-    story.append(Spacer(1, 1 * cm))
-    story.append(footer_table)
-
-    def draw_corner_markers(canvas, doc):
-        canvas.saveState()
-        if marker_path and os.path.exists(marker_path):
-            from reportlab.lib.utils import ImageReader
-            marker = ImageReader(marker_path)
-            positions = [
-                (0.5 * cm, doc_height - 1.3 * cm),
-                (doc_width - 1.3 * cm, doc_height - 1.3 * cm),
-                (0.5 * cm, 0.5 * cm),
-                (doc_width - 1.3 * cm, 0.5 * cm)
-            ]
-            for x, y in positions:
-                canvas.drawImage(marker, x, y, width=0.8 * cm, height=0.8 * cm, mask='auto')
-        canvas.restoreState()
-
-    doc.build(story, onFirstPage=draw_corner_markers, onLaterPages=draw_corner_markers)
-
 # ------------------------------- SVG Generation Functions (IMPROVED) -------------------------------
 
 # Namespaces
@@ -533,14 +405,11 @@ def generate_ai_explanation(filepath, topic):
 
 SVG Content:
 {svg_content}"""
-        response = ollama.chat(
-            model="mistral",
-            messages=[{"role": "user", "content": prompt}]
-        )
+        explanation = llm_client.generate(SVG_EXPLAIN_MODEL, prompt, call_site="svg_explain")
         clean_topic = re.sub(r'\W+', '_', topic.lower())
         explanation_path = os.path.join(SVG_DIR, f"{clean_topic}_explanation.md")
         with open(explanation_path, "w", encoding="utf-8") as f:
-            f.write(f"# Educational Guide\n{response['message']['content']}")
+            f.write(f"# Educational Guide\n{explanation}")
         logger.info(f"📘 Explanation saved: {explanation_path}")
         return explanation_path
     except Exception as e:
@@ -709,81 +578,24 @@ def fetch_structured_previous_year_content(
     # Save full_structure to file
     os.makedirs("structured_data", exist_ok=True)
     path = f"structured_data/previous_year_depth_{depth}.json"
-    with open(path, "w") as f:
+    # Written atomically: the background prerequisite graph and requests read these files concurrently
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(full_structure, f, indent=4)
+    os.replace(tmp_path, path)
 
     return full_structure
 
-def build_prerequisite_tree(selected_structure):
-    import copy
-
-    # Sort class keys by descending class number
-    sorted_classes = sorted(
-        selected_structure.keys(),
-        key=lambda k: int(k.split('_')[1]),
-        reverse=True
+def load_previous_year_level(board, class_name, subjects, level):
+    """Previous-year chapter structure `level` classes below `class_name`, reusing the depth file if present."""
+    prev_year_struct_path = f"structured_data/previous_year_depth_{level}.json"
+    if os.path.exists(prev_year_struct_path):
+        with open(prev_year_struct_path, "r") as f:
+            return json.load(f)
+    return fetch_structured_previous_year_content(
+        board, starting_class = class_name, current_class = str(int(class_name) - level), starting_subjects = subjects, depth=level, max_depth=5
     )
 
-    if not sorted_classes:
-        return {}
-
-    top_class_key = sorted_classes[0]
-    result = copy.deepcopy(selected_structure[top_class_key])  # Start with topmost class chapters
-
-    # Add class info to top level chapters
-    for subject, chapters in result.items():
-        for chapter in chapters:
-            chapter["class"] = top_class_key
-
-    # Create subject → chapter name → chapter dict map for all classes
-    all_chapter_map = {}
-    for class_key in selected_structure:
-        for subject, chapters in selected_structure[class_key].items():
-            all_chapter_map.setdefault(subject, {})
-            for ch in chapters:
-                ch_name = ch.get("chapter")
-                if ch_name:
-                    ch_copy = copy.deepcopy(ch)
-                    ch_copy["class"] = class_key  # 👈 Add class info
-                    all_chapter_map[subject][ch_name] = ch_copy
-
-    # Helper to recursively attach prerequisites
-    def attach_prerequisites(subject, chapter_name, current_class_index, visited=None):
-        if visited is None:
-            visited = set()
-        if chapter_name in visited:
-            return []
-        visited.add(chapter_name)
-
-        prerequisites = []
-        for lower_class_index in range(current_class_index + 1, len(sorted_classes)):
-            class_key = sorted_classes[lower_class_index]
-            chapters = selected_structure.get(class_key, {}).get(subject, [])
-
-            for ch in chapters:
-                target = ch.get("for")
-                ch_name = ch.get("chapter")
-
-                if ch_name in visited:
-                    continue
-
-                if target == chapter_name or not target:
-                    ch_copy = copy.deepcopy(ch)
-                    ch_copy.pop("for", None)
-                    ch_copy["class"] = class_key  # 👈 Add class here too
-                    ch_copy["prerequisites"] = attach_prerequisites(subject, ch_name, lower_class_index, visited.copy())
-                    prerequisites.append(ch_copy)
-
-        return prerequisites
-
-    # Build tree from topmost class downward
-    for subject, chapters in result.items():
-        for chapter in chapters:
-            chapter_name = chapter.get("chapter")
-            chapter["prerequisites"] = attach_prerequisites(subject, chapter_name, 0)
-
-    return {top_class_key: result}
-
 def build_prerequisite_tree_minimal(selected_structure):
     import copy
 
@@ -845,25 +657,58 @@ def build_prerequisite_tree_minimal(selected_structure):
 
     return result
 
+# Per-model verification stats, used to spot slow or unreliable ensemble members
+VERIFY_STATS = defaultdict(lambda: {
+    "calls": 0, "answered": 0, "errors": 0, "cancelled": 0,
+    "total_latency": 0.0, "agreed": 0, "disagreed": 0
+})
+VERIFY_STATS_LOCK = threading.Lock()
+
+def record_verify_stat(model_name, latency=None, **counters):
+    with VERIFY_STATS_LOCK:
+        stats = VERIFY_STATS[model_name]
+        if latency is not None:
+            stats["total_latency"] += latency
+        for key, value in counters.items():
+            stats[key] += value
+
+def parse_option_number(answer, num_options):
+    """Returns the first option number (1..num_options) found in a model answer."""
+    if not answer:
+        return None
+    for match in re.findall(r'\d+', answer):
+        number = int(match)
+        if 1 <= number <= num_options:
+            return number
+    return None
+
 def verify_answer_with_models(question_obj):
-    models = ["llama3"]
-    responses = []
-    model_outputs = {}
+    models = VERIFY_MODELS
+    if not models:
+        # No ensemble configured: the question is left unverified rather than failed
+        question_obj["verified"] = None
+        question_obj["model_responses"] = {}
+        print("⏭️ Verification skipped — VERIFY_MODELS is empty")
+        return
+    quorum = VERIFY_QUORUM or len(models) // 2 + 1
+    model_outputs = {model: None for model in models}
+    cancel_event = threading.Event()
 
     def get_answer_from_model(model_name, prompt_text):
+        started = time()
         try:
             print(f"🔍 Running model: {model_name}")
-            result = subprocess.run(
-                ["ollama", "run", model_name],
-                input=prompt_text,
-                capture_output=True,
-                text=True,
-                timeout=180
-            )
-            answer = result.stdout.strip().lower()
+            answer = llm_client.generate(
+                model_name, prompt_text, call_site="verify", timeout=VERIFY_TIMEOUT, cancel_event=cancel_event
+            ).lower()
+            record_verify_stat(model_name, latency=time() - started, calls=1, answered=1)
             print(f"✅ Answer from {model_name}: {answer}")
             return answer
+        except llm_client.LLMCancelled:
+            record_verify_stat(model_name, calls=1, cancelled=1)
+            return None
         except Exception as e:
+            record_verify_stat(model_name, latency=time() - started, calls=1, errors=1)
             print(f"❌ Error verifying with model {model_name}: {e}")
             return None
 
@@ -871,12 +716,7 @@ def verify_answer_with_models(question_obj):
     question_text = question_obj["question"]
 
     # Strip leading option numbering (e.g., '1. ') if present
-    stripped_options = []
-    for opt in options:
-        if opt[:2].isdigit() and opt[2:3] in ['.', ')']:
-            stripped_options.append(opt[3:].strip())
-        else:
-            stripped_options.append(opt)
+    stripped_options = [strip_number_prefix(opt) for opt in options]
 
     # Construct prompt with numbered stripped options
     prompt = f"Question: {question_text}\nOptions:\n"
@@ -886,154 +726,502 @@ def verify_answer_with_models(question_obj):
 
     print(f"\n📤 Prompt sent to models:\n{prompt}\n")
 
-    for idx, model in enumerate(models):
-        answer = get_answer_from_model(model, prompt)
-        model_outputs[model] = answer
-        if answer and answer.strip().isdigit():
-            responses.append(int(answer.strip()))
-
-    print(f"\n📥 All model responses: {responses}")
-
+    # Query the whole ensemble at once and stop as soon as a quorum agrees
+    # (or a quorum has become impossible for every option).
     match_counts = {}
-    for resp in responses:
-        match_counts[resp] = match_counts.get(resp, 0) + 1
+    verdict = None
+    executor = ThreadPoolExecutor(max_workers=len(models))
+    futures = {llm_client.submit(executor, get_answer_from_model, model, prompt): model for model in models}
+    pending = len(futures)
+    try:
+        for future in as_completed(futures):
+            pending -= 1
+            model = futures[future]
+            answer = future.result()
+            model_outputs[model] = answer
+            option = parse_option_number(answer, len(stripped_options))
+            if option is not None:
+                match_counts[option] = match_counts.get(option, 0) + 1
+                if match_counts[option] >= quorum:
+                    verdict = option
+                    break
+            if max(match_counts.values(), default=0) + pending < quorum:
+                break
+    finally:
+        cancel_event.set()
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    if match_counts:
-        most_common = max(match_counts.items(), key=lambda x: x[1])
-        if most_common[1] >= 2:
-            question_obj["correct_option"] = most_common[0]
-            question_obj["verified"] = True
-            print(f"✅ Final verdict: Verified ✅ — Correct option: {most_common[0]}")
-        else:
-            question_obj["verified"] = False
-            print("⚠️ Final verdict: Not Verified — All models gave different answers ❌")
+    print(f"\n📥 All model responses: {model_outputs}")
+
+    if verdict is not None:
+        question_obj["correct_option"] = verdict
+        question_obj["verified"] = True
+        print(f"✅ Final verdict: Verified ✅ — Correct option: {verdict} ({match_counts[verdict]}/{len(models)} models agree)")
+    elif match_counts:
+        question_obj["verified"] = False
+        print("⚠️ Final verdict: Not Verified — Models did not reach a quorum ❌")
+    elif request_deadline.incomplete_reason():
+        # Left unverified rather than failed: the request stopped before the models answered
+        question_obj["verified"] = None
+        print(f"⏱️ Verification skipped — {request_deadline.incomplete_reason()}")
     else:
         question_obj["verified"] = False
         print("❌ Final verdict: Not Verified — No valid numeric responses from models")
 
+    # Agreement is measured against the majority answer, even when no quorum was reached
+    if match_counts:
+        reference = verdict if verdict is not None else max(match_counts.items(), key=lambda x: x[1])[0]
+        for model, answer in model_outputs.items():
+            option = parse_option_number(answer, len(stripped_options))
+            if option is None:
+                continue
+            if option == reference:
+                record_verify_stat(model, agreed=1)
+            else:
+                record_verify_stat(model, disagreed=1)
+
     # Store what each model said for frontend visibility
     question_obj["model_responses"] = model_outputs
 
     print("------------------------------------------------------")
 
-def generate_pdf(data, output_pdf, show_metadata=True):
-    from fpdf import FPDF
-    
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    font_path = os.path.join("fonts", "DejaVuSans.ttf")
-    if not os.path.exists(font_path):
-        raise FileNotFoundError(f"Font file not found at {font_path}. Please add DejaVuSans.ttf to the 'fonts' folder.")
-
-    pdf.add_font("DejaVu", "", font_path, uni=True)
-    pdf.set_font("DejaVu", size=12)
-
-    pdf.cell(200, 10, txt="Generated Question Paper", ln=1, align='C')
-    pdf.ln(5)
-
-    for idx, q in enumerate(data.get("questions", []), start=1):
-        if(show_metadata):
-            tag_line = f"[Class: {q.get('class')}] [Subject: {q.get('subject')}] [Chapter: {q.get('chapter')}] [Topic: {q.get('topic')}]"
-            if q.get("subtopic"):
-                tag_line += f" [Subtopic: {q.get('subtopic')}]"
-            pdf.multi_cell(0, 10, txt=tag_line)
-            pdf.ln(1)
-
-        pdf.multi_cell(0, 10, txt=f"{idx}. {q.get('question')}")
-        pdf.ln(2)
-
-        for opt in q.get("options", []):
-            pdf.cell(0, 10, txt=opt, ln=1)
-
-        correct_num = q.get("correct_option")
-        correct_text = (
-            q["options"][correct_num - 1]
-            if correct_num and 1 <= correct_num <= len(q["options"])
-            else "N/A"
-        )
-        pdf.set_text_color(0, 128, 0)
-        pdf.cell(0, 10, txt=f"Correct Answer: {correct_text}", ln=1)
-        pdf.set_text_color(0, 0, 0)
-        pdf.ln(6)
+# ------------------------------- MCQ Generation -------------------------------
+
+MCQ_SYSTEM_PROMPT = (
+    "You are a JSON-only AI. Return strictly valid JSON only. Do NOT include explanations or natural language.\n\n"
+    "You are tasked with creating 1 high-quality multiple choice question per topic or subtopic, considering the following:\n"
+    "- The question must reflect the difficulty and knowledge level appropriate for the given class (grade level).\n"
+    "- Use the chapter name as the primary context.\n"
+    "- For subjects like 'Mathematics', ensure questions are **numerical, formula-based, or calculation-oriented**. Avoid generic or theory-based questions.\n"
+    "- For theoretical subjects like 'Biology', 'History', or 'Civics', focus on **conceptual understanding** but avoid vague or overly general questions.\n"
+    "- Do NOT repeat topics or give trivial questions.\n\n"
+    "Each question must include:\n"
+    "- 'question': the question string\n"
+    "- 'options': a list of 4 strings, each starting with a number and a period (e.g., '1. 32 cm')\n"
+    "- 'correct_option': the correct option number (1 to 4), not the text\n"
+    "- 'class', 'subject', 'chapter', 'topic', 'subtopic': included as metadata (subtopic can be null)\n\n"
+    "Your entire response must be in this format:\n"
+    "{ \"questions\": [ { \"class\": ..., \"subject\": ..., \"chapter\": ..., \"topic\": ..., \"subtopic\": ..., \"question\": ..., \"options\": [...], \"correct_option\": 1 }, ... ] }"
+)
+
+def group_selected_items(selected_data):
+    """Flattens prepared selection data into one list of topic/subtopic items per (class, subject)."""
+    grouped_targets = []
+    for class_key in sorted(selected_data.keys()):
+        for subject in sorted(selected_data[class_key].keys()):
+            flat_items = []
+            for chapter, content in selected_data[class_key][subject].items():
+                topics = content.get("topics", {})
+                for topic, subtopics in topics.items():
+                    if subtopics:
+                        for subtopic in subtopics:
+                            flat_items.append({
+                                "class": class_key,
+                                "subject": subject,
+                                "chapter": chapter,
+                                "topic": topic,
+                                "subtopic": subtopic
+                            })
+                    else:
+                        flat_items.append({
+                            "class": class_key,
+                            "subject": subject,
+                            "chapter": chapter,
+                            "topic": topic,
+                            "subtopic": None
+                        })
 
-    pdf.output(output_pdf)
+            if flat_items:
+                grouped_targets.append({
+                    "class": class_key,
+                    "subject": subject,
+                    "items": flat_items
+                })
+    return grouped_targets
+
+def build_mcq_prompt(task, class_key, subject, items):
+    user_prompt = {
+        "task": task,
+        "class": class_key,
+        "subject": subject,
+        "items": items
+    }
+    # MCQ_SYSTEM_PROMPT is sent separately as the shared system prefix
+    return json.dumps(user_prompt, indent=2)
 
-def generate_prerequisite_pdf(tree):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    margin_left = 30
-    margin_right = 30
-    margin_top = 40
-    margin_bottom = 40
-
-    y = height - margin_top
-    line_height = 22
-    max_indent = 80
-    sidebar_width = 5
-
-    background_colors = [colors.whitesmoke, colors.lightgrey]
-    sidebar_colors = [
-        colors.red, colors.orange, colors.green, 
-        colors.cadetblue, colors.purple, colors.brown, colors.teal
+def chunk_mcq_items(task, class_key, subject, items):
+    """
+    Splits a group's items into batches whose prompt plus expected output fits
+    the model context window. An item too large on its own gets its own batch.
+    """
+    budget = llm_client.context_budget(llm_client.context_tokens(GENERATION_MODEL))
+    base_tokens = (llm_client.estimate_tokens(MCQ_SYSTEM_PROMPT)
+                   + llm_client.estimate_tokens(build_mcq_prompt(task, class_key, subject, [])))
+
+    chunks = []
+    current, current_tokens = [], base_tokens
+    for item in items:
+        item_tokens = llm_client.estimate_tokens(json.dumps(item, indent=2)) + MCQ_OUTPUT_TOKENS_PER_ITEM
+        if current and (current_tokens + item_tokens > budget or len(current) >= MCQ_MAX_ITEMS_PER_CHUNK):
+            chunks.append(current)
+            current, current_tokens = [], base_tokens
+        current.append(item)
+        current_tokens += item_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def mcq_item_key(obj):
+    return tuple((obj.get(k) or "").strip().lower() for k in ("chapter", "topic", "subtopic"))
+
+def generate_mcq_chunk(task, class_key, subject, items):
+    """
+    Generates and verifies the MCQs for one batch of items using schema-constrained
+    output. Items whose question is missing or fails validation are re-requested on
+    their own, up to LLM_SCHEMA_RETRIES times.
+    Returns (questions in item order, items still without a question).
+    Raises if no valid question came back at all. When the request deadline
+    passes or the client disconnects, the questions accepted so far are kept.
+    """
+    accepted = {}
+    missing = list(range(len(items)))
+    last_error = "no response"
+
+    for attempt in range(LLM_SCHEMA_RETRIES + 1):
+        if not missing:
+            break
+        request_items = [items[i] for i in missing]
+        if attempt:
+            logger.info(f"Re-requesting {len(request_items)} invalid/missing MCQ item(s) for {class_key} > {subject}")
+
+        try:
+            output = llm_client.generate(
+                GENERATION_MODEL, build_mcq_prompt(task, class_key, subject, request_items), call_site="mcq",
+                system=MCQ_SYSTEM_PROMPT,
+                timeout=MCQ_TIMEOUT, format=mcq_group_schema(len(request_items))
+            )
+        except llm_client.LLMCancelled as e:
+            # Keep what earlier attempts produced; the request is out of time
+            last_error = str(e)
+            break
+        questions, report = salvage_objects(output, is_item=lambda o: "question" in o and "options" in o)
+        if report["mode"] == "salvaged":
+            logger.warning(
+                f"Salvaged {len(questions)} of {len(request_items)} questions for {class_key} > {subject} "
+                f"({report['unparseable']} unparseable, truncated={report['truncated']}, repairs={report['repairs']})"
+            )
+
+        valid = []
+        for q in questions:
+            errors = validate(q, MCQ_QUESTION_SCHEMA)
+            if errors:
+                last_error = errors[0]
+                logger.info(f"Dropping invalid MCQ for {class_key} > {subject}: {'; '.join(errors[:3])}")
+            else:
+                valid.append(q)
+        if not questions:
+            last_error = f"response contained no parseable questions (truncated={report['truncated']})"
+
+        # Match questions back to their items by metadata, falling back to
+        # position when the model rewrote the metadata but answered every item
+        by_key = defaultdict(list)
+        for q in valid:
+            by_key[mcq_item_key(q)].append(q)
+        unmatched_items = []
+        for i in missing:
+            matches = by_key.get(mcq_item_key(items[i]))
+            if matches:
+                accepted[i] = matches.pop(0)
+            else:
+                unmatched_items.append(i)
+        leftovers = [q for qs in by_key.values() for q in qs]
+        if leftovers and len(leftovers) == len(unmatched_items):
+            for i, q in zip(unmatched_items, leftovers):
+                accepted[i] = q
+            unmatched_items = []
+        missing = unmatched_items
+
+    if not accepted:
+        raise ValueError(last_error)
+
+    questions = []
+    for i in sorted(accepted):
+        q = accepted[i]
+        q.update(items[i])  # the requested item is the source of truth for metadata
+        verify_answer_with_models(q)
+        questions.append(q)
+    return questions, [items[i] for i in missing]
+
+def generate_mcqs_for_groups(grouped_targets, task):
+    """
+    Generates MCQs for every group, sending token-budgeted chunks to the model
+    in parallel. Failed chunks are retried on their own up to MCQ_CHUNK_RETRIES
+    times, unless the request has been cancelled or run out of time.
+    Returns the merged questions (in item order) and a list of failures.
+    """
+    chunks = []
+    for group in grouped_targets:
+        group_chunks = chunk_mcq_items(task, group["class"], group["subject"], group["items"])
+        if len(group_chunks) > 1:
+            logger.info(f"Split {group['class']} > {group['subject']} ({len(group['items'])} items) into {len(group_chunks)} chunks")
+        for items in group_chunks:
+            chunks.append({"class": group["class"], "subject": group["subject"], "items": items})
+
+    results = {}
+    partial = {}
+    errors = {}
+    pending = list(range(len(chunks)))
+    with ThreadPoolExecutor(max_workers=LLM_MAX_WORKERS) as executor:
+        for attempt in range(MCQ_CHUNK_RETRIES + 1):
+            if not pending or (attempt and request_deadline.incomplete_reason()):
+                break
+            if attempt:
+                logger.info(f"Retrying {len(pending)} failed MCQ chunk(s) (attempt {attempt + 1})")
+            futures = {
+                llm_client.submit(executor, generate_mcq_chunk, task, chunks[i]["class"], chunks[i]["subject"], chunks[i]["items"]): i
+                for i in pending
+            }
+            pending = []
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i], partial[i] = future.result()
+                    errors.pop(i, None)
+                except Exception as e:
+                    errors[i] = str(e)
+                    pending.append(i)
+                    print(f"❌ Error generating chunk {i + 1}/{len(chunks)} for {chunks[i]['class']} > {chunks[i]['subject']}: {e}")
+
+    all_questions = []
+    for i in range(len(chunks)):
+        all_questions.extend(results.get(i, []))
+
+    failures = [
+        {
+            "class": chunks[i]["class"],
+            "subject": chunks[i]["subject"],
+            "topics": [item["subtopic"] or item["topic"] for item in chunks[i]["items"]],
+            "error": errors[i]
+        }
+        for i in sorted(errors)
     ]
+    failures.extend(
+        {
+            "class": chunks[i]["class"],
+            "subject": chunks[i]["subject"],
+            "topics": [item["subtopic"] or item["topic"] for item in missing_items],
+            "error": request_deadline.incomplete_reason() or "no valid question after schema retries"
+        }
+        for i, missing_items in sorted(partial.items()) if missing_items
+    )
+    return all_questions, failures
 
-    line_counter = 0  # for background color alternation
+# ------------------------------- Prerequisite Discovery -------------------------------
 
-    def draw_text_block(text, level, font="Helvetica", font_size=11):
-        nonlocal y, line_counter
+class PrerequisiteOutputError(Exception):
+    """Raised when no attempt produced a usable prerequisite list for a chapter."""
 
-        if y < margin_bottom + line_height:
-            c.showPage()
-            y = height - margin_top
-            line_counter = 0  # reset background alternation
 
-        indent = min(level * 20, max_indent)
-        x_pos = margin_left + indent + sidebar_width + 5
+def parse_prerequisite_output(output, subject):
+    """
+    The items of `subject` in a prerequisites response ({"prerequisites": {subject: [...]}})
+    and the parse report. Only when that list is missing or the response does not parse are
+    intact item objects salvaged from anywhere in it, so items listed under another subject
+    are not taken for this one's.
+    """
+    parsed, report = parse_json_object(output)
+    by_subject = parsed.get("prerequisites") if parsed is not None else None
+    if isinstance(by_subject, dict) and isinstance(by_subject.get(subject), list):
+        return by_subject[subject], report
+    return salvage_objects(output, is_item=lambda o: "number" in o and "chapter" in o)
 
-        # Draw background band
-        bg_color = background_colors[line_counter % 2]
-        c.setFillColor(bg_color)
-        c.rect(margin_left, y - line_height + 4, width - margin_left - margin_right, line_height, fill=1, stroke=0)
+def request_prerequisites(subject, chapter_name, prompt):
+    """
+    Asks the model for the prerequisites of one chapter with schema-constrained
+    output and returns the items that pass validation. The prompt is re-sent (up
+    to LLM_SCHEMA_RETRIES times) only when nothing valid came back and the
+    response was unparseable or contained invalid items. Raises
+    PrerequisiteOutputError when every attempt failed that way, so that a failure
+    is not mistaken for a chapter without prerequisites.
+    """
+    for attempt in range(LLM_SCHEMA_RETRIES + 1):
+        output = llm_client.generate(
+            GENERATION_MODEL, prompt, call_site="prereq", timeout=PREREQ_TIMEOUT,
+            system=PREREQ_SYSTEM_PROMPT, format=prereq_list_schema(subject)
+        )
+        print("📥 Ollama Output:\n", output[:300])
+        prereqs, report = parse_prerequisite_output(output, subject)
+        valid = [req for req in prereqs if not validate(req, PREREQ_ITEM_SCHEMA)]
+        dropped = len(prereqs) - len(valid)
+        if report["mode"] != "full" or dropped:
+            print(f"⚠️ Prerequisite output for {subject} - {chapter_name} was malformed: "
+                  f"{len(valid)} valid, {dropped} invalid, mode={report['mode']}")
+        # An empty, well-formed list is a legitimate "no prerequisites" answer
+        if valid or (report["mode"] != "failed" and not dropped):
+            return valid
+    raise PrerequisiteOutputError(
+        f"no valid prerequisite list for {subject} - {chapter_name} after {LLM_SCHEMA_RETRIES + 1} attempt(s)"
+    )
+
+def chapter_prerequisite_items(subject, chapter_name, chapter_index_map, previous_year_data, current_syllabus=None):
+    """
+    Asks for one chapter's prerequisites and turns them into render items.
+    Only the PREREQ_SHORTLIST_K previous-year chapters that best match the
+    chapter lexically (its title, and its topics and subtopics when the chapter
+    is found in `current_syllabus`, the chapter lists it comes from) are
+    listed in the prompt.
+    """
+    full_chapter_list = previous_year_data.get(subject, [])
+    selected = next((ch for ch in (current_syllabus or {}).get(subject, []) if ch.get("chapter") == chapter_name),
+                    {"chapter": chapter_name})
+    shortlist = {ch.get("number") for ch in shortlist_chapters(selected, full_chapter_list, PREREQ_SHORTLIST_K)}
+    subject_index = chapter_index_map.get(subject, {})
+    candidates = {number: name for number, name in subject_index.items() if number in shortlist}
+    if len(candidates) < len(full_chapter_list):
+        print(f"🔎 Shortlisted {len(candidates)}/{len(full_chapter_list)} previous-year chapters for {subject} - {chapter_name}")
+
+    prompt = build_prereq_prompt(subject, chapter_name, candidates, shared_list=len(candidates) == len(subject_index))
+    prereqs = request_prerequisites(subject, chapter_name, prompt)
+    return prereq_render_items(subject, chapter_name, prereqs, full_chapter_list)
+
+def store_backed_prerequisite_items(board, chapter_class, subject, chapter_name, chapter_index_map, previous_year_data,
+                                    current_syllabus=None):
+    """
+    Prerequisites of one chapter of class `chapter_class` from the shared
+    knowledge graph if anyone analysed it before; otherwise asks the model and
+    stores the answer. A chapter whose request failed raises (see
+    request_prerequisites) and is not recorded, so it is asked again next time.
+    """
+    stored = prereq_store.lookup(board, chapter_class, [(subject, chapter_name)])
+    if stored:
+        print(f"📚 Prerequisites of {subject} - {chapter_name} found in the knowledge graph")
+        return prereq_render_items(subject, chapter_name, stored[(subject, chapter_name)], previous_year_data.get(subject, []))
 
-        # Draw left color sidebar
-        sidebar_color = sidebar_colors[level % len(sidebar_colors)]
-        c.setFillColor(sidebar_color)
-        c.rect(margin_left, y - line_height + 4, sidebar_width, line_height, fill=1, stroke=0)
+    items = chapter_prerequisite_items(subject, chapter_name, chapter_index_map, previous_year_data, current_syllabus)
+    prereq_store.record(board, chapter_class, subject, chapter_name, items, provenance=f"llm:{GENERATION_MODEL}")
+    return items
 
-        # Draw text
-        c.setFillColor(colors.black)
-        c.setFont(font, font_size)
-        c.drawString(x_pos, y, text)
+def prerequisite_discoverer(board, class_name, level, current_syllabus=None):
+    """
+    discover(subject, chapter, chapter_index_map, previous_year_data) for the chapters
+    `level - 1` classes below class_name, whose chapter lists are `current_syllabus`.
+    """
+    if not PREREQ_STORE:
+        return functools.partial(chapter_prerequisite_items, current_syllabus=current_syllabus)
+    return functools.partial(store_backed_prerequisite_items, board, int(class_name) - level + 1,
+                             current_syllabus=current_syllabus)
 
-        y -= line_height
-        line_counter += 1
+def confirm_selected_prerequisites(board, class_name, level, selected_items):
+    """
+    Raises the confidence of the stored edges behind the render items of level
+    `level - 1` the teacher selected. Edges are keyed on the chapter the
+    prerequisites were requested for ("prereq_of"), not the model's "for" text.
+    """
+    if not PREREQ_STORE:
+        return
+    chapter_class = int(class_name) - level + 2
+    for item in selected_items:
+        if item.get("prereq_of"):
+            prereq_store.confirm(board, chapter_class, item["subject"], item["prereq_of"], item["chapter"])
+
+def prereq_render_items(subject, chapter_name, prereqs, full_chapter_list):
+    """Turns suggested prerequisites ({"number", "reason", "for"}) into render items for recursive_prereq.html."""
+    items = []
+    for req in prereqs:
+        chapter_num = req.get("number")
+        matched_ch = next((c for c in full_chapter_list if c.get("number") == chapter_num), None)
+        if matched_ch:
+            new_item = {
+                "id": str(uuid.uuid4()),
+                "subject": subject,
+                "number": chapter_num,
+                "chapter": matched_ch.get("chapter", ""),
+                "topics": matched_ch.get("topics", []),
+                "reason": req.get("reason", ""),
+                "for": req.get("for", chapter_name),
+                "prereq_of": chapter_name
+            }
+            print("📘 Adding render item:", new_item)
+            items.append(new_item)
+    return items
 
-    def draw_chapters(chapters, level=0):
-        for chapter in chapters:
-            chapter_text = f"{chapter['chapter']} (Chapter {chapter['number']}, {chapter['class']})"
-            draw_text_block(chapter_text, level, font="Helvetica-Bold", font_size=12)
+def local_prerequisite_items(subject, chapter_name, current_syllabus, previous_year_data):
+    """
+    LLM-free prerequisites for one chapter, scored from the curriculum
+    structure (see prereq_ranking.suggest_prerequisites). `current_syllabus`
+    holds the chapter lists the selected chapters come from; a chapter that is
+    not part of `subject` there gets no suggestions from that subject's
+    previous-year book.
+    """
+    subject_chapters = current_syllabus.get(subject, [])
+    selected = next((ch for ch in subject_chapters if ch.get("chapter") == chapter_name), None)
+    if selected is None:
+        return []
+    full_chapter_list = previous_year_data.get(subject, [])
+    prereqs = suggest_prerequisites(selected, len(subject_chapters), full_chapter_list, PREREQ_LOCAL_MAX_ITEMS)
+    return prereq_render_items(subject, chapter_name, prereqs, full_chapter_list)
 
-            if "reason" in chapter:
-                reason_text = f"Reason: {chapter['reason']}"
-                draw_text_block(reason_text, level + 1, font="Helvetica-Oblique", font_size=10)
+PREREQ_ENGINES = ("llm", "local")
 
-            if chapter.get("prerequisites"):
-                draw_chapters(chapter["prerequisites"], level + 1)
+def selected_prereq_engine():
+    """Prerequisite engine for this request: the `prereq_engine` field, else the session's choice, else PREREQ_ENGINE."""
+    engine = request.values.get("prereq_engine") or session.get("prereq_engine") or PREREQ_ENGINE
+    return engine if engine in PREREQ_ENGINES else "llm"
 
-    for class_key, subjects in tree.items():
-        for subject, chapters in subjects.items():
-            heading_text = f"{subject} - {class_key}"
-            draw_text_block(heading_text, 0, font="Helvetica-Bold", font_size=14)
-            draw_chapters(chapters, level=1)
-            y -= line_height // 2  # small space between subjects
+def load_syllabus_level(board, class_name, subjects, level):
+    """Chapter lists of the class `level` years below `class_name`; level 0 is the selected class itself."""
+    if level > 0:
+        return load_previous_year_level(board, class_name, subjects, level)
+    chapters_data_path = os.path.join("structured_data", "list_of_all_chapters_for_selected_class.json")
+    if os.path.exists(chapters_data_path):
+        with open(chapters_data_path, "r") as f:
+            return json.load(f)
+    return {}
 
-    c.save()
-    buffer.seek(0)
-    return buffer
+def discover_prerequisites(prereq_jobs, chapter_index_map, previous_year_data, precomputed=None,
+                           discover=chapter_prerequisite_items):
+    """
+    Runs prerequisite discovery for every (subject, chapter) job on a bounded
+    pool of LLM_MAX_WORKERS threads; jobs found in `precomputed` (from the
+    background prerequisite graph) are not prompted again. Render items are
+    merged in job order, so the result does not depend on which call finishes
+    first, and a failing chapter only loses its own items. Each chapter gets an
+    equal share of the time left on the request deadline for the waves of
+    calls still to run.
+    Returns (render_items, skipped chapters as "subject - chapter").
+    """
+    precomputed = precomputed or {}
+    results = {i: precomputed[job] for i, job in enumerate(prereq_jobs) if job in precomputed}
+    to_run = [i for i in range(len(prereq_jobs)) if i not in results]
+    workers = max(min(LLM_MAX_WORKERS, len(to_run)), 1)
+    started = itertools.count()
+
+    def run(subject, chapter_name):
+        if request_deadline.incomplete_reason():
+            raise llm_client.LLMCancelled(request_deadline.incomplete_reason())
+        waves_left = math.ceil((len(to_run) - next(started)) / workers)
+        with request_deadline.share(waves_left):
+            return discover(subject, chapter_name, chapter_index_map, previous_year_data)
+
+    skipped_chapters = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            llm_client.submit(executor, run, *prereq_jobs[i]): i
+            for i in to_run
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            subject, chapter_name = prereq_jobs[i]
+            try:
+                results[i] = future.result()
+            except llm_client.LLMCancelled as e:
+                print(f"⏱️ Stopped {subject} - {chapter_name}: {e}")
+                skipped_chapters.append(i)
+            except Exception as e:
+                print(f"❌ Error for {subject} - {chapter_name}: {e}")
+
+    render_items = [item for i in sorted(results) for item in results[i]]
+    return render_items, [" - ".join(prereq_jobs[i]) for i in sorted(skipped_chapters)]
 
 def inject_reasons_into_selected_data(selected_data, level):
     render_path = os.path.join("structured_data", f"prereq_render_items_level_{level}.json")
@@ -1068,89 +1256,6 @@ def inject_reasons_into_selected_data(selected_data, level):
                     chapter["reason"] = enrichment.get("reason")
                     chapter["for"] = enrichment.get("for")
 
-def generate_study_material_pdf(study_material, output_pdf):
-    try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        font_path = os.path.join("fonts", "DejaVuSans.ttf")
-        bold_font_path = os.path.join("fonts", "DejaVuSans-Bold.ttf")
-        italic_font_path = os.path.join("fonts", "DejaVuSans-Oblique.ttf")
-
-        # Register regular font
-        if not os.path.exists(font_path):
-            logger.warning(f"Font file not found at {font_path}. Falling back to Helvetica.")
-            pdf.set_font("Helvetica", size=12)
-            use_helvetica = True
-        else:
-            pdf.add_font("DejaVu", "", font_path, uni=True)
-            pdf.set_font("DejaVu", size=12)
-            use_helvetica = False
-
-        # Register bold font if available
-        if os.path.exists(bold_font_path):
-            pdf.add_font("DejaVu", "B", bold_font_path, uni=True)
-            has_bold = True
-        else:
-            logger.warning(f"Bold font file not found at {bold_font_path}. Using regular font for bold text.")
-            has_bold = False
-
-        # Register italic font if available
-        if os.path.exists(italic_font_path):
-            pdf.add_font("DejaVu", "I", italic_font_path, uni=True)
-            has_italic = True
-        else:
-            logger.warning(f"Italic font file not found at {italic_font_path}. Using regular font for italic text.")
-            has_italic = False
-
-        # Title
-        if use_helvetica:
-            pdf.set_font("Helvetica", size=14, style="B" if has_bold else "")
-        else:
-            pdf.set_font("DejaVu", size=14, style="B" if has_bold else "")
-        pdf.cell(200, 10, txt="Study Material", ln=1, align='C')
-        pdf.ln(5)
-
-        for subject_data in study_material:
-            # Subject heading
-            if use_helvetica:
-                pdf.set_font("Helvetica", size=14, style="B" if has_bold else "")
-            else:
-                pdf.set_font("DejaVu", size=14, style="B" if has_bold else "")
-            pdf.cell(200, 10, txt=f"Subject: {subject_data['subject']}", ln=1)
-            pdf.ln(2)
-
-            for chapter_data in subject_data['chapters']:
-                # Chapter heading
-                if use_helvetica:
-                    pdf.set_font("Helvetica", size=12, style="B" if has_bold else "")
-                else:
-                    pdf.set_font("DejaVu", size=12, style="B" if has_bold else "")
-                pdf.cell(200, 10, txt=f"Chapter {chapter_data['number']}: {chapter_data['chapter']}", ln=1)
-                pdf.ln(2)
-
-                for content_type, content in chapter_data['content'].items():
-                    if content:
-                        # Content type
-                        if use_helvetica:
-                            pdf.set_font("Helvetica", size=11, style="I" if has_italic else "")
-                        else:
-                            pdf.set_font("DejaVu", size=11, style="I" if has_italic else "")
-                        pdf.cell(200, 10, txt=content_type, ln=1)
-                        # Content text
-                        if use_helvetica:
-                            pdf.set_font("Helvetica", size=10)
-                        else:
-                            pdf.set_font("DejaVu", size=10)
-                        pdf.multi_cell(0, 8, txt=content)
-                        pdf.ln(2)
-                pdf.ln(4)
-
-        pdf.output(output_pdf)
-        logger.info(f"PDF generated successfully at {output_pdf}")
-    except Exception as e:
-        logger.error(f"Error generating PDF: {str(e)}")
-        raise
 # ------------------------------- Routes ----------------------------------
 
 # 1. Home route to display textbooks (index.html)
@@ -1320,6 +1425,7 @@ def select():
                            class_name=class_name,
                            subjects=subjects,
                            subject_chapter_map=subject_chapter_map,
+                           prereq_engine=selected_prereq_engine(),
                            errors=errors)  # Pass errors to template
 
 # 2.1 Route to handle topic selection for direct question generation (show_selected_chapters.html)
@@ -1485,102 +1591,25 @@ def generate_questions_from_direct():
     except FileNotFoundError:
         return "Error: prepared_selected_data_direct.json not found."
 
-    all_questions = []
-    grouped_targets = []
-
-    for class_key in sorted(selected_data.keys()):
-        for subject in sorted(selected_data[class_key].keys()):
-            flat_items = []
-            for chapter, content in selected_data[class_key][subject].items():
-                topics = content.get("topics", {})
-                for topic, subtopics in topics.items():
-                    if subtopics:
-                        for subtopic in subtopics:
-                            flat_items.append({
-                                "class": class_key,
-                                "subject": subject,
-                                "chapter": chapter,
-                                "topic": topic,
-                                "subtopic": subtopic
-                            })
-                    else:
-                        flat_items.append({
-                            "class": class_key,
-                            "subject": subject,
-                            "chapter": chapter,
-                            "topic": topic,
-                            "subtopic": None
-                        })
-
-            if flat_items:
-                grouped_targets.append({
-                    "class": class_key,
-                    "subject": subject,
-                    "items": flat_items
-                })
-
-    system_prompt = (
-        "You are a JSON-only AI. Return strictly valid JSON only. Do NOT include explanations or natural language.\n\n"
-        "You are tasked with creating 1 high-quality multiple choice question per topic or subtopic, considering the following:\n"
-        "- The question must reflect the difficulty and knowledge level appropriate for the given class (grade level).\n"
-        "- Use the chapter name as the primary context.\n"
-        "- For subjects like 'Mathematics', ensure questions are **numerical, formula-based, or calculation-oriented**. Avoid generic or theory-based questions.\n"
-        "- For theoretical subjects like 'Biology', 'History', or 'Civics', focus on **conceptual understanding** but avoid vague or overly general questions.\n"
-        "- Do NOT repeat topics or give trivial questions.\n\n"
-        "Each question must include:\n"
-        "- 'question': the question string\n"
-        "- 'options': a list of 4 strings, each starting with a number and a period (e.g., '1. 32 cm')\n"
-        "- 'correct_option': the correct option number (1 to 4), not the text\n"
-        "- 'class', 'subject', 'chapter', 'topic', 'subtopic': included as metadata (subtopic can be null)\n\n"
-        "Your entire response must be in this format:\n"
-        "{ \"questions\": [ { \"class\": ..., \"subject\": ..., \"chapter\": ..., \"topic\": ..., \"subtopic\": ..., \"question\": ..., \"options\": [...], \"correct_option\": 1 }, ... ] }"
+    grouped_targets = group_selected_items(selected_data)
+    all_questions, generation_failures = generate_mcqs_for_groups(
+        grouped_targets, "Generate 1 MCQ per topic/subtopic using class difficulty and chapter context"
     )
 
-    for group in grouped_targets:
-        class_key = group["class"]
-        subject = group["subject"]
-        items = group["items"]
-
-        user_prompt = {
-            "task": "Generate 1 MCQ per topic/subtopic using class difficulty and chapter context",
-            "class": class_key,
-            "subject": subject,
-            "items": items
-        }
-
-        full_prompt = f"{system_prompt}\n\n---\n\n{json.dumps(user_prompt, indent=2)}"
-
-        try:
-            result = subprocess.run(
-                ["ollama", "run", "llama3"],
-                input=full_prompt,
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-            output = result.stdout.strip()
-            json_start = output.find("{")
-            json_end = output.rfind("}") + 1
-            if json_start != -1 and json_end != -1:
-                output_json = json.loads(output[json_start:json_end])
-                questions = output_json.get("questions", [])
-                for q in questions:
-                    verify_answer_with_models(q)
-                all_questions.extend(questions)
-        except Exception as e:
-            print(f"❌ Error generating for {class_key} > {subject}: {e}")
-
     if not all_questions:
-        return "Error: No questions generated."
+        details = "; ".join(f"{f['class']} > {f['subject']}: {f['error']}" for f in generation_failures)
+        return f"Error: No questions generated. {details}".strip()
 
     final_output = {"questions": all_questions}
 
     with open("paper.json", "w") as f:
         json.dump(final_output, f, indent=2)
+    # The PDF is rendered when it is downloaded
+    session["show_metadata"] = show_metadata
 
-    generate_pdf(final_output, "Question.pdf", show_metadata)
-
-    return render_template("review_questions.html", questions=final_output["questions"])
+    return render_template("review_questions.html", questions=final_output["questions"],
+                           generation_failures=generation_failures,
+                           incomplete=request_deadline.incomplete_reason())
 
 # 2.2 Route to handle selected chapters for prerequisite selection (recursive_prereq.html)
 @app.route('/generate', methods=['POST'])
@@ -1624,9 +1653,42 @@ def generate():
         "subjects": subjects,
         "chapters": chapters
     }
+    session["prereq_engine"] = selected_prereq_engine()
+    # Opt-in: compute the whole candidate prerequisite graph in the background so that
+    # each /recursive_prereq level only has to look up what is already known. The local
+    # engine makes no model calls, so it gets no crawl (and a previous one is stopped)
+    if not (PREREQ_GRAPH_PRECOMPUTE and PREREQ_GRAPH_DEPTH >= 1 and session["prereq_engine"] == "llm"):
+        previous = prereq_graph.get_job(session.pop("prereq_graph_id", None))
+        if previous is not None:
+            previous.cancel()
+    else:
+        top_chapters = [
+            ch.get("chapter")
+            for chapter_list in selected_structure[f"class_{class_name}"].values()
+            for ch in chapter_list
+        ]
+        graph = prereq_graph.start_job(
+            subjects, top_chapters, PREREQ_GRAPH_DEPTH,
+            fetch_level=lambda level: load_syllabus_level(board, class_name, subjects, level),
+            discover=lambda level, current_syllabus, *args: prerequisite_discoverer(
+                board, class_name, level, current_syllabus)(*args),
+            workers=LLM_MAX_WORKERS,
+            deadline_seconds=PREREQ_GRAPH_DEADLINE,
+            replaces=session.get("prereq_graph_id"),
+        )
+        session["prereq_graph_id"] = graph.id
+
     # Redirect to recursive prerequisite route (start at level 1)
     return redirect(url_for("recursive_prereq", level=1))
 
+# Progress of the background prerequisite graph for this session
+@app.route('/prereq_graph_status')
+def prereq_graph_status():
+    graph = prereq_graph.get_job(session.get("prereq_graph_id"))
+    if graph is None:
+        return jsonify({"status": "none"}), 404
+    return jsonify(graph.summary())
+
 # 2.2.1 Route to handle recursive prerequisite selection (recursive_prereq.html)
 @app.route('/recursive_prereq/<int:level>', methods=['GET', 'POST'])
 def recursive_prereq(level):
@@ -1673,6 +1735,7 @@ def recursive_prereq(level):
 
             id_map = {item["id"]: item for item in render_items}
             selected_items = [id_map[i] for i in selected_ids if i in id_map]
+            confirm_selected_prerequisites(board, class_name, level, selected_items)
 
             if os.path.exists(selected_structure_path):
                 with open(selected_structure_path, "r") as f:
@@ -1818,98 +1881,46 @@ def recursive_prereq(level):
             selected_topics = []
             selected_subtopics = []
 
-    prev_year_struct_path = f"structured_data/previous_year_depth_{level}.json"
-    if os.path.exists(prev_year_struct_path):
-        with open(prev_year_struct_path, "r") as f:
-            previous_year_data = json.load(f)
-    else:
-        previous_year_data = fetch_structured_previous_year_content(
-            board, starting_class = class_name, current_class = str(int(class_name) - level), starting_subjects = subjects, depth=level, max_depth=5
-        )
+    previous_year_data = load_previous_year_level(board, class_name, subjects, level)
 
     chapter_index_map = {
         subject: {ch['number']: ch['chapter'] for ch in chapters}
         for subject, chapters in previous_year_data.items()
     }
 
-    render_items = []
-
-    for subject in subjects:
-        relevant_chapters = [{"chapter": name} for name in selected_chapters]
+    prereq_jobs = [
+        (subject, chapter_name)
+        for subject in subjects
+        for chapter_name in dict.fromkeys(selected_chapters)
+        if chapter_name
+    ]
 
-        prompted_chapters = set()
-        for ch in relevant_chapters:
-            chapter_name = ch.get("chapter")
-            if not chapter_name or (subject, chapter_name) in prompted_chapters:
-                continue
-            prompted_chapters.add((subject, chapter_name))
-
-            prompt = f"""
-    You are an academic AI assistant helping to identify prerequisite chapters.
-
-    Context:
-    - The user has selected a specific chapter from a current year's syllabus.
-    - You are also given the chapter list from the previous year's syllabus for the same subject and board.
-
-    Instructions:
-    1. Identify only those prerequisite chapters that are clearly and directly related.
-    2. Avoid abstract or general background prerequisites.
-    3. All suggested prerequisites must come from the previous year's chapter list.
-
-    Output Format:
-    {{
-    "prerequisites": {{
-        "{subject}": [
-        {{
-            "number": 1,
-            "chapter": "Exact Chapter Name",
-            "reason": "Why this chapter is needed",
-            "for": "{chapter_name}"
-        }}
+    engine = selected_prereq_engine()
+    session["prereq_engine"] = engine
+    graph = prereq_graph.get_job(session.get("prereq_graph_id"))
+    # Chapter lists the selected chapters come from (their topics shape the shortlist and local scores)
+    current_syllabus = load_syllabus_level(board, class_name, subjects, level - 1)
+
+    if engine == "local":
+        # Scored from the curriculum structure alone; no model calls
+        render_items = [
+            item
+            for subject, chapter_name in prereq_jobs
+            for item in local_prerequisite_items(subject, chapter_name, current_syllabus, previous_year_data)
         ]
-    }}
-    }}
-
-    Selected Chapter:
-    {json.dumps([{"chapter": chapter_name}], indent=2)}
-
-    Previous Year Chapters:
-    {json.dumps(chapter_index_map.get(subject, {}), indent=2)}
-    """
-            try:
-                result = subprocess.run(
-                    ["ollama", "run", "llama3"],
-                    input=prompt,
-                    capture_output=True,
-                    text=True,
-                    timeout=1000000
-                )
-                output = result.stdout.strip()
-                print("📥 Ollama Output:\n", output[:300])
-                prereq_json = json.loads(output[output.find("{"):output.rfind("}") + 1]) if output else {}
-
-                prereqs = prereq_json.get("prerequisites", {}).get(subject, [])
-                full_chapter_list = previous_year_data.get(subject, [])
-
-                for req in prereqs:
-                    chapter_num = req.get("number")
-                    matched_ch = next((c for c in full_chapter_list if c.get("number") == chapter_num), None)
-                    if matched_ch:
-                        new_item = {
-                            "id": str(uuid.uuid4()),
-                            "subject": subject,
-                            "number": chapter_num,
-                            "chapter": matched_ch.get("chapter", ""),
-                            "topics": matched_ch.get("topics", []),
-                            "reason": req.get("reason", ""),
-                            "for": req.get("for", chapter_name)
-                        }
-                        print("📘 Adding render item:", new_item)
-                        render_items.append(new_item)
-
-            except Exception as e:
-                print(f"❌ Error for {subject} - {chapter_name}: {e}")
-                continue
+        skipped_chapters = []
+        print(f"⚡ Local prerequisite engine suggested {len(render_items)} chapter(s) for {len(prereq_jobs)} job(s) at level {level}")
+    else:
+        # Chapters the background graph has already analysed are looked up instead of re-prompted
+        precomputed = graph.lookup(level, prereq_jobs) if graph else {}
+        if precomputed:
+            print(f"🗺️ Using the precomputed prerequisite graph for {len(precomputed)}/{len(prereq_jobs)} chapter(s) at level {level}")
+
+        # The rest is read from the shared knowledge graph or, failing that, asked of the model
+        render_items, skipped_chapters = discover_prerequisites(
+            prereq_jobs, chapter_index_map, previous_year_data, precomputed=precomputed,
+            discover=prerequisite_discoverer(board, class_name, level, current_syllabus)
+        )
 
     with open(os.path.join("structured_data", f"prereq_render_items_level_{level}.json"), "w") as f:
         json.dump(render_items, f, indent=2)
@@ -1946,6 +1957,7 @@ def recursive_prereq(level):
         id_map = {item["id"]: item for item in render_items}
         selected_items = [id_map[i] for i in selected_ids if i in id_map]
         print("✅ Matched selected_items:", selected_items)
+        confirm_selected_prerequisites(board, class_name, level, selected_items)
 
         for item in selected_items:
             subject = item["subject"]
@@ -1996,7 +2008,11 @@ def recursive_prereq(level):
     else:
         next_render_items = []
 
-    return render_template("recursive_prereq.html", prerequisites=next_render_items, level=level + 1, class_name=(int(class_name) - level))
+    return render_template("recursive_prereq.html", prerequisites=next_render_items, level=level + 1, class_name=(int(class_name) - level),
+                           incomplete=request_deadline.incomplete_reason() or (request_deadline.DEADLINE_EXCEEDED if skipped_chapters else None),
+                           skipped_chapters=skipped_chapters,
+                           graph_status=graph.summary() if graph else None,
+                           prereq_engine=engine)
 
 # 2.2.2 Route to prepare selected data for question generation (next_step.html)
 @app.route('/prepare_selected_data', methods=['POST'])
@@ -2059,13 +2075,9 @@ def download_prereqs():
     except FileNotFoundError:
         return "Prerequisite tree not found", 404
 
-    pdf_buffer = generate_prerequisite_pdf(tree)
-    return send_file(
-        pdf_buffer,
-        as_attachment=True,
-        download_name="Prerequisite_Tree.pdf",
-        mimetype="application/pdf"
-    )
+    # Rendered once per distinct tree and streamed from disk; repeat downloads get a 304
+    pdf_path, pdf_key = cached_prerequisite_pdf(tree)
+    return pdf_cache.send_pdf(pdf_path, pdf_key, "Prerequisite_Tree.pdf")
 
 # 2.2.2.2 Route to generate questions based on selected data (result.html)
 @app.route('/generate_questions')
@@ -2078,109 +2090,25 @@ def generate_questions():
     except FileNotFoundError:
         return "Error: prepared_selected_data.json not found."
 
-    all_questions = []
-    grouped_targets = []
-
-    for class_key in sorted(selected_data.keys()):
-        for subject in sorted(selected_data[class_key].keys()):
-            flat_items = []
-            chapters = selected_data[class_key][subject]
-
-            for chapter, content in chapters.items():
-                topics = content.get("topics", {})
-                for topic, subtopics in topics.items():
-                    if subtopics:
-                        for subtopic in subtopics:
-                            flat_items.append({
-                                "class": class_key,
-                                "subject": subject,
-                                "chapter": chapter,
-                                "topic": topic,
-                                "subtopic": subtopic
-                            })
-                    else:
-                        flat_items.append({
-                            "class": class_key,
-                            "subject": subject,
-                            "chapter": chapter,
-                            "topic": topic,
-                            "subtopic": None
-                        })
-
-            if flat_items:
-                grouped_targets.append({
-                    "class": class_key,
-                    "subject": subject,
-                    "items": flat_items
-                })
-
-    system_prompt = (
-        "You are a JSON-only AI. Return strictly valid JSON only. Do NOT include explanations or natural language.\n\n"
-        "You are tasked with creating 1 high-quality multiple choice question per topic or subtopic, considering the following:\n"
-        "- The question must reflect the difficulty and knowledge level appropriate for the given class (grade level).\n"
-        "- Use the chapter name as the primary context.\n"
-        "- For subjects like 'Mathematics', ensure questions are **numerical, formula-based, or calculation-oriented**. Avoid generic or theory-based questions.\n"
-        "- For theoretical subjects like 'Biology', 'History', or 'Civics', focus on **conceptual understanding** but avoid vague or overly general questions.\n"
-        "- Do NOT repeat topics or give trivial questions.\n\n"
-        "Each question must include:\n"
-        "- 'question': the question string\n"
-        "- 'options': a list of 4 strings, each starting with a number and a period (e.g., '1. 32 cm')\n"
-        "- 'correct_option': the correct option number (1 to 4), not the text\n"
-        "- 'class', 'subject', 'chapter', 'topic', 'subtopic': included as metadata (subtopic can be null)\n\n"
-        "Your entire response must be in this format:\n"
-        "{ \"questions\": [ { \"class\": ..., \"subject\": ..., \"chapter\": ..., \"topic\": ..., \"subtopic\": ..., \"question\": ..., \"options\": [...], \"correct_option\": 1 }, ... ] }"
+    grouped_targets = group_selected_items(selected_data)
+    all_questions, generation_failures = generate_mcqs_for_groups(
+        grouped_targets, "Generate 1 MCQ per topic/subtopic using class and chapter context"
     )
 
-
-    for group in grouped_targets:
-        class_key = group["class"]
-        subject = group["subject"]
-        items = group["items"]
-
-        user_prompt = {
-            "task": "Generate 1 MCQ per topic/subtopic using class and chapter context",
-            "class": class_key,
-            "subject": subject,
-            "items": items
-        }
-
-        full_prompt = f"{system_prompt}\n\n---\n\n{json.dumps(user_prompt, indent=2)}"
-
-        try:
-            result = subprocess.run(
-                ["ollama", "run", "llama3"],
-                input=full_prompt,
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
-
-            output = result.stdout.strip()
-            json_start = output.find("{")
-            json_end = output.rfind("}") + 1
-            if json_start != -1 and json_end != -1:
-                output_json = json.loads(output[json_start:json_end])
-                questions = output_json.get("questions", [])
-                for q in questions:
-                    verify_answer_with_models(q)
-                all_questions.extend(questions)
-            else:
-                print(f"⚠️ Warning: Invalid JSON returned for {class_key} > {subject}")
-
-        except Exception as e:
-            print(f"❌ Error generating for {class_key} > {subject}: {e}")
-
     if not all_questions:
-        return "Error: No questions generated."
+        details = "; ".join(f"{f['class']} > {f['subject']}: {f['error']}" for f in generation_failures)
+        return f"Error: No questions generated. {details}".strip()
 
     final_output = {"questions": all_questions}
 
     with open("paper.json", "w") as f:
         json.dump(final_output, f, indent=2)
+    # The PDF is rendered when it is downloaded
+    session["show_metadata"] = show_metadata
 
-    generate_pdf(final_output, "Question.pdf", show_metadata)
-
-    return render_template("review_questions.html", questions=final_output["questions"])
+    return render_template("review_questions.html", questions=final_output["questions"],
+                           generation_failures=generation_failures,
+                           incomplete=request_deadline.incomplete_reason())
 
 # 2.3 Route to review and finalize questions (review_questions.html)
 @app.route('/finalize_questions', methods=['POST'])
@@ -2199,8 +2127,7 @@ def finalize_questions():
     with open("paper.json", "w") as f:
         json.dump(final_output, f, indent=2)
 
-    show_metadata = True  # Optional: You can use a hidden input to let the user decide this too
-    generate_pdf(final_output, "Question.pdf", show_metadata)
+    session["show_metadata"] = True  # Optional: You can use a hidden input to let the user decide this too
 
     return render_template("result.html", paper_json=final_output, pdf_code="PDF generated successfully.")
 
@@ -2212,12 +2139,67 @@ def download_pdf():
             paper_json = json.load(f)
         if not paper_json.get("questions"):
             return "Error: No questions available."
-        if not os.path.exists("Question.pdf"):
-            generate_pdf(paper_json, "Question.pdf")
-        return send_file("Question.pdf", as_attachment=True)
+        # Rendered on first download of this paper and flag, then served from the PDF cache
+        pdf_path, pdf_key = cached_paper_pdf(paper_json, session.get("show_metadata", True))
+        return pdf_cache.send_pdf(pdf_path, pdf_key, "Question.pdf")
     except Exception as e:
         return f"Error: {str(e)}"
 
+# Question paper, answer key, CSV and OMR sheet of the finalized paper, streamed as one zip (result.html)
+@app.route('/download_bundle')
+def download_bundle():
+    try:
+        with open("paper.json", "r") as f:
+            paper_json = json.load(f)
+    except FileNotFoundError:
+        return "Error: Question data not found.", 404
+    problem = exam_bundle.check_bundle(paper_json)
+    if problem:
+        return f"Error: {problem}", 400
+
+    # The status is sent with the first chunk, so a failure after it can only cut the zip short
+    return Response(
+        stream_with_context(exam_bundle.stream_bundle(paper_json, session.get("show_metadata", True))),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=Exam_Bundle.zip"},
+    )
+
+# Shuffled sets of the finalized paper with answer keys, as one zip (result.html)
+@app.route('/download_variants', methods=['POST'])
+def download_variants():
+    try:
+        with open("paper.json", "r") as f:
+            paper_json = json.load(f)
+    except FileNotFoundError:
+        return "Error: Question data not found.", 404
+
+    # One variant per line/comma of "labels" (e.g. roll numbers), otherwise sets A, B, C, ...
+    labels = [l.strip() for l in re.split(r'[,\n]', request.form.get("labels", "")) if l.strip()]
+    try:
+        if not labels:
+            labels = paper_variants.variant_labels(int(request.form.get("sets") or 4))
+        seed = request.form.get("seed", "").strip()
+        seed = int(seed) if seed else None
+    except ValueError:
+        return "Error: The number of sets and the seed must be whole numbers.", 400
+    if not 1 <= len(labels) <= PAPER_VARIANT_MAX:
+        return f"Error: Between 1 and {PAPER_VARIANT_MAX} variants can be generated at once.", 400
+
+    buffer = io.BytesIO()
+    try:
+        paper_variants.build_variant_archive(
+            paper_json, labels, buffer, seed=seed,
+            show_metadata=request.form.get("show_metadata") == "on",
+            shuffle_options=request.form.get("keep_option_order") != "on",
+        )
+    except ValueError as e:
+        return f"Error: {e}", 400
+    except Exception as e:
+        logger.error(f"Failed to generate paper variants: {e}")
+        return f"Error: {str(e)}", 500
+    buffer.seek(0)
+    return send_file(buffer, as_attachment=True, download_name="Question_Paper_Variants.zip", mimetype="application/zip")
+
 # (select_prereq.html)
 @app.route('/finalize_prereq', methods=['POST'])
 def finalize_prereq():
@@ -2246,32 +2228,7 @@ def export_to_csv():
             return "Error: No questions available.", 400
 
         output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        headers = ["Class", "Subject", "Chapter", "Topic", "Subtopic", "Question", "Option 1", "Option 2", "Option 3", "Option 4", "Correct Option", "Verified", "Model Responses"]
-        writer.writerow(headers)
-        
-        # Write question data
-        for q in questions:
-            options = q.get("options", [""] * 4) + [""] * (4 - len(q.get("options", [])))
-            model_responses = "; ".join([f"{k}: {v}" for k, v in q.get("model_responses", {}).items()])
-            row = [
-                q.get("class", ""),
-                q.get("subject", ""),
-                q.get("chapter", ""),
-                q.get("topic", ""),
-                q.get("subtopic", "") or "",
-                q.get("question", ""),
-                options[0],
-                options[1],
-                options[2],
-                options[3],
-                str(q.get("correct_option", "")),
-                str(q.get("verified", "")),
-                model_responses
-            ]
-            writer.writerow(row)
+        csv.writer(output).writerows(exam_bundle.question_csv_rows(questions))
         
         output.seek(0)
         return send_file(
@@ -2285,6 +2242,54 @@ def export_to_csv():
     except Exception as e:
         return f"Error: {str(e)}", 500
 
+# Per-model latency and agreement stats for the verification ensemble
+@app.route('/verification_stats')
+def verification_stats():
+    with VERIFY_STATS_LOCK:
+        snapshot = {model: dict(stats) for model, stats in VERIFY_STATS.items()}
+
+    for stats in snapshot.values():
+        timed_calls = stats["answered"] + stats["errors"]
+        voted = stats["agreed"] + stats["disagreed"]
+        stats["avg_latency"] = round(stats["total_latency"] / timed_calls, 3) if timed_calls else None
+        stats["agreement_rate"] = round(stats["agreed"] / voted, 3) if voted else None
+
+    return jsonify({
+        "models": VERIFY_MODELS,
+        "quorum": VERIFY_QUORUM or len(VERIFY_MODELS) // 2 + 1,
+        "stats": snapshot
+    })
+
+# Coverage of the shared prerequisite knowledge graph
+@app.route('/admin/prereq_coverage')
+def prereq_coverage():
+    return jsonify(prereq_store.coverage())
+
+# Readiness probe: 200 once every configured model is loaded, 503 until then
+@app.route('/health')
+def health():
+    if not model_warmup.started():
+        return jsonify({"status": "ready", "warmup": "disabled"})
+    ready, models = model_warmup.readiness()
+    return jsonify({"status": "ready" if ready else "warming", "models": models}), 200 if ready else 503
+
+# Prometheus text exposition of per-call LLM telemetry
+@app.route('/metrics')
+def metrics():
+    return Response(llm_telemetry.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# Per-request LLM usage summaries (most recent first)
+@app.route('/llm_jobs')
+def llm_jobs():
+    return jsonify(llm_telemetry.recent_jobs())
+
+@app.route('/llm_jobs/<job_id>')
+def llm_job(job_id):
+    summary = llm_telemetry.get_job(job_id)
+    if summary is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(summary)
+
 def normalize_subject(subject):
     subject = subject.strip().lower()
     subject_map = {
@@ -2397,6 +2402,33 @@ FALLBACK_TEXTBOOKS = {
     }
 }
 
+def generate_study_chapter(board, class_name, subject, chapter_num, chapter_name, content_types):
+    """Generates the selected content types of one chapter; returns (chapter_data, errors or None)."""
+    chapter_data = {
+        "number": chapter_num,
+        "chapter": chapter_name,
+        "content": {}
+    }
+
+    logger.info(f"Generating content for {subject} - {chapter_name} (number: {chapter_num})")
+    output_paths, gen_errors = generate_educational_content(
+        board=board,
+        class_name=class_name,
+        subject=subject,
+        chapter_number=int(chapter_num),
+        chapter_name=chapter_name,
+        content_types=content_types
+    )
+
+    for output_path in output_paths:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            content_data = json.load(f)
+            content_type = content_data.get('content_type')
+            generated_content = content_data.get('generated_content', {}).get(content_type, 'No content generated')
+            chapter_data['content'][content_type] = generated_content
+            logger.info(f"Loaded {content_type} from {output_path}: {generated_content[:100]}...")
+    return chapter_data, gen_errors
+
 @app.route('/generate_study_material', methods=['POST'])
 def generate_study_material():
     board = request.form.get('board')
@@ -2448,8 +2480,9 @@ def generate_study_material():
     with open(chapters_data_path, 'r', encoding='utf-8') as f:
         subject_chapter_map = json.load(f)
 
+    # Chapters to generate, in reading order
+    jobs = []
     for subject in normalized_subjects:
-        subject_data = {"subject": subject, "chapters": []}
         chapters = subject_chapter_map.get(subject, [])
         selected_subject_chapters = [ch.split("|")[0] for ch in selected_chapters if ch.split("|")[2].lower() == subject.lower()]
         
@@ -2471,57 +2504,83 @@ def generate_study_material():
                 })
                 logger.warning(f"Chapter {chapter_name} not found in subject_chapter_map for {subject}")
                 continue
+            jobs.append((subject, chapter['number'], chapter_name))
 
-            chapter_num = chapter['number']
-            chapter_data = {
-                "number": chapter_num,
-                "chapter": chapter_name,
-                "content": {}
-            }
-
-            logger.info(f"Generating content for {subject} - {chapter_name} (number: {chapter_num})")
-            output_paths, gen_errors = generate_educational_content(
-                board=board,
-                class_name=class_name,
-                subject=subject,
-                chapter_number=int(chapter_num),
-                chapter_name=chapter_name,
-                content_types=content_types
-            )
-            
-            if gen_errors:
-                errors.append({
-                    'message': f"Errors generating content for {subject} - {chapter_name}: {gen_errors}",
-                    'is_json_upload_error': False,
-                    'subject': subject
-                })
-                logger.error(f"Errors generating content for {subject} - {chapter_name}: {gen_errors}")
-            
-            for output_path in output_paths:
-                with open(output_path, 'r', encoding='utf-8') as f:
-                    content_data = json.load(f)
-                    content_type = content_data.get('content_type')
-                    generated_content = content_data.get('generated_content', {}).get(content_type, 'No content generated')
-                    chapter_data['content'][content_type] = generated_content
-                    logger.info(f"Loaded {content_type} from {output_path}: {generated_content[:100]}...")
-
-            if chapter_data['content']:
-                subject_data['chapters'].append(chapter_data)
-
-        if subject_data['chapters']:
-            study_material.append(subject_data)
-
-    if study_material and not errors:
+    # Chapters are generated in parallel and added to the PDF in reading order as soon
+    # as every chapter before them is done; the PDF is laid out once all are in
+    writer = None
+    if jobs and not errors:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         pdf_filename = f"study_material_{timestamp}.pdf"
-        pdf_path = os.path.join(CONTENT_DIR, pdf_filename)
         try:
-            generate_study_material_pdf(study_material, pdf_path)
-            pdf_code = f"Study Material PDF generated successfully as {pdf_filename}"
+            writer = StudyMaterialWriter(os.path.join(CONTENT_DIR, pdf_filename))
         except Exception as e:
             errors.append({'message': f"Failed to generate PDF: {str(e)}", 'is_json_upload_error': False})
             logger.error(f"Failed to generate PDF: {str(e)}")
 
+    results = {}
+    next_job = 0
+    workers = max(min(LLM_MAX_WORKERS, len(jobs)), 1)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                llm_client.submit(executor, generate_study_chapter, board, class_name, subject, chapter_num,
+                                  chapter_name, content_types): i
+                for i, (subject, chapter_num, chapter_name) in enumerate(jobs)
+            }
+            for future in as_completed(futures):
+                i = futures[future]
+                subject, chapter_num, chapter_name = jobs[i]
+                try:
+                    chapter_data, gen_errors = future.result()
+                except Exception as e:
+                    # The chapter is left out; the others are still generated and laid out
+                    chapter_data, gen_errors = {"number": chapter_num, "chapter": chapter_name, "content": {}}, None
+                    errors.append({
+                        'message': f"Failed to generate content for {subject} - {chapter_name}: {str(e)}",
+                        'is_json_upload_error': False,
+                        'subject': subject
+                    })
+                    logger.error(f"Failed to generate content for {subject} - {chapter_name}: {str(e)}")
+                results[i] = chapter_data
+                if gen_errors:
+                    errors.append({
+                        'message': f"Errors generating content for {subject} - {chapter_name}: {gen_errors}",
+                        'is_json_upload_error': False,
+                        'subject': subject
+                    })
+                    logger.error(f"Errors generating content for {subject} - {chapter_name}: {gen_errors}")
+
+                while next_job in results:
+                    chapter_data = results[next_job]
+                    if writer is not None and not errors and chapter_data['content']:
+                        try:
+                            writer.add_chapter(jobs[next_job][0], chapter_data)
+                        except Exception as e:
+                            errors.append({'message': f"Failed to generate PDF: {str(e)}", 'is_json_upload_error': False})
+                            logger.error(f"Failed to generate PDF: {str(e)}")
+                    next_job += 1
+
+        for i, (subject, _, _) in enumerate(jobs):
+            if results[i]['content']:
+                if not study_material or study_material[-1]['subject'] != subject:
+                    study_material.append({"subject": subject, "chapters": []})
+                study_material[-1]['chapters'].append(results[i])
+
+        if writer is not None and study_material and not errors:
+            try:
+                writer.close()
+                pdf_code = f"Study Material PDF generated successfully as {pdf_filename}"
+            except Exception as e:
+                errors.append({'message': f"Failed to generate PDF: {str(e)}", 'is_json_upload_error': False})
+                logger.error(f"Failed to generate PDF: {str(e)}")
+    finally:
+        # Leaves no temporary file behind, however the request ends; a closed writer has none
+        if writer is not None:
+            writer.discard()
+    if not pdf_code:
+        pdf_filename = None
+
     if not study_material and not errors:
         errors.append({'message': 'No study material generated. Please check your selections or upload valid JSON files.', 'is_json_upload_error': True})
 
@@ -2766,8 +2825,7 @@ def run_fib_generation():
         return render_template("fib_results.html", success=False)
 
     try:
-        generate_fib_pdf_v2(content, student_pdf_path, show_answers=False, marker_path=marker_path)
-        generate_fib_pdf_v2(content, answer_pdf_path, show_answers=True, marker_path=marker_path)
+        generate_fib_pdfs(content, student_pdf_path, answer_pdf_path, marker_path=marker_path)
 
         logger.info("FIB PDF generation complete.")
         return render_template("fib_results.html", success=True,
@@ -0,0 +1,61 @@
+"""
+Benchmark of FIB worksheet rendering for 8, 50 and 200 questions.
+
+For each size it reports the median time of the student worksheet, the
+answer key, both rendered one after the other, and both rendered side by
+side with generate_fib_pdfs (the way /run_fib_generation renders them).
+The worker pool is started before timing, as it is after the first
+worksheet of a running app.
+
+Run from the repository root:
+    python benchmarks/fib_render_bench.py
+    PDF_RENDER_WORKERS=1 python benchmarks/fib_render_bench.py --sizes 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fib_pdf import generate_fib_pdf_v2, generate_fib_pdfs  # noqa: E402
+from pdf_workloads import fib as sample_fib  # noqa: E402
+
+
+def median_ms(render, repeat):
+    times = []
+    for _ in range(repeat):
+        started = perf_counter()
+        render()
+        times.append(perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[8, 50, 200], help="questions per worksheet")
+    parser.add_argument("--repeat", type=int, default=9)
+    parser.add_argument("--marker", default="img1.jpg", help="corner marker image")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        student = os.path.join(directory, "student.pdf")
+        answer = os.path.join(directory, "answer.pdf")
+        generate_fib_pdfs(sample_fib(8), student, answer, args.marker)  # start the workers
+
+        for size in args.sizes:
+            content = sample_fib(size)
+            worksheet = median_ms(lambda: generate_fib_pdf_v2(content, student, False, args.marker), args.repeat)
+            key = median_ms(lambda: generate_fib_pdf_v2(content, answer, True, args.marker), args.repeat)
+            sequential = median_ms(lambda: (generate_fib_pdf_v2(content, student, False, args.marker),
+                                            generate_fib_pdf_v2(content, answer, True, args.marker)), args.repeat)
+            concurrent = median_ms(lambda: generate_fib_pdfs(content, student, answer, args.marker), args.repeat)
+            print(f"{size:4d} questions | worksheet {worksheet:6.1f} ms | key {key:6.1f} ms | "
+                  f"one after the other {sequential:6.1f} ms | side by side {concurrent:6.1f} ms | "
+                  f"{os.path.getsize(student) / 1024:.0f} + {os.path.getsize(answer) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmark suite of the PDF renderers on synthetic workloads (pdf_workloads).
+
+Each case renders one document kind: 10, 100 and 1000-question papers and a
+100-question answer key (paper_pdf), a deep prerequisite tree (prereq_pdf), a
+50-question FIB worksheet with its answer key (fib_pdf), a 200-question OMR
+sheet (omr_pdf) and a multi-chapter study pack (study_pdf). Every case runs in
+a fresh Python process and reports:
+
+- first: the first render in the process, which includes registering the
+  fonts and building the style sheet;
+- best / median / spread: the fastest, the median and the range (slowest
+  minus fastest) of the following renders;
+- peak RSS: the process's peak resident memory, and how much of it the
+  renders added on top of the interpreter, imports and input data;
+- size: the output PDF.
+
+Baselines live in benchmarks/pdf_baselines.json. --check compares the run
+against them and exits with status 1 when a case is slower, bigger in memory
+or larger on disk than its baseline by more than the tolerances. The time
+check uses the fastest render, which scheduler and cache noise can only make
+slower, and allows at least TIME_FLOOR_MS on top of the baseline, so that a
+few milliseconds of jitter do not fail the small cases. Timings depend on the
+machine: re-record the baselines with --save on the machine that checks them.
+
+Run from the repository root:
+    python benchmarks/pdf_render_bench.py
+    python benchmarks/pdf_render_bench.py --only paper_1000 omr_200 --repeat 3
+    python benchmarks/pdf_render_bench.py --check
+    python benchmarks/pdf_render_bench.py --save
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_workloads  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_baselines.json")
+
+# Allowed growth over the baseline before --check reports a regression
+TIME_TOLERANCE = 1.5
+TIME_FLOOR_MS = 10
+RSS_TOLERANCE = 1.2
+SIZE_TOLERANCE = 1.1
+
+
+def _paper(questions):
+    from paper_pdf import generate_pdf
+    data = pdf_workloads.paper(questions)
+    return lambda path: generate_pdf(data, path)
+
+
+def _answer_key(questions):
+    from paper_pdf import generate_answer_key_pdf
+    data = pdf_workloads.paper(questions)
+    return lambda path: generate_answer_key_pdf(data, path)
+
+
+def _prereq_deep():
+    from prereq_pdf import render_prerequisite_pdf
+    tree = pdf_workloads.prerequisite_tree()
+    return lambda path: render_prerequisite_pdf(tree, path)
+
+
+def _fib(questions):
+    from fib_pdf import generate_fib_pdf_v2
+    content = pdf_workloads.fib(questions)
+
+    def render(path):
+        # In this process, not the worker pool, so that the memory is measured here
+        generate_fib_pdf_v2(content, path + ".key.pdf", show_answers=True)
+        generate_fib_pdf_v2(content, path, show_answers=False)
+    return render
+
+
+def _omr_200():
+    from omr_pdf import OMRGenerator
+
+    def render(path):
+        with open(path, "wb") as f:
+            f.write(OMRGenerator(pdf_workloads.OMR_200).generate())
+    return render
+
+
+def _study_pack():
+    from study_pdf import generate_study_material_pdf
+    pack = pdf_workloads.study_pack()
+    return lambda path: generate_study_material_pdf(pack, path)
+
+
+# name -> () -> render(path), building the input data first
+CASES = {
+    "paper_10": lambda: _paper(10),
+    "paper_100": lambda: _paper(100),
+    "paper_1000": lambda: _paper(1000),
+    "answer_key_100": lambda: _answer_key(100),
+    "prereq_deep": _prereq_deep,
+    "fib_50": lambda: _fib(50),
+    "omr_200": _omr_200,
+    "study_pack": _study_pack,
+}
+
+
+def _max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_case(name, repeat):
+    """Runs one case in this process and returns its measurements."""
+    render = CASES[name]()
+    rss_before = _max_rss_mb()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{name}.pdf")
+        started = perf_counter()
+        render(path)
+        first = perf_counter() - started
+        times = []
+        for _ in range(repeat):
+            started = perf_counter()
+            render(path)
+            times.append(perf_counter() - started)
+        size = os.path.getsize(path)
+    peak = _max_rss_mb()
+    return {
+        "first_ms": round(first * 1000, 1),
+        "best_ms": round(min(times or [first]) * 1000, 1),
+        "median_ms": round(statistics.median(times or [first]) * 1000, 1),
+        "spread_ms": round((max(times or [first]) - min(times or [first])) * 1000, 1),
+        "peak_rss_mb": round(peak, 1),
+        "render_rss_mb": round(peak - rss_before, 1),
+        "size_kb": round(size / 1024, 1),
+    }
+
+
+def measure(name, repeat):
+    """Runs one case in a fresh process, so that its peak RSS is its own."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-case", name, "--repeat", str(repeat)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def regressions(name, result, baseline):
+    found = []
+    if "best_ms" in baseline:
+        limit = max(baseline["best_ms"] * TIME_TOLERANCE, baseline["best_ms"] + TIME_FLOOR_MS)
+        if result["best_ms"] > limit:
+            found.append(f"{name}: best_ms {result['best_ms']} > {limit:.1f}"
+                         f" (baseline {baseline['best_ms']} +-{baseline.get('spread_ms', 0)})")
+    for key, tolerance in (("peak_rss_mb", RSS_TOLERANCE), ("size_kb", SIZE_TOLERANCE)):
+        if key in baseline and result[key] > baseline[key] * tolerance:
+            found.append(f"{name}: {key} {result[key]} > {baseline[key]} x {tolerance}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(CASES), help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=15, help="renders after the first one")
+    parser.add_argument("--check", action="store_true", help="compare with the baselines, exit 1 on a regression")
+    parser.add_argument("--save", action="store_true", help="store this run as the baselines")
+    parser.add_argument("--run-case", choices=list(CASES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.repeat)))
+        return
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+
+    results = {}
+    found = []
+    print(f"{'case':15s} {'first':>9s} {'best':>9s} {'median':>9s} {'spread':>9s}"
+          f" {'peak RSS':>9s} {'renders':>9s} {'size':>9s}")
+    for name in args.only or CASES:
+        result = results[name] = measure(name, args.repeat)
+        print(f"{name:15s} {result['first_ms']:7.1f}ms {result['best_ms']:7.1f}ms {result['median_ms']:7.1f}ms"
+              f" {result['spread_ms']:7.1f}ms {result['peak_rss_mb']:7.1f}MB {result['render_rss_mb']:+7.1f}MB"
+              f" {result['size_kb']:6.1f}KiB")
+        if args.check and name in baselines.get("cases", {}):
+            found.extend(regressions(name, result, baselines["cases"][name]))
+
+    if args.save:
+        cases = dict(baselines.get("cases", {}), **results)
+        machine = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+        with open(BASELINES, "w", encoding="utf-8") as f:
+            json.dump({"machine": machine, "cases": cases}, f, indent=2)
+            f.write("\n")
+        print(f"Saved baselines for {len(results)} case(s) to {BASELINES}")
+
+    if args.check:
+        if found:
+            print("Regressions against the baselines:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against the baselines.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Synthetic inputs for the PDF benchmarks, shaped like the app's data:
+question papers (paper.json), prerequisite trees, FIB worksheets, study
+packs and OMR sheets. Every generator is seeded, so a workload is the same
+from run to run.
+"""
+import random
+
+WORDS = ("energy force motion cell atom fraction angle triangle equation river soil plant light sound "
+         "matter heat circuit ratio polygon number").split()
+
+CONTENT_TYPES = [
+    "Chapter Summaries", "Important Points", "Definition Bank", "Formula Sheet",
+    "Concept Explanation", "Solved Examples", "Practice Questions", "Quiz Creation",
+    "Fill in the Blanks", "True/False", "Higher Order Thinking (HOTS)", "Real Life Applications"
+]
+
+# Questions per OMR subject: 200 in all
+OMR_200 = [50, 50, 30, 30, 40]
+
+
+def sentence(rng, words=14):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def paper(questions, seed=1):
+    """A paper.json with `questions` MCQs, some with non-Latin characters."""
+    rng = random.Random(seed)
+    return {"questions": [{
+        "class": "10", "subject": "Mathematics", "chapter": f"Chapter {i % 5 + 1}", "topic": "Real Numbers",
+        "subtopic": "Irrational numbers" if i % 2 else None,
+        "question": f"{sentence(rng, 18)} If x < 5 and √2 ≈ 1.414, find π·r² for r = {i}.",
+        "options": [f"{k}. {sentence(rng, 4)}" for k in range(1, 5)],
+        "correct_option": i % 4 + 1,
+    } for i in range(questions)]}
+
+
+def prerequisite_tree(roots=10, depth=6, branching=2, seed=1):
+    """A tree of `roots` class 10 chapters, each with `branching` prerequisites per level down to `depth`."""
+    rng = random.Random(seed)
+
+    def node(level, i):
+        item = {"number": i + 1, "chapter": sentence(rng, 5)[:-1], "class": f"class_{10 - level}"}
+        if level:
+            item["reason"] = sentence(rng, 20)
+        item["prerequisites"] = [node(level + 1, j) for j in range(branching)] if level < depth else []
+        return item
+    return {"class_10": {"Mathematics": [node(0, i) for i in range(roots)]}}
+
+
+def fib(questions, seed=1):
+    """A FIB worksheet with `questions` blanks and a paragraph that grows with it."""
+    rng = random.Random(seed)
+    answers = [rng.choice(WORDS) for _ in range(questions)]
+    return {
+        "paragraph": " ".join(sentence(rng) for _ in range(max(4, questions // 4))),
+        "word_bank": sorted(set(answers)),
+        "questions": [f"{sentence(rng, rng.randint(4, 16))[:-1]} is called ______ in the {rng.choice(WORDS)}."
+                      for _ in answers],
+        "answers": answers,
+    }
+
+
+def study_pack(subjects=3, chapters=8, content_types=CONTENT_TYPES, seed=1):
+    """Study material for `subjects` x `chapters`, one 200-word section per content type."""
+    rng = random.Random(seed)
+    return [{
+        "subject": f"Subject {s + 1}",
+        "chapters": [{
+            "number": c + 1, "chapter": sentence(rng, 4)[:-1],
+            "content": {t: "\n\n".join(" ".join(sentence(rng) for _ in range(5)) for _ in range(3)) for t in content_types},
+        } for c in range(chapters)],
+    } for s in range(subjects)]
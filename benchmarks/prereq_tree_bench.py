@@ -0,0 +1,156 @@
+"""
+Benchmark of the prerequisite tree builder on synthetic selected structures.
+
+Builds a 5-level structure (class_10 down to class_6) with CHAPTERS chapters
+per class and subject. Every lower-class chapter is a prerequisite "for" a
+random chapter of the class above, except a fraction without "for", which the
+builder attaches under every chapter above it. Each scenario is timed with
+the memoized builder (prereq_tree.build_prerequisite_tree) and, unless
+--no-legacy is given, with the previous deep-copying builder, whose output
+must serialize to the same JSON. The serialized tree is as large as a full
+expansion, so with many chapters lacking "for" use --no-serialize to time the
+build alone.
+
+Run from the repository root:
+    python benchmarks/prereq_tree_bench.py
+    python benchmarks/prereq_tree_bench.py --chapters 200 --untargeted 0.1 --no-legacy --no-serialize
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prereq_tree import build_prerequisite_tree  # noqa: E402
+
+
+def legacy_build_prerequisite_tree(selected_structure):
+    """The builder prereq_tree replaced: deep copies, recursion with visited.copy()."""
+    sorted_classes = sorted(selected_structure.keys(), key=lambda k: int(k.split('_')[1]), reverse=True)
+    if not sorted_classes:
+        return {}
+
+    top_class_key = sorted_classes[0]
+    result = copy.deepcopy(selected_structure[top_class_key])
+    for subject, chapters in result.items():
+        for chapter in chapters:
+            chapter["class"] = top_class_key
+
+    def attach(subject, chapter_name, cur_idx, visited=None):
+        if visited is None:
+            visited = set()
+        if chapter_name in visited:
+            return []
+        visited.add(chapter_name)
+
+        prereqs = []
+        for lower_idx in range(cur_idx + 1, len(sorted_classes)):
+            class_key = sorted_classes[lower_idx]
+            for ch in selected_structure.get(class_key, {}).get(subject, []):
+                if ch.get("chapter") in visited:
+                    continue
+                if ch.get("for") == chapter_name or not ch.get("for"):
+                    ch_copy = copy.deepcopy(ch)
+                    ch_copy.pop("for", None)
+                    ch_copy["class"] = class_key
+                    ch_copy["prerequisites"] = attach(subject, ch.get("chapter"), lower_idx, visited.copy())
+                    prereqs.append(ch_copy)
+        return prereqs
+
+    for subject, chapters in result.items():
+        for chapter in chapters:
+            chapter["prerequisites"] = attach(subject, chapter.get("chapter"), 0)
+
+    return {top_class_key: result}
+
+
+def synthetic_structure(levels, subjects, chapters, untargeted, seed, repeated_names=0.1):
+    """
+    selected_structure with `levels` classes. A `repeated_names` fraction of
+    chapter names recur in the class below, like chapters that share a title
+    across years, which exercises the path-dependent part of the builder.
+    """
+    rng = random.Random(seed)
+    structure = {}
+    top_class = 10
+    previous = {}
+    for level in range(levels):
+        class_key = f"class_{top_class - level}"
+        structure[class_key] = {}
+        for s in range(subjects):
+            subject = f"Subject {s + 1}"
+            above = previous.get(subject, [])
+            chapter_list = []
+            for number in range(1, chapters + 1):
+                if above and rng.random() < repeated_names:
+                    name = rng.choice(above)["chapter"]
+                else:
+                    name = f"S{s + 1} C{top_class - level} Chapter {number}"
+                chapter = {
+                    "number": number,
+                    "chapter": name,
+                    "topics": [
+                        {"topic": f"{name} topic {t}", "subtopics": [{"text": f"{name} subtopic {t}.{u}"} for u in range(2)]}
+                        for t in range(3)
+                    ],
+                }
+                if above and rng.random() >= untargeted:
+                    target = rng.choice(above)
+                    chapter["for"] = target["chapter"]
+                    chapter["reason"] = f"Needed for {target['chapter']}"
+                chapter_list.append(chapter)
+            structure[class_key][subject] = chapter_list
+            previous[subject] = chapter_list
+    return structure
+
+
+def timed(fn, *args):
+    started = perf_counter()
+    result = fn(*args)
+    return result, perf_counter() - started
+
+
+def run(levels, subjects, chapters, untargeted, seed, legacy, serialize):
+    structure = synthetic_structure(levels, subjects, chapters, untargeted, seed)
+    total = levels * subjects * chapters
+    tree, build_seconds = timed(build_prerequisite_tree, structure)
+    line = (f"{levels} levels x {subjects} subjects x {chapters} chapters ({total} chapters, "
+            f"{untargeted:.0%} without 'for'): build {build_seconds * 1000:.1f} ms")
+    if serialize:
+        output, dump_seconds = timed(json.dumps, tree)
+        line += f", serialize {dump_seconds * 1000:.1f} ms, {len(output) / 1024:.0f} KiB"
+    if legacy:
+        legacy_tree, legacy_seconds = timed(legacy_build_prerequisite_tree, structure)
+        line += f" | legacy build {legacy_seconds * 1000:.1f} ms"
+        identical = not serialize or json.dumps(legacy_tree) == output
+        if serialize:
+            line += f", identical output: {identical}"
+        if not identical:
+            print(line)
+            raise SystemExit("Memoized builder output differs from the legacy builder")
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", type=int, default=5)
+    parser.add_argument("--subjects", type=int, default=2)
+    parser.add_argument("--chapters", type=int, nargs="+", default=[25, 50, 100],
+                        help="chapters per class and subject (one scenario each)")
+    parser.add_argument("--untargeted", type=float, default=0.02,
+                        help="fraction of lower-class chapters without a 'for' field")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-legacy", action="store_true", help="skip the deep-copying builder")
+    parser.add_argument("--no-serialize", action="store_true", help="time the build only")
+    args = parser.parse_args()
+
+    for chapters in args.chapters:
+        run(args.levels, args.subjects, chapters, args.untargeted, args.seed, not args.no_legacy, not args.no_serialize)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,4 +6,80 @@ DATA_DIR = os.getenv("DATA_DIR", "structured_data")
 TEXTBOOK_PAGES_DIR = os.getenv("TEXTBOOK_PAGES_DIR", "textbook_pages")
 FONTS_DIR = os.getenv("FONTS_DIR", "fonts")
 CONTENT_DIR = os.getenv("CONTENT_DIR", "textbook_content")
-TEXT_LIMIT = int(os.getenv("TEXT_LIMIT", 3000))
\ No newline at end of file
+TEXT_LIMIT = int(os.getenv("TEXT_LIMIT", 3000))
+
+# LLM backend
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")  # None lets the ollama client use its default
+
+# Answer verification ensemble (comma separated model names)
+VERIFY_MODELS = [m.strip() for m in os.getenv("VERIFY_MODELS", "llama3").split(",") if m.strip()]
+VERIFY_QUORUM = int(os.getenv("VERIFY_QUORUM", 0))  # 0 = simple majority of VERIFY_MODELS
+VERIFY_TIMEOUT = int(os.getenv("VERIFY_TIMEOUT", 180))
+
+# Prompt sizing and parallelism for generation calls
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", 8192))  # passed to Ollama as num_ctx on every call
+# Per-model overrides of LLM_CONTEXT_TOKENS, e.g. "llama3=8192,mistral=4096"
+LLM_MODEL_CONTEXT_TOKENS = {
+    name.strip(): int(size)
+    for name, _, size in (entry.partition("=") for entry in os.getenv("LLM_MODEL_CONTEXT_TOKENS", "").split(","))
+    if name.strip() and size.strip()
+}
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", 4))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))  # in-flight Ollama calls per process
+LLM_BACKGROUND_CONCURRENCY = int(os.getenv("LLM_BACKGROUND_CONCURRENCY", 1))  # of those, held by background jobs
+MCQ_TIMEOUT = int(os.getenv("MCQ_TIMEOUT", 300))
+MCQ_OUTPUT_TOKENS_PER_ITEM = int(os.getenv("MCQ_OUTPUT_TOKENS_PER_ITEM", 160))
+MCQ_MAX_ITEMS_PER_CHUNK = int(os.getenv("MCQ_MAX_ITEMS_PER_CHUNK", 12))
+MCQ_CHUNK_RETRIES = int(os.getenv("MCQ_CHUNK_RETRIES", 1))
+LLM_SCHEMA_RETRIES = int(os.getenv("LLM_SCHEMA_RETRIES", 1))  # re-requests for items that fail schema validation
+PREREQ_TIMEOUT = int(os.getenv("PREREQ_TIMEOUT", 600))
+
+# Models and residency: warmed at startup and kept loaded between calls
+GENERATION_MODEL = os.getenv("GENERATION_MODEL", "llama3")  # MCQs, prerequisites, FIB and study material
+SVG_EXPLAIN_MODEL = os.getenv("SVG_EXPLAIN_MODEL", "mistral")
+_keep_alive = os.getenv("LLM_KEEP_ALIVE", "30m")  # Ollama duration ("30m", "2h") or seconds; -1 keeps models loaded
+LLM_KEEP_ALIVE = int(_keep_alive) if _keep_alive.lstrip("-").isdigit() else _keep_alive
+LLM_WARMUP_ON_START = os.getenv("LLM_WARMUP_ON_START", "1").lower() in ("1", "true", "yes")
+LLM_WARMUP_MODELS = [
+    m.strip() for m in os.getenv("LLM_WARMUP_MODELS", ",".join(
+        dict.fromkeys([GENERATION_MODEL, SVG_EXPLAIN_MODEL] + VERIFY_MODELS)
+    )).split(",") if m.strip()
+]
+LLM_REWARM_INTERVAL = int(os.getenv("LLM_REWARM_INTERVAL", 600))  # seconds; 0 disables re-warming
+LLM_WARMUP_TIMEOUT = int(os.getenv("LLM_WARMUP_TIMEOUT", 600))
+
+# Per-request deadline for LLM work; calls are cancelled when it passes or the client disconnects
+REQUEST_DEADLINE = int(os.getenv("REQUEST_DEADLINE", 900))  # seconds; 0 disables the deadline
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", 1.0))
+
+# Share one backend call between concurrent identical LLM requests
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1").lower() in ("1", "true", "yes")
+
+# Background prerequisite graph computed when the top-level chapters are chosen (opt-in: it crawls every level)
+PREREQ_GRAPH_PRECOMPUTE = os.getenv("PREREQ_GRAPH_PRECOMPUTE", "0").lower() in ("1", "true", "yes")
+PREREQ_GRAPH_DEPTH = int(os.getenv("PREREQ_GRAPH_DEPTH", 3))  # levels offered by /recursive_prereq
+PREREQ_GRAPH_DEADLINE = int(os.getenv("PREREQ_GRAPH_DEADLINE", 1800))
+
+# Number of previous-year chapters (ranked locally with BM25) listed in each prerequisite prompt; 0 lists all
+PREREQ_SHORTLIST_K = int(os.getenv("PREREQ_SHORTLIST_K", 8))
+
+# Default prerequisite engine: "llm" asks the model, "local" scores chapters from the curriculum structure alone
+PREREQ_ENGINE = os.getenv("PREREQ_ENGINE", "llm")
+PREREQ_LOCAL_MAX_ITEMS = int(os.getenv("PREREQ_LOCAL_MAX_ITEMS", 3))  # suggestions per chapter from the local engine
+
+# Shared prerequisite knowledge graph (SQLite) consulted before asking the model
+PREREQ_STORE = os.getenv("PREREQ_STORE", "1").lower() in ("1", "true", "yes")
+PREREQ_STORE_PATH = os.getenv("PREREQ_STORE_PATH", os.path.join(DATA_DIR, "prerequisites.sqlite3"))
+
+# Rendered PDFs cached on disk by a hash of their input
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(DATA_DIR, "pdf_cache"))
+PDF_CACHE_MAX_FILES = int(os.getenv("PDF_CACHE_MAX_FILES", 200))
+
+# Register the PDF fonts at startup instead of on the first render
+PDF_FONT_PRELOAD = os.getenv("PDF_FONT_PRELOAD", "1").lower() in ("1", "true", "yes")
+
+# Worker processes rendering PDFs side by side (paper variants, FIB worksheet and answer key)
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", os.getenv("PAPER_VARIANT_WORKERS", 0)))  # 0 = one per CPU
+
+# Shuffled paper variants (sets A/B/C/... or one per student)
+PAPER_VARIANT_MAX = int(os.getenv("PAPER_VARIANT_MAX", 100))  # variants per archive
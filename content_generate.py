@@ -7,7 +7,10 @@ import hashlib
 import logging
 from datetime import datetime
 import ollama
-from config import TEXTBOOKS_API, DATA_DIR, CONTENT_DIR, TEXT_LIMIT
+import llm_client
+from config import TEXTBOOKS_API, DATA_DIR, CONTENT_DIR, TEXT_LIMIT, LLM_SCHEMA_RETRIES, GENERATION_MODEL
+from json_salvage import parse_json_object
+from llm_schemas import STUDY_SECTION_SCHEMA, validate
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -108,7 +111,9 @@ def generate_educational_content(board, class_name, subject, chapter_number, cha
             ]
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        content_dir = os.path.join(CONTENT_DIR, f"content_{timestamp}")
+        # One directory per chapter: chapters are generated in parallel, and file names only carry the chapter number
+        subject_slug = "".join(c if c.isalnum() else "_" for c in subject.lower())
+        content_dir = os.path.join(CONTENT_DIR, f"content_{timestamp}_{subject_slug}_{chapter_number}")
         os.makedirs(content_dir, exist_ok=True, mode=0o755)
         logger.info(f"Created unique directory: {content_dir}")
 
@@ -167,6 +172,8 @@ def generate_educational_content(board, class_name, subject, chapter_number, cha
         logger.error(f"Error in generate_educational_content: {e}")
         return [], str(e)
 
+STUDY_SECTION_INSTRUCTION = '\n\nReturn only a JSON object of the form {"content": "<the generated text>"}.'
+
 def generate_content_with_ollama(prompt, content_type, chapter_number, chapter_name, text_limit=200):
     """Generate content using Ollama for a specific content type."""
     try:
@@ -185,9 +192,17 @@ def generate_content_with_ollama(prompt, content_type, chapter_number, chapter_n
             "Real Life Applications": f"Describe 2-3 real-life applications of the concepts in the following chapter content:\n{prompt}"
         }
 
-        final_prompt = prompt_templates.get(content_type, prompt)
-        response = ollama.generate(model='llama3', prompt=final_prompt)
-        generated_text = response.get('response', '').strip()
+        final_prompt = prompt_templates.get(content_type, prompt) + STUDY_SECTION_INSTRUCTION
+        generated_text = ""
+        for attempt in range(LLM_SCHEMA_RETRIES + 1):
+            raw_output = llm_client.generate(GENERATION_MODEL, final_prompt, call_site="study", format=STUDY_SECTION_SCHEMA)
+            section, _ = parse_json_object(raw_output)
+            if section is not None and not validate(section, STUDY_SECTION_SCHEMA):
+                generated_text = section['content'].strip()
+                break
+            # Backends that ignore `format` may still return usable plain text
+            generated_text = raw_output.strip() if section is None else ""
+            logger.warning(f"{content_type} response for chapter {chapter_number} did not match the section schema")
         
         if not generated_text:
             logger.warning(f"No content generated for {content_type} in chapter {chapter_number} ({chapter_name})")
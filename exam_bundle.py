@@ -0,0 +1,121 @@
+"""
+Everything a teacher needs for a finalized paper in one zip: the question
+paper, its answer key, the questions as CSV and an OMR sheet with one column
+per subject of the paper, sized to that subject's question count.
+
+stream_bundle yields the zip as it is written: each part is produced and
+added in turn, and the bytes written so far are handed to the response
+before the next part starts, so the archive is never held in memory as a
+whole. The PDFs come from the PDF cache, so a paper downloaded before is
+not rendered again.
+"""
+import csv
+import io
+import logging
+import zipfile
+
+from omr_pdf import MAX_SUBJECTS, OMRGenerator
+from paper_pdf import cached_answer_key_pdf, cached_paper_pdf
+
+logger = logging.getLogger(__name__)
+
+CSV_HEADERS = ["Class", "Subject", "Chapter", "Topic", "Subtopic", "Question", "Option 1", "Option 2", "Option 3",
+               "Option 4", "Correct Option", "Verified", "Model Responses"]
+
+# Bytes copied into the zip between two chunks handed to the response
+COPY_CHUNK = 64 * 1024
+
+
+def question_csv_rows(questions):
+    """The header, then one row per question (the layout of Questions.csv)."""
+    yield CSV_HEADERS
+    for q in questions:
+        options = q.get("options", [""] * 4) + [""] * (4 - len(q.get("options", [])))
+        model_responses = "; ".join([f"{k}: {v}" for k, v in q.get("model_responses", {}).items()])
+        yield [
+            q.get("class", ""),
+            q.get("subject", ""),
+            q.get("chapter", ""),
+            q.get("topic", ""),
+            q.get("subtopic", "") or "",
+            q.get("question", ""),
+            options[0],
+            options[1],
+            options[2],
+            options[3],
+            str(q.get("correct_option", "")),
+            str(q.get("verified", "")),
+            model_responses
+        ]
+
+
+def omr_subject_counts(questions):
+    """(subjects, question counts) of the paper, in order of first appearance."""
+    counts = {}
+    for q in questions:
+        subject = q.get("subject") or "General"
+        counts[subject] = counts.get(subject, 0) + 1
+    return list(counts), list(counts.values())
+
+
+def check_bundle(paper):
+    """Why `paper` cannot be bundled, or None; checked before the download starts."""
+    questions = paper.get("questions", [])
+    if not questions:
+        return "No questions available."
+    subjects, _ = omr_subject_counts(questions)
+    if len(subjects) > MAX_SUBJECTS:
+        return f"The OMR sheet has room for at most {MAX_SUBJECTS} subjects; this paper has {len(subjects)}."
+    return None
+
+
+class _ChunkStream(io.RawIOBase):
+    """Write-only, unseekable sink collecting what zipfile writes until it is taken."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_bundle(paper, show_metadata=True):
+    """Yields the bundle zip of `paper` chunk by chunk (check it with check_bundle first)."""
+    questions = paper["questions"]
+    sink = _ChunkStream()
+    # zipfile writes entries with data descriptors when the output cannot seek
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, render in (("Question.pdf", lambda: cached_paper_pdf(paper, show_metadata)[0]),
+                             ("Answer_Key.pdf", lambda: cached_answer_key_pdf(paper)[0])):
+            path = render()
+            with open(path, "rb") as src, archive.open(name, "w") as entry:
+                while True:
+                    data = src.read(COPY_CHUNK)
+                    if not data:
+                        break
+                    entry.write(data)
+                    yield sink.take()
+            yield sink.take()
+
+        with archive.open("Questions.csv", "w") as entry:
+            text = io.TextIOWrapper(entry, encoding="utf-8", newline="")
+            csv.writer(text).writerows(question_csv_rows(questions))
+            text.flush()
+            text.detach()
+        yield sink.take()
+
+        subjects, counts = omr_subject_counts(questions)
+        archive.writestr("OMR_Sheet.pdf", OMRGenerator(counts, subjects).generate())
+        yield sink.take()
+    # Central directory
+    yield sink.take()
+    logger.info(f"📦 Streamed exam bundle of {len(questions)} questions ({', '.join(subjects)})")
@@ -0,0 +1,220 @@
+"""
+PDF rendering of Fill-in-the-Blank worksheets and their answer keys on the
+shared rendering layer (see pdf_engine).
+
+The table styles and the instructions text do not depend on the worksheet,
+so they are built once at import; each render only builds its flowables.
+Letter boxes and question rows are drawn directly (LetterBoxes, QuestionRow)
+rather than laid out as a table each. generate_fib_pdfs renders the
+worksheet and its answer key side by side.
+"""
+import os
+
+from reportlab.lib import colors
+from reportlab.lib.units import cm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, Paragraph, Spacer, Table, TableStyle
+
+import pdf_engine
+from pdf_engine import PlainText, markup
+
+NUM_BOXES = 9
+BOX_WIDTH = 0.5 * cm
+BOX_HEIGHT = 0.5 * cm
+BLANK = '______'
+
+INSTRUCTIONS_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 5),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 5)
+])
+INFO_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 0),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 0)
+])
+FOOTER_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP')
+])
+
+INSTRUCTIONS_TEXT = """
+<b>Instructions for filling the sheet:</b><br/>
+• Don't fold the sheet. Use only ball pen. Read the given paragraph carefully.<br/>
+• Below the paragraph, you will find questions with blanks.<br/>
+• Use the Answer Bank provided to fill in the blanks with the most appropriate word(s).<br/>
+• Each word/phrase from the Answer Bank can be used only once, unless stated otherwise.<br/>
+• Write only the correct word(s) in the blank space provided.<br/>
+• Spelling errors may result in the loss of marks.<br/>
+• Do not use words that are not in the Answer Bank.<br/>
+• <b>Only use <i>UPPER CASE CAPITAL LETTER ALPHABETS</i> in the boxes.</b>
+"""
+
+
+def _draw_boxes(canv, x, y, count):
+    canv.setStrokeColor(colors.black)
+    canv.setLineWidth(0.5)
+    canv.grid([x + i * BOX_WIDTH for i in range(count + 1)], [y, y + BOX_HEIGHT])
+
+
+class LetterBoxes(Flowable):
+    """A row of `count` empty boxes, one letter each."""
+
+    def __init__(self, count):
+        super().__init__()
+        self.count = count
+        self.width = count * BOX_WIDTH
+        self.height = BOX_HEIGHT
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        _draw_boxes(self.canv, 0, 0, self.count)
+
+
+class QuestionRow(Flowable):
+    """
+    A numbered question with its text on the left and letter boxes on the
+    right, both centred on the row. The text wraps under its bold number.
+    """
+
+    PADDING = 3  # above and below the row
+
+    def __init__(self, number, text, style, boxes=NUM_BOXES):
+        super().__init__()
+        self.label = f"Q{number}."
+        self.text = text
+        self.style = style
+        self.boxes = boxes
+        self.bold = pdf_engine.fonts().bold
+
+    def wrap(self, availWidth, availHeight):
+        style = self.style
+        self.indent = stringWidth(self.label + " ", self.bold, style.fontSize)
+        text_width = availWidth - self.boxes * BOX_WIDTH - self.indent
+        self.lines = simpleSplit(self.text, style.fontName, style.fontSize, text_width) or [""]
+        self.width = availWidth
+        self.height = max(len(self.lines) * style.leading, BOX_HEIGHT) + 2 * self.PADDING
+        return self.width, self.height
+
+    def draw(self):
+        style = self.style
+        c = self.canv
+        text_height = len(self.lines) * style.leading
+        y = (self.height + text_height) / 2 - style.fontSize
+        c.setFillColor(style.textColor)
+        c.setFont(self.bold, style.fontSize)
+        c.drawString(0, y, self.label)
+        c.setFont(style.fontName, style.fontSize)
+        for line in self.lines:
+            c.drawString(self.indent, y, line)
+            y -= style.leading
+        _draw_boxes(c, self.width - self.boxes * BOX_WIDTH, (self.height - BOX_HEIGHT) / 2, self.boxes)
+
+
+def _answer_key_story(content, styles):
+    story = [
+        PlainText("Worksheet & Answer Key", styles['FibTitle']),
+        PlainText(content.get("paragraph", ""), styles['FibParagraph']),
+        PlainText("Word Bank:", styles['FibSection']),
+        PlainText(", ".join(content.get("word_bank", [])), styles['FibAnswerBank']),
+        Spacer(1, 1 * cm),
+        PlainText("Fill in the blanks:", styles['FibSection']),
+    ]
+    for i, q_text in enumerate(content.get("questions", [])):
+        story.append(PlainText(f"{i+1}. {q_text.replace(BLANK, '___________')}", styles['FibQuestion']))
+        story.append(Spacer(1, 0.2 * cm))
+    story.append(Spacer(1, 1.5 * cm))
+    story.append(PlainText("■ Answer Key (for teachers only):", styles['FibSection']))
+    for i, ans_text in enumerate(content.get("answers", [])):
+        story.append(Paragraph(f"<b>{i+1}.</b> {markup(ans_text)}", styles['FibQuestion']))
+    return story
+
+
+def _worksheet_story(content, styles, available_width):
+    # 1. Instructions in a bordered box
+    story = [
+        Table([[Paragraph(INSTRUCTIONS_TEXT, styles['FibInstructions'])]], colWidths=[available_width], style=INSTRUCTIONS_STYLE),
+        Spacer(1, 0.4 * cm),
+    ]
+
+    # 2. Info Boxes in a table with labels
+    label = lambda text: Paragraph(f"<b>{text}</b>", styles['FibInstructions'])
+    info_table_data = [
+        [label("Admission number"), LetterBoxes(12)],
+        [label("Student Name"), LetterBoxes(24)],
+        [label("Class"), LetterBoxes(2), label("Section"), LetterBoxes(2), label("Date (ddmmyyyy)"), LetterBoxes(8)]
+    ]
+    story.append(Table(info_table_data, colWidths=[2.5 * cm, 6 * cm, 1 * cm, 1 * cm, 2 * cm, 4 * cm], style=INFO_STYLE))
+    story.append(Spacer(1, 0.4 * cm))
+
+    # 3. Paragraph and Answer Bank in separate sections
+    story.append(Paragraph(f"<b>Paragraph:</b> {markup(content.get('paragraph', ''))}", styles['FibParagraph']))
+    story.append(Spacer(1, 0.3 * cm))
+    answer_bank = ', '.join(word.upper() for word in content.get('word_bank', []))
+    story.append(Paragraph(f"<b>Answer bank:</b> {markup(answer_bank)}", styles['FibAnswerBank']))
+    story.append(Spacer(1, 0.5 * cm))
+
+    # 4. Questions with the text on the left and the answer boxes on the right
+    for i, sentence in enumerate(content.get("questions", [])):
+        pre_box_text, _, post_box_text = sentence.partition(BLANK)
+        story.append(QuestionRow(i + 1, pre_box_text.rstrip(), styles['FibQuestion']))
+        # The rest of the sentence goes below, unless the blank was its last word
+        if post_box_text.strip():
+            story.append(PlainText(post_box_text.strip(), styles['FibPostBox']))
+        story.append(Spacer(1, 0.3 * cm))
+
+    # 5. Footer with centered signatures
+    footer_data = [[Paragraph("", styles['FibInstructions'])],
+                   [Paragraph("Invigilator's Signature: __________________", styles['FibInstructions'])],
+                   [Paragraph("Student's Signature: ____________________", styles['FibInstructions'])]]
+    story.append(Spacer(1, 1 * cm))
+    story.append(Table(footer_data, colWidths=[available_width], style=FOOTER_STYLE))
+    return story
+
+
+def _corner_markers(marker_path):
+    """Page decoration drawing the scanner markers in the four corners."""
+    if not marker_path or not os.path.exists(marker_path):
+        return None
+    page_width, page_height = pdf_engine.LAYOUTS["fib"].pagesize
+    positions = [
+        (0.5 * cm, page_height - 1.3 * cm),
+        (page_width - 1.3 * cm, page_height - 1.3 * cm),
+        (0.5 * cm, 0.5 * cm),
+        (page_width - 1.3 * cm, 0.5 * cm)
+    ]
+
+    def draw(canvas, doc):
+        canvas.saveState()
+        for x, y in positions:
+            canvas.drawImage(marker_path, x, y, width=0.8 * cm, height=0.8 * cm, mask='auto')
+        canvas.restoreState()
+    return draw
+
+
+def generate_fib_pdf_v2(content, filename, show_answers=False, marker_path=None):
+    """
+    Generates a Fill-in-the-Blank PDF.
+    - Student version: instructions box, info boxes, paragraph and answer bank, then each question with its
+      text on the left and 9 letter boxes on the right (the rest of the sentence below, if any), and signatures.
+    - Teacher version uses a simple answer list format.
+    - The student version has corner markers for scanning on every page when marker_path exists.
+    """
+    styles = pdf_engine.stylesheet()
+    if show_answers:
+        pdf_engine.build_document(filename, _answer_key_story(content, styles), "fib", title="Worksheet & Answer Key")
+        return
+    story = _worksheet_story(content, styles, pdf_engine.content_width("fib"))
+    pdf_engine.build_document(filename, story, "fib", on_page=_corner_markers(marker_path), title="Fill in the Blanks")
+
+
+def generate_fib_pdfs(content, student_filename, answer_filename, marker_path=None):
+    """Renders the student worksheet and the answer key side by side (pdf_engine.render_all)."""
+    pdf_engine.render_all([
+        (generate_fib_pdf_v2, (content, student_filename, False, marker_path)),
+        (generate_fib_pdf_v2, (content, answer_filename, True, marker_path)),
+    ])
@@ -0,0 +1,313 @@
+"""
+Tolerant JSON extraction for LLM responses.
+
+Model output often wraps JSON in markdown fences, leaves trailing commas,
+emits Python literals or gets cut off mid-object. Instead of discarding the
+whole response, these helpers repair what they can and recover every
+complete object that is still intact.
+
+Each helper returns a report dict describing what happened:
+    mode        - "full" (parsed as a whole), "salvaged" (recovered piecewise)
+                  or "failed"
+    repairs     - names of the repairs that were applied
+    recovered   - number of item objects recovered
+    unparseable - number of object fragments that could not be parsed
+    truncated   - True if the response ended inside an unclosed object
+"""
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_FENCE_RE = re.compile(r"```[a-zA-Z]*")
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _new_report():
+    return {"mode": "failed", "repairs": set(), "recovered": 0, "unparseable": 0, "truncated": False}
+
+
+def _finish_report(report):
+    report["repairs"] = sorted(report["repairs"])
+    return report
+
+
+def strip_code_fences(text, report=None):
+    """Removes markdown code fences (```json ... ```) around or inside the text."""
+    if "```" not in text:
+        return text
+    if report is not None:
+        report["repairs"].add("code_fences")
+    return _FENCE_RE.sub("", text)
+
+
+def repair_json_text(text, report=None):
+    """
+    Applies string-aware textual repairs: drops trailing commas, converts
+    Python literals (True/False/None) and escapes raw newlines inside strings.
+    """
+    out = []
+    in_string = False
+    escaped = False
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            elif ch in "\n\r\t":
+                if report is not None:
+                    report["repairs"].add("control_chars_in_string")
+                out.append({"\n": "\\n", "\r": "\\r", "\t": "\\t"}[ch])
+                i += 1
+                continue
+            out.append(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch == ",":
+            j = i + 1
+            while j < n and text[j] in " \t\r\n":
+                j += 1
+            if j < n and text[j] in "}]":
+                if report is not None:
+                    report["repairs"].add("trailing_commas")
+                i += 1
+                continue
+        elif ch in "TFN" and (i == 0 or not (text[i - 1].isalnum() or text[i - 1] == "_")):
+            for literal, replacement in _LITERALS.items():
+                end = i + len(literal)
+                if text.startswith(literal, i) and (end >= n or not (text[end].isalnum() or text[end] == "_")):
+                    if report is not None:
+                        report["repairs"].add("python_literals")
+                    out.append(replacement)
+                    i = end
+                    break
+            else:
+                out.append(ch)
+                i += 1
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _scan_spans(text):
+    """
+    Finds the spans of every complete {...} object in the text, ignoring
+    brackets inside strings. Returns (spans sorted by start, unclosed stack).
+    """
+    spans = []
+    stack = []
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append((ch, i))
+        elif ch in "}]":
+            # Ignore stray closers that do not match the innermost opener
+            if stack and _CLOSERS[stack[-1][0]] == ch:
+                opener, start = stack.pop()
+                if opener == "{":
+                    spans.append((start, i + 1))
+    spans.sort()
+    return spans, stack
+
+
+def _loads(fragment, report):
+    try:
+        return json.loads(fragment)
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair_json_text(fragment, report))
+    except ValueError:
+        return None
+
+
+def _close_truncated(text, stack, report):
+    """
+    Attempts to turn a response that stops mid-object into valid JSON by
+    dropping the incomplete trailing member and closing the open brackets.
+    """
+    if not stack:
+        return None
+    body = text[stack[0][1]:]
+    for _ in range(8):
+        candidate = body.rstrip()
+        # A member cut off inside a string is incomplete: drop it rather than close the string
+        if not _in_open_string(candidate):
+            candidate = candidate.rstrip(",:")
+            closers = "".join(_CLOSERS[opener] for opener, _ in reversed(_scan_spans(candidate)[1]))
+            parsed = _loads(candidate + closers, report)
+            if isinstance(parsed, dict):
+                report["repairs"].add("closed_truncated_object")
+                return parsed
+        # Drop back to the previous member separator and try again
+        cut = max(body.rfind(","), body.rfind("{"), body.rfind("["))
+        if cut <= 0:
+            return None
+        body = body[:cut] if body[cut] == "," else body[:cut + 1]
+    return None
+
+
+def _in_open_string(text):
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+    return in_string
+
+
+def coerce_list(value):
+    """
+    Turns the object-instead-of-array shapes models produce into a flat list,
+    e.g. {"1": "a", "2": "b"} or [{"1": "a", "2": "b"}] -> ["a", "b"].
+    """
+    if isinstance(value, dict):
+        return list(value.values())
+    if isinstance(value, list) and value and all(isinstance(v, dict) for v in value):
+        flattened = []
+        for v in value:
+            flattened.extend(v.values())
+        return flattened
+    return value
+
+
+def parse_json_object(raw, list_fields=()):
+    """
+    Parses the main JSON object in an LLM response. Fields named in
+    `list_fields` are coerced to lists when the model returned an object.
+    Returns (obj or None, report).
+    """
+    report = _new_report()
+    text = strip_code_fences(raw or "", report)
+    spans, stack = _scan_spans(text)
+    report["truncated"] = any(opener == "{" for opener, _ in stack)
+
+    obj = None
+    outer_until = -1
+    for start, end in spans:
+        if start < outer_until:
+            continue
+        # Only outermost objects are candidates; the first one that parses wins
+        outer_until = end
+        parsed = _loads(text[start:end], report)
+        if isinstance(parsed, dict):
+            obj = parsed
+            break
+
+    if obj is None and report["truncated"]:
+        obj = _close_truncated(text, stack, report)
+
+    if obj is None:
+        return None, _finish_report(report)
+
+    for field in list_fields:
+        if field in obj:
+            coerced = coerce_list(obj[field])
+            if coerced is not obj[field]:
+                report["repairs"].add(f"{field}_as_list")
+                obj[field] = coerced
+
+    report["mode"] = "full" if "closed_truncated_object" not in report["repairs"] else "salvaged"
+    return obj, _finish_report(report)
+
+
+def _collect_items(value, is_item, items):
+    if isinstance(value, dict):
+        if is_item(value):
+            items.append(value)
+            return
+        for v in value.values():
+            _collect_items(v, is_item, items)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_items(v, is_item, items)
+
+
+def salvage_objects(raw, is_item):
+    """
+    Recovers every complete object for which `is_item(obj)` is true, in the
+    order they appear. If the response parses as a whole the items are taken
+    from the parsed structure; otherwise each intact object is parsed on its
+    own so that one broken or truncated item does not cost the others.
+    Returns (items, report).
+    """
+    report = _new_report()
+    text = strip_code_fences(raw or "", report)
+    spans, stack = _scan_spans(text)
+    report["truncated"] = any(opener == "{" for opener, _ in stack)
+
+    items = []
+    # Fast path: every top-level object is valid JSON
+    if spans and not report["truncated"]:
+        outers = []
+        outer_until = -1
+        for start, end in spans:
+            if start >= outer_until:
+                outers.append(_loads(text[start:end], report))
+                outer_until = end
+        if all(outer is not None for outer in outers):
+            for outer in outers:
+                _collect_items(outer, is_item, items)
+            if items:
+                report["mode"] = "full"
+                report["recovered"] = len(items)
+                return items, _finish_report(report)
+
+    accepted = []
+    failed = []
+    accepted_until = -1
+    for start, end in spans:
+        if start < accepted_until:
+            continue
+        parsed = _loads(text[start:end], report)
+        if isinstance(parsed, dict) and is_item(parsed):
+            items.append(parsed)
+            accepted.append(start)
+            accepted_until = end
+        elif parsed is None:
+            failed.append((start, end))
+
+    # A broken fragment only counts as lost if nothing inside it was recovered,
+    # and fragments nested inside a lost one are not counted twice
+    lost = [(s, e) for s, e in failed if not any(s < a < e for a in accepted)]
+    report["unparseable"] = sum(
+        1 for s, e in lost if not any(ls < s and e <= le for ls, le in lost)
+    )
+    report["recovered"] = len(items)
+    report["mode"] = "salvaged" if items else "failed"
+    if items or report["unparseable"] or report["truncated"]:
+        logger.info(
+            f"Salvaged {len(items)} object(s) from malformed LLM output "
+            f"({report['unparseable']} unparseable, truncated={report['truncated']})"
+        )
+    return items, _finish_report(report)
@@ -0,0 +1,286 @@
+import contextvars
+import hashlib
+import json
+import logging
+import math
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from time import perf_counter
+
+import ollama
+
+import llm_telemetry
+import request_deadline
+from config import (
+    OLLAMA_HOST, LLM_MAX_CONCURRENCY, LLM_BACKGROUND_CONCURRENCY, LLM_KEEP_ALIVE, LLM_COALESCE, LLM_CONTEXT_TOKENS, LLM_MODEL_CONTEXT_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for llama-style tokenizers on English/JSON text
+CHARS_PER_TOKEN = 4
+# Fraction of the context window a prompt plus its expected output may fill
+CONTEXT_SAFETY_MARGIN = 0.9
+
+_clients = {}
+_clients_lock = threading.Lock()
+# Bounds in-flight backend calls; time spent waiting here is reported as queue wait
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+# Background work (see start_background) first takes one of these, so it never holds
+# more than LLM_BACKGROUND_CONCURRENCY of the call slots and interactive calls keep the rest
+_background_slots = threading.BoundedSemaphore(max(LLM_BACKGROUND_CONCURRENCY, 1))
+_background = contextvars.ContextVar("llm_background", default=False)
+# Single-flight registry: request key -> Future of the call currently serving it
+_inflight = {}
+_inflight_lock = threading.Lock()
+# Deadline-clamped timeouts are rounded up to this step so only a few clients get cached
+TIMEOUT_STEP = 30
+
+
+class LLMCancelled(Exception):
+    """Raised when a call is abandoned because its cancel event was set."""
+
+
+class LLMDeadlineExceeded(LLMCancelled):
+    """Raised when the request deadline passes before or during a call."""
+
+
+def _check_deadline(deadline, model):
+    if deadline.cancelled():
+        raise LLMCancelled(f"{model} call cancelled: {deadline.reason}")
+    if deadline.expired():
+        raise LLMDeadlineExceeded(f"{model} call stopped: {request_deadline.DEADLINE_EXCEEDED}")
+
+
+def _clamp_timeout(timeout, deadline):
+    """Caps a call timeout at the time left on the request deadline."""
+    remaining = deadline.remaining()
+    if remaining == math.inf:
+        return timeout
+    clamped = math.ceil(remaining / TIMEOUT_STEP) * TIMEOUT_STEP
+    return clamped if timeout is None else min(timeout, clamped)
+
+
+def _acquire_slot(deadline, model, slots=_slots):
+    if deadline is None:
+        slots.acquire()
+        return
+    # Wait in short steps so a disconnect or deadline also ends the queue wait
+    while not slots.acquire(timeout=min(deadline.remaining(), 1.0) or 0.01):
+        _check_deadline(deadline, model)
+
+
+def start_background():
+    """
+    Marks LLM calls made from the current context, and from work submitted
+    from it, as background work with a bounded share of the call slots.
+    Returns a reset token for finish_background.
+    """
+    return _background.set(True)
+
+
+def finish_background(token):
+    _background.reset(token)
+
+
+def get_client(timeout=None):
+    """Returns a shared ollama client for the given request timeout."""
+    with _clients_lock:
+        client = _clients.get(timeout)
+        if client is None:
+            client = ollama.Client(host=OLLAMA_HOST, timeout=timeout)
+            _clients[timeout] = client
+        return client
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    executor.submit() that runs `fn` in a copy of the caller's context, so the
+    active telemetry job (and other context variables) follow work into threads.
+    """
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate used to size prompts without loading a tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def context_tokens(model):
+    """Context window (num_ctx) every call on `model` runs with."""
+    return LLM_MODEL_CONTEXT_TOKENS.get(model, LLM_CONTEXT_TOKENS)
+
+
+def model_options(model, options=None):
+    """
+    `options` with the model's num_ctx. Ollama reloads a model whenever num_ctx
+    changes, so every call on a model (and its warm-up) must use the same value;
+    it is set here rather than by the callers.
+    """
+    return dict(options or {}, num_ctx=context_tokens(model))
+
+
+def context_budget(num_ctx):
+    """Number of tokens a prompt and its output may use in a `num_ctx` window."""
+    return int(num_ctx * CONTEXT_SAFETY_MARGIN)
+
+
+def request_key(model, prompt, kwargs):
+    """Identity of a generation request: model, prompt and everything that shapes the output."""
+    payload = {"model": model, "prompt": prompt}
+    payload.update({k: kwargs.get(k) for k in ("system", "format", "options")})
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _wait_for(future, model, cancel_event):
+    """Waits for another caller's in-flight call while honouring this caller's own cancellation."""
+    deadline = request_deadline.current()
+    while True:
+        try:
+            return future.result(timeout=0.5)
+        except FutureTimeout:
+            if cancel_event is not None and cancel_event.is_set():
+                raise LLMCancelled(f"{model} call cancelled")
+            if deadline is not None:
+                _check_deadline(deadline, model)
+
+
+def generate(model, prompt, call_site="other", timeout=None, cancel_event=None, **kwargs):
+    """
+    Runs a prompt through an Ollama model and returns the generated text.
+
+    Concurrent identical requests (same request_key) are coalesced: the first
+    caller makes the backend call and the others wait for its result. If that
+    call is cancelled, a waiting caller that is still live reruns it itself.
+    See _generate for streaming, deadline and telemetry behaviour.
+    """
+    kwargs["options"] = model_options(model, kwargs.get("options"))
+    if not LLM_COALESCE:
+        return _generate(model, prompt, call_site, timeout, cancel_event, **kwargs)
+
+    key = request_key(model, prompt, kwargs)
+    while True:
+        with _inflight_lock:
+            future = _inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                _inflight[key] = future
+
+        if leader:
+            try:
+                result = _generate(model, prompt, call_site, timeout, cancel_event, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(result)
+                return result
+            finally:
+                with _inflight_lock:
+                    if _inflight.get(key) is future:
+                        del _inflight[key]
+
+        try:
+            result = _wait_for(future, model, cancel_event)
+        except LLMCancelled:
+            if future.done() and isinstance(future.exception(), LLMCancelled):
+                # The shared call was cancelled by its own caller, not by us
+                llm_telemetry.record_counter(model, call_site, "coalesce_reruns")
+                continue
+            raise
+        llm_telemetry.record_counter(model, call_site, "coalesced")
+        return result
+
+
+def _generate(model, prompt, call_site="other", timeout=None, cancel_event=None, **kwargs):
+    """
+    Runs a prompt through an Ollama model and returns the generated text.
+    The response is streamed so that setting `cancel_event` closes the
+    connection (and stops generation on the server) at the next chunk.
+    Token counts, durations and queue wait are recorded in llm_telemetry
+    under `call_site`. Models stay loaded for LLM_KEEP_ALIVE unless the
+    caller passes its own `keep_alive`. Pass fixed instructions as `system`
+    so consecutive calls share a prefix the backend can serve from its cache.
+
+    The current request deadline (see request_deadline) caps the timeout and
+    is checked between chunks: LLMDeadlineExceeded is raised once it passes
+    and LLMCancelled once the request is cancelled, e.g. on client disconnect.
+    """
+    kwargs.setdefault("keep_alive", LLM_KEEP_ALIVE)
+    full_prompt = (kwargs.get("system") or "") + prompt
+    deadline = request_deadline.current()
+    if deadline is not None:
+        _check_deadline(deadline, model)
+    queued = perf_counter()
+    background = _background.get()
+    if background:
+        _acquire_slot(deadline, model, _background_slots)
+    try:
+        _acquire_slot(deadline, model)
+    except BaseException:
+        if background:
+            _background_slots.release()
+        raise
+    try:
+        started = perf_counter()
+        final_chunk = None
+        error = None
+        parts = []
+        if deadline is not None:
+            timeout = _clamp_timeout(timeout, deadline)
+        try:
+            stream = get_client(timeout).generate(model=model, prompt=prompt, stream=True, **kwargs)
+            try:
+                for chunk in stream:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise LLMCancelled(f"{model} call cancelled")
+                    if deadline is not None:
+                        _check_deadline(deadline, model)
+                    parts.append(chunk['response'] or "")
+                    if chunk.get('done'):
+                        final_chunk = chunk
+            finally:
+                stream.close()
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            llm_telemetry.record_call(llm_telemetry.build_record(
+                model, call_site, len(full_prompt), final_chunk, queue_wait=started - queued,
+                wall=perf_counter() - started, error=error
+            ))
+    finally:
+        _slots.release()
+        if background:
+            _background_slots.release()
+    return "".join(parts).strip()
+
+
+def warm(model, timeout=None):
+    """
+    Loads `model` into memory (an empty prompt makes Ollama load it without
+    generating) and resets its keep-alive timer. It is loaded with the same
+    options as the real calls, since a different num_ctx makes Ollama reload
+    it. Returns the load time in seconds reported by the server.
+    """
+    started = perf_counter()
+    final_chunk = None
+    error = None
+    try:
+        stream = get_client(timeout).generate(
+            model=model, prompt="", stream=True, keep_alive=LLM_KEEP_ALIVE, options=model_options(model)
+        )
+        for chunk in stream:
+            final_chunk = chunk
+        if final_chunk is None:
+            raise RuntimeError(f"{model} warm-up returned an empty stream")
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        llm_telemetry.record_call(llm_telemetry.build_record(
+            model, "warmup", 0, final_chunk, wall=perf_counter() - started, error=error
+        ))
+    return (final_chunk.get('load_duration') or 0) / 1e9
@@ -0,0 +1,148 @@
+"""
+JSON schemas for every structured generation prompt.
+
+The schemas are passed to Ollama as the `format` option so the backend
+constrains decoding to valid output, and are checked again locally with
+`validate` because not every backend (or stub server) honours `format`.
+"""
+
+MCQ_QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        # Metadata is overwritten from the requested item, so its types are lenient
+        "class": {"type": ["string", "integer"]},
+        "subject": {"type": "string"},
+        "chapter": {"type": "string"},
+        "topic": {"type": "string"},
+        "subtopic": {"type": ["string", "null"]},
+        "question": {"type": "string", "minLength": 1},
+        "options": {
+            "type": "array",
+            "items": {"type": "string", "minLength": 1},
+            "minItems": 4,
+            "maxItems": 4
+        },
+        "correct_option": {"type": "integer", "minimum": 1, "maximum": 4}
+    },
+    "required": ["class", "subject", "chapter", "topic", "subtopic", "question", "options", "correct_option"]
+}
+
+PREREQ_ITEM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "number": {"type": "integer", "minimum": 1},
+        "chapter": {"type": "string", "minLength": 1},
+        "reason": {"type": "string"},
+        "for": {"type": "string"}
+    },
+    # "reason" and "for" fall back to defaults at the call site
+    "required": ["number", "chapter"]
+}
+
+FIB_WORKSHEET_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "paragraph": {"type": "string", "minLength": 1},
+        "word_bank": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "questions": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+        "answers": {"type": "array", "items": {"type": "string"}, "minItems": 1}
+    },
+    "required": ["paragraph", "word_bank", "questions", "answers"]
+}
+
+STUDY_SECTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "content": {"type": "string", "minLength": 1}
+    },
+    "required": ["content"]
+}
+
+
+def mcq_group_schema(num_items):
+    """Schema for one MCQ prompt: exactly one question per requested item."""
+    return {
+        "type": "object",
+        "properties": {
+            "questions": {
+                "type": "array",
+                "items": MCQ_QUESTION_SCHEMA,
+                "minItems": num_items,
+                "maxItems": num_items
+            }
+        },
+        "required": ["questions"]
+    }
+
+
+def prereq_list_schema(subject):
+    """Schema for the prerequisite prompt, keyed by the subject being asked about."""
+    return {
+        "type": "object",
+        "properties": {
+            "prerequisites": {
+                "type": "object",
+                "properties": {
+                    subject: {"type": "array", "items": PREREQ_ITEM_SCHEMA}
+                },
+                "required": [subject]
+            }
+        },
+        "required": ["prerequisites"]
+    }
+
+
+_TYPE_CHECKS = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def validate(instance, schema, path="$"):
+    """
+    Validates `instance` against the subset of JSON Schema used above
+    (type, properties, required, items, enum, min/max, minLength, min/maxItems).
+    Returns a list of error messages; an empty list means the instance is valid.
+    """
+    errors = []
+    expected = schema.get("type")
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPE_CHECKS[t](instance) for t in types):
+            return [f"{path}: expected {' or '.join(types)}, got {type(instance).__name__}"]
+
+    if "enum" in schema and instance not in schema["enum"]:
+        errors.append(f"{path}: {instance!r} is not one of {schema['enum']}")
+
+    if isinstance(instance, dict):
+        for key in schema.get("required", []):
+            if key not in instance:
+                errors.append(f"{path}: missing required key '{key}'")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in instance:
+                errors.extend(validate(instance[key], subschema, f"{path}.{key}"))
+
+    if isinstance(instance, list):
+        if "minItems" in schema and len(instance) < schema["minItems"]:
+            errors.append(f"{path}: expected at least {schema['minItems']} items, got {len(instance)}")
+        if "maxItems" in schema and len(instance) > schema["maxItems"]:
+            errors.append(f"{path}: expected at most {schema['maxItems']} items, got {len(instance)}")
+        if "items" in schema:
+            for i, item in enumerate(instance):
+                errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+
+    if isinstance(instance, str) and "minLength" in schema and len(instance.strip()) < schema["minLength"]:
+        errors.append(f"{path}: string is shorter than {schema['minLength']}")
+
+    if _TYPE_CHECKS["number"](instance):
+        if "minimum" in schema and instance < schema["minimum"]:
+            errors.append(f"{path}: {instance} is below the minimum {schema['minimum']}")
+        if "maximum" in schema and instance > schema["maximum"]:
+            errors.append(f"{path}: {instance} is above the maximum {schema['maximum']}")
+
+    return errors
@@ -0,0 +1,205 @@
+"""
+Per-call LLM telemetry.
+
+Every call made through llm_client is recorded here with its model, call
+site, prompt size, token counts, load/eval durations and queue wait.
+Aggregates are kept as histograms (rendered in Prometheus text format for
+the /metrics endpoint) and, when a job is active in the current context,
+summed into that job's summary.
+"""
+import contextvars
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+from time import time
+
+# Upper bucket bounds per metric; +Inf is implicit
+BUCKETS = {
+    "prompt_chars": (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000),
+    "prompt_tokens": (128, 256, 512, 1024, 2048, 4096, 8192),
+    "completion_tokens": (16, 64, 128, 256, 512, 1024, 2048, 4096),
+    "queue_wait_seconds": (0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+    "load_seconds": (0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30),
+    "prompt_eval_seconds": (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    "eval_seconds": (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+    "eval_rate_tokens_per_second": (1, 5, 10, 20, 40, 80, 160),
+    "wall_seconds": (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+}
+
+MAX_RECENT_JOBS = 100
+
+_lock = threading.Lock()
+_histograms = {}
+_counters = defaultdict(int)
+_recent_jobs = OrderedDict()
+_current_job = contextvars.ContextVar("llm_job", default=None)
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+
+def _ns_to_seconds(value):
+    return (value or 0) / 1e9
+
+
+def build_record(model, call_site, prompt_chars, final_chunk=None, queue_wait=0.0, wall=0.0, error=None):
+    """
+    Turns the final streamed chunk of an Ollama response into a telemetry record.
+    prompt_tokens is Ollama's prompt_eval_count: the tokens it evaluated, which
+    leaves out a prefix served from its cache.
+    """
+    chunk = final_chunk or {}
+    prompt_tokens = chunk.get("prompt_eval_count") or 0
+    eval_count = chunk.get("eval_count") or 0
+    eval_seconds = _ns_to_seconds(chunk.get("eval_duration"))
+    return {
+        "model": model,
+        "call_site": call_site,
+        "prompt_chars": prompt_chars,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": eval_count,
+        "queue_wait_seconds": queue_wait,
+        "load_seconds": _ns_to_seconds(chunk.get("load_duration")),
+        "prompt_eval_seconds": _ns_to_seconds(chunk.get("prompt_eval_duration")),
+        "eval_seconds": eval_seconds,
+        "eval_rate_tokens_per_second": eval_count / eval_seconds if eval_seconds else 0.0,
+        "wall_seconds": wall,
+        "error": error,
+    }
+
+
+def record_counter(model, call_site, name, amount=1):
+    """Increments a named counter (e.g. "coalesced") for a model/call site and the active job."""
+    with _lock:
+        _counters[(model, call_site, name)] += amount
+    job = _current_job.get()
+    if job is not None:
+        with job["lock"]:
+            job["counters"][name] += amount
+
+
+def record_call(record):
+    """Adds a call record to the process histograms and the active job, if any."""
+    labels = (record["model"], record["call_site"])
+    with _lock:
+        _counters[labels + ("calls",)] += 1
+        if record["error"]:
+            _counters[labels + ("errors",)] += 1
+        for metric, bounds in BUCKETS.items():
+            # Token and duration fields are absent for failed calls
+            if record["error"] and metric not in ("prompt_chars", "queue_wait_seconds", "wall_seconds"):
+                continue
+            key = labels + (metric,)
+            if key not in _histograms:
+                _histograms[key] = Histogram(bounds)
+            _histograms[key].observe(record[metric])
+
+    job = _current_job.get()
+    if job is not None:
+        with job["lock"]:
+            job["calls"].append(record)
+
+
+def start_job(name):
+    """Starts collecting call records for the current context. Returns a reset token."""
+    job = {
+        "id": uuid.uuid4().hex[:12], "name": name, "started": time(),
+        "calls": [], "counters": defaultdict(int), "lock": threading.Lock()
+    }
+    return job, _current_job.set(job)
+
+
+def current_job():
+    return _current_job.get()
+
+
+def finish_job(job, token):
+    """Stops collecting for the job and keeps its summary if it made (or shared) any LLM calls."""
+    _current_job.reset(token)
+    if not job["calls"] and not job["counters"]:
+        return None
+    summary = summarize_job(job)
+    with _lock:
+        _recent_jobs[job["id"]] = summary
+        while len(_recent_jobs) > MAX_RECENT_JOBS:
+            _recent_jobs.popitem(last=False)
+    return summary
+
+
+def summarize_job(job):
+    with job["lock"]:
+        calls = list(job["calls"])
+        counters = dict(job["counters"])
+    by_site = defaultdict(lambda: defaultdict(float))
+    for call in calls:
+        site = by_site[f"{call['model']}/{call['call_site']}"]
+        site["calls"] += 1
+        site["errors"] += 1 if call["error"] else 0
+        for field in ("prompt_chars", "prompt_tokens", "completion_tokens", "queue_wait_seconds",
+                      "load_seconds", "prompt_eval_seconds", "eval_seconds", "wall_seconds"):
+            site[field] += call[field]
+    return {
+        "id": job["id"],
+        "name": job["name"],
+        "started": job["started"],
+        "duration_seconds": round(time() - job["started"], 3),
+        "calls": len(calls),
+        "counters": counters,
+        "by_call_site": {key: {k: round(v, 3) for k, v in values.items()} for key, values in by_site.items()},
+    }
+
+
+def recent_jobs():
+    with _lock:
+        return list(reversed(_recent_jobs.values()))
+
+
+def get_job(job_id):
+    with _lock:
+        return _recent_jobs.get(job_id)
+
+
+def render_prometheus():
+    """Renders counters and histograms in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(h.counts), h.total, h.count, h.bounds) for key, h in _histograms.items()}
+
+    # coalesced: calls answered by an identical in-flight call instead of the backend;
+    # coalesce_reruns: waiting callers that had to rerun because that call was cancelled
+    for name in ("calls", "errors", "coalesced", "coalesce_reruns"):
+        lines.append(f"# TYPE llm_{name}_total counter")
+        for (model, site, counter), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f'llm_{name}_total{{model="{model}",call_site="{site}"}} {value}')
+
+    for metric in BUCKETS:
+        lines.append(f"# TYPE llm_{metric} histogram")
+        for (model, site, name), (counts, total, count, bounds) in sorted(histograms.items()):
+            if name != metric:
+                continue
+            labels = f'model="{model}",call_site="{site}"'
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'llm_{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'llm_{metric}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"llm_{metric}_sum{{{labels}}} {total}")
+            lines.append(f"llm_{metric}_count{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
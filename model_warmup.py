@@ -0,0 +1,79 @@
+"""
+Startup warm-up and keep-alive for the configured Ollama models.
+
+A background thread loads every model in LLM_WARMUP_MODELS once at startup
+and then re-warms them every LLM_REWARM_INTERVAL seconds, which also resets
+Ollama's keep-alive timer. The per-model status backs the /health readiness
+endpoint so traffic is only routed here once the models are resident.
+"""
+import logging
+import threading
+from time import time
+
+import llm_client
+from config import LLM_WARMUP_MODELS, LLM_REWARM_INTERVAL, LLM_WARMUP_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_status = {
+    model: {"ready": False, "last_warmed": None, "load_seconds": None, "error": None}
+    for model in LLM_WARMUP_MODELS
+}
+_thread = None
+_stop = threading.Event()
+
+
+def warm_model(model):
+    """Warms one model and updates its status. Returns True on success."""
+    try:
+        load_seconds = llm_client.warm(model, timeout=LLM_WARMUP_TIMEOUT)
+    except Exception as e:
+        logger.warning(f"⚠️ Warm-up failed for {model}: {e}")
+        with _lock:
+            _status[model].update(ready=False, error=str(e))
+        return False
+
+    with _lock:
+        _status[model].update(ready=True, last_warmed=time(), load_seconds=round(load_seconds, 3), error=None)
+    logger.info(f"🔥 {model} is loaded (load took {load_seconds:.2f}s)")
+    return True
+
+
+def warm_all():
+    return all([warm_model(model) for model in LLM_WARMUP_MODELS])
+
+
+def _run():
+    # Failed models are retried quickly until everything is resident once
+    while not _stop.is_set():
+        ready = warm_all()
+        if LLM_REWARM_INTERVAL <= 0 and ready:
+            return
+        _stop.wait(LLM_REWARM_INTERVAL if ready and LLM_REWARM_INTERVAL > 0 else 30)
+
+
+def start():
+    """Starts the warm-up thread once per process."""
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_run, name="model-warmup", daemon=True)
+        _thread.start()
+    logger.info(f"Warming models in the background: {', '.join(LLM_WARMUP_MODELS)}")
+
+
+def stop():
+    _stop.set()
+
+
+def started():
+    return _thread is not None
+
+
+def readiness():
+    """Returns (ready, per-model status)."""
+    with _lock:
+        snapshot = {model: dict(status) for model, status in _status.items()}
+    return all(status["ready"] for status in snapshot.values()), snapshot
@@ -65,6 +65,10 @@ FORM_HTML = """
                     <td><label for="mat">MAT:</label></td>
                     <td><input type="number" id="mat" name="mat" value="40" min="0" max="100"></td>
                 </tr>
+                <tr>
+                    <td><label for="copies">Copies:</label></td>
+                    <td><input type="number" id="copies" name="copies" value="1" min="1" max="500"></td>
+                </tr>
                 <tr class="submit-row">
                     <td colspan="2">
                         <input type="submit" value="Generate OMR Sheet">
@@ -89,13 +93,16 @@ def index():
                 int(request.form['chemistry']),
                 int(request.form['mat'])
             ]
+            copies = int(request.form.get('copies') or 1)
             if sum(subject_questions) == 0:
                 return "Please enter at least one question.", 400
+            if not 1 <= copies <= 500:
+                return "Copies must be between 1 and 500.", 400
         except Exception:
             return "Invalid input.", 400
 
         pdf = OMRGenerator(subject_questions)
-        pdf_bytes = pdf.generate()
+        pdf_bytes = pdf.generate(copies=copies)
         return Response(pdf_bytes, mimetype='application/pdf',
                         headers={"Content-Disposition": "attachment;filename=omr_sheet.pdf"})
     return render_template_string(FORM_HTML)
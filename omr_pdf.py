@@ -1,86 +1,163 @@
-from fpdf import FPDF
-
-class OMRGenerator(FPDF):
-    def __init__(self, subject_questions):
-        super().__init__()
-        self.subjects = ["Mathematics-1", "Mathematics-2", "Physics", "Chemistry", "MAT"]
-        self.subject_questions = subject_questions  # List of 5 integers
+"""
+OMR answer sheet PDF, drawn on the shared rendering layer (see pdf_engine).
+
+All positions are in millimetres from the top-left corner of an A4 page
+(MMCanvas); the bubble positions are what OMR_Template.py's template is
+calibrated against, so they must not move.
+
+The question pages of a configuration (question count per subject) are laid
+out once by omr_layout: the origins of the question numbers and a single
+precomputed path of all the bubbles of each page. Everything else on a page
+(corner markers, title, instructions, admission grid, column headings) is
+drawn once per document into a form that every page places, so a sheet
+with several pages, or many copies of it, repeats only references to it.
+"""
+import functools
+import io
+from collections import namedtuple
+
+import pdf_engine
+
+DEFAULT_SUBJECTS = ["Mathematics-1", "Mathematics-2", "Physics", "Chemistry", "MAT"]
+# Subject columns that fit across the page (10 mm of question number and four 6 mm bubbles each)
+MAX_SUBJECTS = 5
+
+PAGE_WIDTH = 210
+PAGE_HEIGHT = 297
+BUBBLE_DIAMETER = 4.5
+OPTIONS = ['a', 'b', 'c', 'd']
+
+# Question grid: columns across 170 mm from x = 20, rows 6 mm apart below the column headings
+X_START = 20
+Y_START_FIRST = 145
+Y_START_OTHERS = 40
+TOTAL_WIDTH = 170
+ROW_HEIGHT = 6
+NUMBER_FONT = ("Helvetica", 7)
+
+# Forms holding the static parts of the first and the following pages
+FIRST_PAGE_FORM = "omr_first_page"
+NEXT_PAGE_FORM = "omr_next_page"
+
+# One page of questions: where its column headings go (y), the question numbers as
+# (x, y, text) with origins in points, and the path of all its bubbles
+OMRPage = namedtuple("OMRPage", "y_start numbers bubbles")
+
+
+@functools.lru_cache(maxsize=32)
+def omr_layout(subject_questions):
+    """
+    The question pages for these question counts per subject (a tuple), each
+    subject's questions numbered from Q001 down its column, continuing on
+    further pages until every subject's questions are placed.
+    """
+    col_width = TOTAL_WIDTH / len(subject_questions)
+    question_indices = [0] * len(subject_questions)
+    pages = []
+    finished = False
+
+    while not finished:
+        y_start = Y_START_FIRST if not pages else Y_START_OTHERS
+        numbers, boxes = [], []
+        max_rows = int((PAGE_HEIGHT - (y_start + 12) - 35) // ROW_HEIGHT)
+
+        for row in range(max_rows):
+            y = y_start + 12 + row * ROW_HEIGHT
+            for section, count in enumerate(subject_questions):
+                if question_indices[section] < count:
+                    x = X_START + section * col_width
+                    question_indices[section] += 1
+                    text = f"Q{question_indices[section]:03d}"
+                    numbers.append(pdf_engine.cell_origin(x, y, 10, 5, text, NUMBER_FONT, PAGE_HEIGHT) + (text,))
+                    boxes.extend((x + 10 + o * 6, y + 2.5, BUBBLE_DIAMETER, BUBBLE_DIAMETER) for o in range(len(OPTIONS)))
+            if all(qi >= sq for qi, sq in zip(question_indices, subject_questions)):
+                finished = True
+                break
+        pages.append(OMRPage(y_start, tuple(numbers), pdf_engine.ellipse_path(boxes, PAGE_HEIGHT)))
+    return tuple(pages)
+
+
+@functools.lru_cache(maxsize=1)
+def admission_bubbles(block_x, grid_y, cols, rows, col_width, row_height):
+    """Path of the admission number grid's bubbles: one per digit (row) and position (column)."""
+    boxes = []
+    for row in range(rows):
+        cy = grid_y + row_height * (row + 1) + row_height / 2
+        for col in range(cols):
+            cx = block_x + col_width * (col + 1) + col_width / 2
+            boxes.append((cx - BUBBLE_DIAMETER / 2, cy - BUBBLE_DIAMETER / 2, BUBBLE_DIAMETER, BUBBLE_DIAMETER))
+    return pdf_engine.ellipse_path(boxes, PAGE_HEIGHT)
+
+
+class OMRGenerator:
+    def __init__(self, subject_questions, subjects=None):
+        self.subjects = list(subjects or DEFAULT_SUBJECTS)
+        if len(self.subjects) > MAX_SUBJECTS:
+            raise ValueError(f"An OMR sheet has room for at most {MAX_SUBJECTS} subjects, got {len(self.subjects)}")
+        if len(subject_questions) != len(self.subjects):
+            raise ValueError("Expected one question count per subject")
+        self.subject_questions = subject_questions  # One integer per subject
         self.total_questions = sum(subject_questions)
-        self.bubble_diameter = 4.5
-        self.page_height = 297
-        self.page_width = 210
-        self.set_auto_page_break(auto=False)
-        self.set_font("Helvetica", "", 8)
-        self.options = ['a', 'b', 'c', 'd']
+        self.bubble_diameter = BUBBLE_DIAMETER
+        self.page_height = PAGE_HEIGHT
+        self.page_width = PAGE_WIDTH
+        self.options = OPTIONS
+        self.pdf = None
 
     def header(self):
         img_size = 15
         # Top corners
-        self.image("img1.jpg", x=10, y=10, w=img_size, h=img_size)
-        self.image("img1.jpg", x=self.page_width - img_size - 10, y=10, w=img_size, h=img_size)
+        self.pdf.image("img1.jpg", 10, 10, img_size, img_size)
+        self.pdf.image("img1.jpg", self.page_width - img_size - 10, 10, img_size, img_size)
         # Bottom corners (adjusted upward to prevent overlap with signatures)
-        self.image("img1.jpg", x=10, y=self.page_height - img_size - 5, w=img_size, h=img_size)
-        self.image("img1.jpg", x=self.page_width - img_size - 10, y=self.page_height - img_size - 5, w=img_size, h=img_size)
+        self.pdf.image("img1.jpg", 10, self.page_height - img_size - 5, img_size, img_size)
+        self.pdf.image("img1.jpg", self.page_width - img_size - 10, self.page_height - img_size - 5, img_size, img_size)
 
-        self.set_font("Helvetica", "B", 12)
-        self.set_xy(0, 20)
-        self.cell(self.page_width, 10, "OMR Answer Sheet", 0, 1, "C")
+        self.pdf.set_font("Helvetica-Bold", 12)
+        self.pdf.cell(0, 20, self.page_width, 10, "OMR Answer Sheet", align="C")
 
     def add_instructions(self):
-        self.set_font("Helvetica", "", 8)
-        self.set_xy(90, 30)
-        self.cell(0, 5, "Instructions for filling the sheet:", 0, 2)
+        self.pdf.set_font("Helvetica", 8)
+        x, width = 90, self.page_width - 10 - 90  # to the right margin
+        self.pdf.cell(x, 30, width, 5, "Instructions for filling the sheet:")
         instructions = [
             "- Circle should be darkened completely.",
             "- Don't fold the sheet. Answer once marked cannot be changed.",
             "- Use only ball pen to darken the appropriate circle.",
             "- Only use UPPER CASE CAPITAL LETTER ALPHABETS in the boxes."
         ]
-        for line in instructions:
-            self.cell(0, 4, line, 0, 2)
+        for i, line in enumerate(instructions):
+            self.pdf.cell(x, 35 + 4 * i, width, 4, line)
 
     def add_student_info_fields(self):
+        pdf = self.pdf
         block_x = 10
         block_y = 55
         cols = 8
         rows = 10
         col_width = 7
         row_height = 7
-        bubble_dia = 4.5
+        grid_y = block_y + 8
 
-        self.set_font("Helvetica", "B", 10)
-        self.set_xy(block_x, block_y)
-        self.cell(col_width * (cols + 1), 8, "Admission Number", 0, 2, 'C')
+        pdf.set_font("Helvetica-Bold", 10)
+        pdf.cell(block_x, block_y, col_width * (cols + 1), 8, "Admission Number", align="C")
 
-        self.set_font("Helvetica", "", 7)
-        self.set_xy(block_x + col_width, block_y + 8)
+        pdf.set_font("Helvetica", 7)
         for col in range(cols):
-            self.cell(col_width, row_height, f"D{col+1}", 0, 0, 'C')
-        self.ln(row_height)
-
+            pdf.cell(block_x + col_width * (col + 1), grid_y, col_width, row_height, f"D{col+1}", align="C")
         for row in range(rows):
-            self.set_xy(block_x, block_y + 8 + row_height * (row + 1))
-            self.cell(col_width, row_height, str(row), 0, 0, 'C')
-            for col in range(cols):
-                cx = block_x + col_width * (col + 1) + col_width / 2
-                cy = block_y + 8 + row_height * (row + 1) + row_height / 2
-                self.cell(col_width, row_height, "", 0, 0)
-                self.ellipse(cx - bubble_dia/2, cy - bubble_dia/2, bubble_dia, bubble_dia)
+            pdf.cell(block_x, grid_y + row_height * (row + 1), col_width, row_height, str(row), align="C")
+        pdf.stroke_literal(admission_bubbles(block_x, grid_y, cols, rows, col_width, row_height))
 
-        self.set_draw_color(0, 0, 0)
-        self.rect(block_x, block_y + 8, col_width * (cols + 1), row_height * (rows + 1))
+        pdf.rect(block_x, grid_y, col_width * (cols + 1), row_height * (rows + 1))
 
         for col in range(cols + 1):
             x = block_x + col_width * col
-            y1 = block_y + 8
-            y2 = block_y + 8 + row_height * (rows + 1)
-            self.line(x, y1, x, y2)
+            pdf.line(x, grid_y, x, grid_y + row_height * (rows + 1))
 
         for row in range(rows + 2):
-            y = block_y + 8 + row_height * row
-            x1 = block_x
-            x2 = block_x + col_width * (cols + 1)
-            self.line(x1, y, x2, y)
+            y = grid_y + row_height * row
+            pdf.line(block_x, y, block_x + col_width * (cols + 1), y)
 
         info_x = block_x + col_width * (cols + 1) + 10
         info_y = block_y
@@ -88,99 +165,76 @@ class OMRGenerator(FPDF):
         left_width = 60
         right_width = 50
 
-        self.set_xy(info_x, info_y)
-        self.set_font("Helvetica", "", 8)
-        self.cell(name_width, 8, "Student Name", 1, 2, 'C')
-        self.set_x(info_x)
-        self.cell(name_width, 8, "", 1, 2)
-
-        self.set_x(info_x)
-        self.cell(left_width, 8, "Exam Name", 1, 0, 'C')
-        self.cell(right_width, 8, "Class (6,7,8,9)", 1, 2, 'C')
-        self.set_x(info_x)
-        self.cell(left_width, 8, "", 1, 0)
-        self.cell(right_width, 8, "", 1, 2)
-
-        self.set_x(info_x)
-        self.cell(left_width, 8, "Section", 1, 0, 'C')
-        self.cell(right_width, 8, "Date", 1, 2, 'C')
-        self.set_x(info_x)
-        self.cell(left_width, 8, "", 1, 0)
-        self.cell(right_width, 8, "", 1, 2)
+        pdf.set_font("Helvetica", 8)
+        pdf.cell(info_x, info_y, name_width, 8, "Student Name", border=True, align="C")
+        pdf.cell(info_x, info_y + 8, name_width, 8, border=True)
+        for i, (left, right) in enumerate([("Exam Name", "Class (6,7,8,9)"), ("Section", "Date")]):
+            y = info_y + 16 + 16 * i
+            pdf.cell(info_x, y, left_width, 8, left, border=True, align="C")
+            pdf.cell(info_x + left_width, y, right_width, 8, right, border=True, align="C")
+            pdf.cell(info_x, y + 8, left_width, 8, border=True)
+            pdf.cell(info_x + left_width, y + 8, right_width, 8, border=True)
 
     def add_signature_fields(self):
-        self.set_y(self.page_height - 20)
-        self.set_font("Helvetica", "", 8)
+        y = self.page_height - 20
+        self.pdf.set_font("Helvetica", 8)
 
         signature_width = 80
         spacing = 20
         total_width = 2 * signature_width + spacing
         x_start = (self.page_width - total_width) / 2
 
-        self.set_x(x_start)
-        self.cell(signature_width, 5, "Invigilator's Signature: _________________", 0, 0, 'C')
-        self.cell(spacing, 5, "", 0, 0)
-        self.cell(signature_width, 5, "Student's Signature: _________________", 0, 1, 'C')
-
-    def add_question_bubbles(self):
-        x_start = 20
-        y_start_first = 145
-        y_start_others = 40
-        total_width = 170
-        col_width = total_width / len(self.subjects)
-        row_height = 6
-
-        max_questions = max(self.subject_questions)
-        question_indices = [0] * len(self.subjects)
-        page = 1
-        finished = False
-
-        while not finished:
-            if page == 1:
-                y_start = y_start_first
-            else:
-                self.add_page()
-                y_start = y_start_others
-
-            self.set_font("Helvetica", "B", 8)
-            for i, subject in enumerate(self.subjects):
-                self.set_xy(x_start + i*col_width, y_start)
-                self.cell(col_width, 6, subject, 0, 0, 'C')
-
-            self.set_font("Helvetica", "", 7)
-            for i in range(len(self.subjects)):
-                x = x_start + i*col_width
-                for j, opt in enumerate(self.options):
-                    self.set_xy(x + 10 + j*6, y_start + 6)
-                    self.cell(6, 5, opt, 0, 0, 'C')
-
-            max_rows = int((self.page_height - (y_start + 12) - 35) // row_height)
-
-            for row in range(max_rows):
-                any_drawn = False
-                for section in range(len(self.subjects)):
-                    if question_indices[section] < self.subject_questions[section]:
-                        x = x_start + section*col_width
-                        y = y_start + 12 + row*row_height
-                        qnum = question_indices[section] + 1
-                        self.set_xy(x, y)
-                        self.set_font("Helvetica", "", 7)
-                        self.cell(10, 5, f"Q{qnum:03d}", 0, 0)
-                        for o in range(len(self.options)):
-                            bx = x + 10 + o*6
-                            by = y + 2.5
-                            self.ellipse(bx, by, self.bubble_diameter, self.bubble_diameter)
-                        question_indices[section] += 1
-                        any_drawn = True
-                if all(qi >= sq for qi, sq in zip(question_indices, self.subject_questions)):
-                    finished = True
-                    break
-            page += 1
-
-    def generate(self):
-        self.add_page()
+        self.pdf.cell(x_start, y, signature_width, 5, "Invigilator's Signature: _________________", align="C")
+        self.pdf.cell(x_start + signature_width + spacing, y, signature_width, 5, "Student's Signature: _________________", align="C")
+
+    def add_column_headings(self, y_start):
+        pdf = self.pdf
+        col_width = TOTAL_WIDTH / len(self.subjects)
+        pdf.set_font("Helvetica-Bold", 8)
+        for i, subject in enumerate(self.subjects):
+            pdf.cell(X_START + i*col_width, y_start, col_width, 6, subject, align="C")
+
+        pdf.set_font("Helvetica", 7)
+        for i in range(len(self.subjects)):
+            x = X_START + i*col_width
+            for j, opt in enumerate(self.options):
+                pdf.cell(x + 10 + j*6, y_start + 6, 6, 5, opt, align="C")
+
+    def add_page_forms(self, pages):
+        """Draws the static parts of the first page, and of the following ones if any, into forms."""
+        self.pdf.begin_form(FIRST_PAGE_FORM)
+        self.header()
         self.add_instructions()
         self.add_student_info_fields()
-        self.add_question_bubbles()
-        self.add_signature_fields()
-        return self.output(dest='S').encode('latin-1')
+        self.add_column_headings(Y_START_FIRST)
+        self.pdf.end_form()
+        if len(pages) > 1:
+            self.pdf.begin_form(NEXT_PAGE_FORM)
+            self.header()
+            self.add_column_headings(Y_START_OTHERS)
+            self.pdf.end_form()
+
+    def add_question_pages(self, pages):
+        pdf = self.pdf
+        for i, page in enumerate(pages):
+            if i:
+                pdf.show_page()
+            pdf.do_form(NEXT_PAGE_FORM if i else FIRST_PAGE_FORM)
+            pdf.set_font(*NUMBER_FONT)
+            pdf.texts(page.numbers)
+            pdf.stroke_literal(page.bubbles)
+
+    def generate(self, copies=1):
+        """The sheet as PDF bytes, `copies` times over (each copy starts on a new page)."""
+        pages = omr_layout(tuple(self.subject_questions))
+        buffer = io.BytesIO()
+        c = pdf_engine.new_canvas(buffer, title="OMR Answer Sheet")
+        self.pdf = pdf_engine.MMCanvas(c, self.page_height)
+        self.add_page_forms(pages)
+        for copy in range(copies):
+            if copy:
+                self.pdf.show_page()
+            self.add_question_pages(pages)
+            self.add_signature_fields()
+        c.save()
+        return buffer.getvalue()
@@ -0,0 +1,75 @@
+"""
+PDF rendering of question papers (Question.pdf) and their answer keys, on
+the shared rendering layer (see pdf_engine).
+
+cached_paper_pdf renders a paper when it is first downloaded, once per
+distinct paper and show_metadata flag (see pdf_cache); cached_answer_key_pdf
+does the same for its answer key.
+"""
+from reportlab.platypus import Spacer
+
+import pdf_cache
+import pdf_engine
+from pdf_engine import PlainText
+
+# Bump when the layout changes so cached PDFs are re-rendered
+PDF_KIND = "question_paper_v2"
+ANSWER_KEY_KIND = "answer_key_v1"
+
+
+def correct_option_text(q):
+    correct_num = q.get("correct_option")
+    options = q.get("options", [])
+    if correct_num and 1 <= correct_num <= len(options):
+        return options[correct_num - 1]
+    return "N/A"
+
+
+def generate_pdf(data, output_pdf, show_metadata=True, show_answers=True, title="Generated Question Paper"):
+    """Question paper for `data` ({"questions": [...]}); answers are printed under each question unless show_answers is False."""
+    styles = pdf_engine.stylesheet()
+    story = [PlainText(title, styles["PaperTitle"])]
+
+    for idx, q in enumerate(data.get("questions", []), start=1):
+        if(show_metadata):
+            tag_line = f"[Class: {q.get('class')}] [Subject: {q.get('subject')}] [Chapter: {q.get('chapter')}] [Topic: {q.get('topic')}]"
+            if q.get("subtopic"):
+                tag_line += f" [Subtopic: {q.get('subtopic')}]"
+            story.append(PlainText(tag_line, styles["PaperMeta"]))
+
+        story.append(PlainText(f"{idx}. {q.get('question')}", styles["PaperQuestion"]))
+        for opt in q.get("options", []):
+            story.append(PlainText(opt, styles["PaperOption"]))
+
+        if show_answers:
+            story.append(PlainText(f"Correct Answer: {correct_option_text(q)}", styles["PaperAnswer"]))
+        story.append(Spacer(1, 17))
+
+    pdf_engine.build_document(output_pdf, story, "paper", title=title)
+
+
+def generate_answer_key_pdf(data, output_pdf, title="Answer Key"):
+    """One line per question: its number, the correct option and, for variants, the question's number in the original paper."""
+    styles = pdf_engine.stylesheet()
+    story = [PlainText(title, styles["PaperTitle"])]
+
+    for idx, q in enumerate(data.get("questions", []), start=1):
+        line = f"{idx}. Option {q.get('correct_option', 'N/A')}: {correct_option_text(q)}"
+        if q.get("original_number"):
+            line += f"  (Q{q['original_number']} of the original paper)"
+        story.append(PlainText(line, styles["PaperKeyLine"]))
+
+    pdf_engine.build_document(output_pdf, story, "paper", title=title)
+
+
+def cached_paper_pdf(data, show_metadata=True):
+    """(path, key) of the cached question paper PDF for `data`, rendering it on first use."""
+    return pdf_cache.get_or_render(
+        PDF_KIND, {"paper": data, "show_metadata": show_metadata},
+        lambda path: generate_pdf(data, path, show_metadata),
+    )
+
+
+def cached_answer_key_pdf(data):
+    """(path, key) of the cached answer key PDF for `data`, rendering it on first use."""
+    return pdf_cache.get_or_render(ANSWER_KEY_KIND, data, lambda path: generate_answer_key_pdf(data, path))
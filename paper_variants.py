@@ -0,0 +1,163 @@
+"""
+Shuffled variants of a finalized question paper (exam sets A/B/C/D or one per
+student) with matching answer keys.
+
+Each variant is drawn from its own seed, derived from the paper seed and the
+variant label, so a set can be regenerated on its own. A variant is a
+question order plus one option order per question: index lists into the
+original paper. The options are reordered through these lists, their
+"1. " numbering is rewritten to the new positions and `correct_option` is
+remapped to wherever the correct option landed.
+
+build_variant_archive renders every variant's paper and answer key in the
+shared pool of worker processes (pdf_engine.render_all) and returns them in
+one zip with answer_keys.json, which records the
+seeds and index lists of every set.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import zipfile
+
+import pdf_engine
+from paper_pdf import generate_answer_key_pdf, generate_pdf
+
+logger = logging.getLogger(__name__)
+
+OPTION_NUMBER = re.compile(r'^\s*\d+\.\s*')
+
+def variant_labels(count):
+    """A, B, ..., Z, AA, AB, ... for `count` sets."""
+    labels = []
+    for n in range(1, count + 1):
+        label = ""
+        while n:
+            n, rem = divmod(n - 1, 26)
+            label = chr(ord("A") + rem) + label
+        labels.append(label)
+    return labels
+
+
+def paper_seed(paper):
+    """Default seed of a paper: the same questions always give the same sets."""
+    data = json.dumps(paper.get("questions", []), sort_keys=True, ensure_ascii=False)
+    return int(hashlib.sha256(data.encode("utf-8")).hexdigest()[:12], 16)
+
+
+def variant_seed(seed, label):
+    # Not hash(): string hashing is randomized per process
+    return int(hashlib.sha256(f"{seed}:{label}".encode("utf-8")).hexdigest()[:16], 16)
+
+
+def _order(rng, size, shuffle):
+    order = list(range(size))
+    if shuffle:
+        rng.shuffle(order)
+    return order
+
+
+def _renumber(option, position):
+    if OPTION_NUMBER.match(option):
+        return f"{position}. {OPTION_NUMBER.sub('', option, count=1)}"
+    return option
+
+
+def make_variant(paper, label, seed, shuffle_questions=True, shuffle_options=True):
+    """
+    The variant `label` of `paper`: {"label", "seed", "question_order",
+    "option_orders", "questions"}. question_order[i] is the 0-based index in
+    the original paper of the variant's question i, and option_orders[i][j]
+    that of its option j.
+    """
+    questions = paper.get("questions", [])
+    rng = random.Random(variant_seed(seed, label))
+    question_order = _order(rng, len(questions), shuffle_questions)
+    option_orders = [_order(rng, len(questions[i].get("options", [])), shuffle_options) for i in question_order]
+
+    variant_questions = []
+    for source, option_order in zip(question_order, option_orders):
+        q = questions[source]
+        options = q.get("options", [])
+        position = {old: new for new, old in enumerate(option_order, start=1)}
+        correct = q.get("correct_option")
+        variant_questions.append(dict(
+            q,
+            options=[_renumber(options[old], new) for new, old in enumerate(option_order, start=1)],
+            # Answers outside the options (invalid) are kept as they are
+            correct_option=position.get(correct - 1, correct) if isinstance(correct, int) else correct,
+            original_number=source + 1,
+        ))
+
+    return {
+        "label": label,
+        "seed": variant_seed(seed, label),
+        "question_order": question_order,
+        "option_orders": option_orders,
+        "questions": variant_questions,
+    }
+
+
+def _file_label(label):
+    return re.sub(r'[^\w-]+', '_', label).strip("_") or "variant"
+
+
+def render_variant(variant, directory, show_metadata=False):
+    """Writes the variant's paper and answer key into `directory`; returns their file names."""
+    name = _file_label(variant["label"])
+    paper_name = f"Question_Set_{name}.pdf"
+    key_name = f"Answer_Key_Set_{name}.pdf"
+    generate_pdf(variant, os.path.join(directory, paper_name), show_metadata=show_metadata,
+                 show_answers=False, title=f"Question Paper - Set {variant['label']}")
+    generate_answer_key_pdf(variant, os.path.join(directory, key_name),
+                            title=f"Answer Key - Set {variant['label']}")
+    return paper_name, key_name
+
+
+def _render_all(variants, directory, show_metadata):
+    return pdf_engine.render_all([(render_variant, (v, directory, show_metadata)) for v in variants])
+
+
+def build_variant_archive(paper, labels, output, seed=None, show_metadata=False,
+                          shuffle_questions=True, shuffle_options=True):
+    """
+    Writes a zip with one question paper and answer key per label to `output`
+    (a path or binary file object). Returns the answer_keys.json manifest.
+    """
+    if not paper.get("questions"):
+        raise ValueError("The paper has no questions")
+    if len(set(map(_file_label, labels))) != len(labels):
+        raise ValueError("Variant labels must be distinct")
+    if seed is None:
+        seed = paper_seed(paper)
+
+    variants = [make_variant(paper, label, seed, shuffle_questions, shuffle_options) for label in labels]
+    manifest = {
+        "seed": seed,
+        "questions": len(paper["questions"]),
+        "variants": [
+            {
+                "label": v["label"],
+                "seed": v["seed"],
+                "question_order": v["question_order"],
+                "option_orders": v["option_orders"],
+                "answers": [q.get("correct_option") for q in v["questions"]],
+            }
+            for v in variants
+        ],
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = _render_all(variants, directory, show_metadata)
+        with zipfile.ZipFile(output, "w") as archive:
+            for names in files:
+                for name in names:
+                    # PDFs are already compressed
+                    archive.write(os.path.join(directory, name), name, compress_type=zipfile.ZIP_STORED)
+            archive.writestr("answer_keys.json", json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+
+    logger.info(f"🔀 Rendered {len(variants)} paper variant(s) of {manifest['questions']} questions")
+    return manifest
@@ -0,0 +1,104 @@
+"""
+On-disk cache of rendered PDFs, keyed by a hash of what they are rendered from.
+
+A PDF is rendered once per distinct input straight into PDF_CACHE_DIR and
+then served from disk with the key as its ETag, so repeat downloads are a
+file read (or a 304 when the browser already has it) and the response is
+streamed from the file in chunks instead of being buffered in memory. Bump
+the version in `kind` when a renderer's layout changes.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from flask import send_file
+
+from config import PDF_CACHE_DIR, PDF_CACHE_MAX_FILES
+
+logger = logging.getLogger(__name__)
+
+# Renders of the same key are serialized on one of a fixed set of locks, so the
+# locks do not grow with the number of PDFs ever rendered
+LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+# Files used this recently are never evicted: a request that just rendered or
+# touched one is about to send it
+EVICT_GRACE_SECONDS = 30
+
+
+def content_key(kind, payload):
+    """Stable hash of a renderer kind and its JSON-serializable input."""
+    data = json.dumps([kind, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _lock_for(key):
+    return _locks[int(key[:8], 16) % LOCK_STRIPES]
+
+
+def _evict():
+    try:
+        entries = []
+        for entry in os.scandir(PDF_CACHE_DIR):
+            if entry.name.endswith(".pdf"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass  # evicted by another request meanwhile
+        if len(entries) <= PDF_CACHE_MAX_FILES:
+            return
+        entries.sort()
+        recent = time.time() - EVICT_GRACE_SECONDS
+        for mtime, path in entries[:len(entries) - PDF_CACHE_MAX_FILES]:
+            if mtime >= recent:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    except OSError as e:
+        logger.warning(f"⚠️ PDF cache eviction failed: {e}")
+
+
+def get_or_render(kind, payload, render):
+    """
+    Path and key of the cached PDF for `payload`; `render(path)` writes it on
+    a miss. Concurrent requests for the same PDF render it once.
+    """
+    key = content_key(kind, payload)
+    # Absolute, since send_file resolves relative paths against the app's root
+    path = os.path.abspath(os.path.join(PDF_CACHE_DIR, f"{kind}-{key[:32]}.pdf"))
+    with _lock_for(key):
+        if os.path.exists(path):
+            os.utime(path)  # keeps recently used PDFs out of eviction
+            return path, key
+
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            render(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    logger.info(f"📄 Rendered {kind} PDF {key[:12]}")
+    _evict()
+    return path, key
+
+
+def send_pdf(path, key, download_name):
+    """Serves a cached PDF with its key as ETag (304 when the client already has it)."""
+    return send_file(
+        path,
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=download_name,
+        etag=key,
+        conditional=True,
+        max_age=0,
+    )
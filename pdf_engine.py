@@ -0,0 +1,372 @@
+"""
+Rendering layer shared by every generated PDF: question papers and answer
+keys, study material, the prerequisite tree, FIB worksheets and OMR sheets.
+
+Everything that does not depend on the data is set up once per process and
+shared by all renders: the fonts (pdf_fonts), the paragraph style sheet and
+the page layouts. A render only builds the flowables or drawing for its
+data. Flowing documents are laid out with build_document on a named page
+layout. Drawn documents
+(prerequisite tree, OMR) get a canvas from new_canvas; MMCanvas draws on it
+in millimetres from the top-left corner of the page, with fpdf's cell
+model, so fixed layouts keep their coordinates.
+
+Page templates and frames hold layout state while a document is built, so
+build_document instantiates them per document from the shared layout
+instead of sharing the objects between concurrent renders.
+
+render_all renders several documents side by side in a shared pool of
+worker processes: layout is pure Python, so threads would take turns on the
+GIL.
+"""
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.sax.saxutils import escape
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import ParagraphStyle, StyleSheet1
+from reportlab.lib.units import cm, mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.lib.utils import simpleSplit
+from reportlab.platypus import BaseDocTemplate, Flowable, Frame, PageTemplate
+
+import pdf_fonts
+from config import PDF_RENDER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Binary compressed streams: ASCII85 on top of them only makes the files a quarter larger
+rl_config.useA85 = 0
+
+PageLayout = namedtuple("PageLayout", "pagesize left right top bottom")
+
+# Page size and margins by document kind
+LAYOUTS = {
+    "paper": PageLayout(A4, 10 * mm, 10 * mm, 10 * mm, 15 * mm),
+    "study": PageLayout(A4, 10 * mm, 10 * mm, 10 * mm, 15 * mm),
+    "fib": PageLayout(A4, 2.5 * cm, 2.5 * cm, 2.5 * cm, 2.5 * cm),
+}
+
+ANSWER_GREEN = colors.Color(0, 128 / 255, 0)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def fonts():
+    """Regular, bold and italic body font names (registered once per process)."""
+    return pdf_fonts.fonts()
+
+
+@functools.lru_cache(maxsize=None)
+def stylesheet():
+    """Paragraph styles of every document kind, built once per process."""
+    regular, bold, italic = fonts()
+    sheet = StyleSheet1()
+    sheet.add(ParagraphStyle("Body", fontName=regular, fontSize=10, leading=13))
+
+    # Question papers and answer keys
+    sheet.add(ParagraphStyle("PaperTitle", parent=sheet["Body"], fontSize=12, leading=16,
+                             alignment=TA_CENTER, spaceAfter=14))
+    sheet.add(ParagraphStyle("PaperMeta", parent=sheet["Body"], fontSize=12, leading=16, spaceAfter=3))
+    sheet.add(ParagraphStyle("PaperQuestion", parent=sheet["Body"], fontSize=12, leading=16, spaceAfter=6))
+    sheet.add(ParagraphStyle("PaperOption", parent=sheet["Body"], fontSize=12, leading=18))
+    sheet.add(ParagraphStyle("PaperAnswer", parent=sheet["PaperOption"], textColor=ANSWER_GREEN))
+    sheet.add(ParagraphStyle("PaperKeyLine", parent=sheet["Body"], fontSize=12, leading=18))
+
+    # Study material
+    sheet.add(ParagraphStyle("StudyTitle", parent=sheet["Body"], fontName=bold, fontSize=14, leading=18,
+                             alignment=TA_CENTER, spaceAfter=14))
+    sheet.add(ParagraphStyle("StudySubject", parent=sheet["Body"], fontName=bold, fontSize=14, leading=18,
+                             spaceBefore=4, spaceAfter=6))
+    sheet.add(ParagraphStyle("StudyChapter", parent=sheet["Body"], fontName=bold, fontSize=12, leading=16,
+                             spaceBefore=6, spaceAfter=6))
+    sheet.add(ParagraphStyle("StudyContentType", parent=sheet["Body"], fontName=italic, fontSize=11, leading=15,
+                             spaceBefore=4, spaceAfter=2))
+    sheet.add(ParagraphStyle("StudyText", parent=sheet["Body"], fontSize=10, leading=14, spaceAfter=6))
+
+    # FIB worksheets
+    sheet.add(ParagraphStyle("FibTitle", parent=sheet["Body"], fontName=bold, fontSize=14, leading=17,
+                             alignment=TA_CENTER, spaceAfter=12))
+    sheet.add(ParagraphStyle("FibSection", parent=sheet["Body"], fontName=bold, fontSize=10, leading=12,
+                             spaceBefore=10, spaceAfter=4))
+    sheet.add(ParagraphStyle("FibInstructions", parent=sheet["Body"], fontSize=8, leading=10))
+    sheet.add(ParagraphStyle("FibAnswerBank", parent=sheet["Body"], fontSize=9, leading=12))
+    sheet.add(ParagraphStyle("FibParagraph", parent=sheet["Body"], fontSize=9, leading=11, spaceAfter=12))
+    sheet.add(ParagraphStyle("FibQuestion", parent=sheet["Body"], fontSize=9, leading=12, spaceAfter=2))
+    sheet.add(ParagraphStyle("FibPostBox", parent=sheet["Body"], fontSize=9, leading=12))
+    return sheet
+
+
+def markup(text):
+    """Plain text as paragraph markup: XML special characters escaped, line breaks kept."""
+    return escape(str(text)).replace("\n", "<br/>")
+
+
+class PlainText(Flowable):
+    """
+    Plain text (no markup) in a paragraph style: questions, options, answers
+    and generated prose. Lines are broken with simpleSplit and drawn
+    directly, which is much cheaper than Paragraph's markup parsing and line
+    breaking, and the text splits across pages between lines. Line breaks in
+    the text are kept.
+    """
+
+    def __init__(self, text, style, lines=None, lines_width=None):
+        super().__init__()
+        self.text = str(text)
+        self.style = style
+        self._lines = lines
+        self._lines_width = lines_width
+
+    def _break(self, avail_width):
+        style = self.style
+        width = avail_width - style.leftIndent - style.rightIndent
+        lines = []
+        for part in self.text.split("\n"):
+            lines.extend(simpleSplit(part, style.fontName, style.fontSize, width) or [""])
+        return lines
+
+    def wrap(self, availWidth, availHeight):
+        if self._lines is None or availWidth != self._lines_width:
+            self._lines, self._lines_width = self._break(availWidth), availWidth
+        self.width = availWidth
+        self.height = len(self._lines) * self.style.leading
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        self.wrap(availWidth, availHeight)
+        fit = int(availHeight // self.style.leading)
+        if fit <= 0 or fit >= len(self._lines):
+            return []
+        return [PlainText(self.text, self.style, self._lines[:fit], availWidth),
+                PlainText(self.text, self.style, self._lines[fit:], availWidth)]
+
+    def getSpaceBefore(self):
+        return self.style.spaceBefore
+
+    def getSpaceAfter(self):
+        return self.style.spaceAfter
+
+    def draw(self):
+        style = self.style
+        c = self.canv
+        c.setFillColor(style.textColor)
+        c.setFont(style.fontName, style.fontSize)
+        # Same baselines as a Paragraph: the first one font size below the top
+        y = self.height - style.fontSize
+        for line in self._lines:
+            if style.alignment == TA_CENTER:
+                x = (self.width - stringWidth(line, style.fontName, style.fontSize)) / 2
+            elif style.alignment == TA_RIGHT:
+                x = self.width - style.rightIndent - stringWidth(line, style.fontName, style.fontSize)
+            else:
+                x = style.leftIndent
+            c.drawString(x, y, line)
+            y -= style.leading
+
+
+def _doc_template(output, layout, on_page, title):
+    page = LAYOUTS[layout]
+    doc = BaseDocTemplate(
+        output, pagesize=page.pagesize, leftMargin=page.left, rightMargin=page.right,
+        topMargin=page.top, bottomMargin=page.bottom, title=title or "", author="", creator="",
+    )
+    frame = Frame(doc.leftMargin, doc.bottomMargin, doc.width, doc.height, id="body",
+                  leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+    doc.addPageTemplates([PageTemplate(id=layout, frames=[frame], onPage=on_page or _no_decoration)])
+    return doc
+
+
+def build_document(output, story, layout, on_page=None, title=None):
+    """Lays out `story` on the named page layout into `output` (a path or binary file object)."""
+    _doc_template(output, layout, on_page, title).build(story)
+
+
+def _no_decoration(canvas, doc):
+    pass
+
+
+def content_width(layout):
+    page = LAYOUTS[layout]
+    return page.pagesize[0] - page.left - page.right
+
+
+def new_canvas(output, pagesize=A4, title=None):
+    """A canvas for a drawn document, with the body fonts registered."""
+    fonts()
+    c = canvas.Canvas(output, pagesize=pagesize)
+    if title:
+        c.setTitle(title)
+    return c
+
+
+# Bezier control point distance of a quarter ellipse, as a fraction of the radius
+KAPPA = 4 * (2 ** 0.5 - 1) / 3
+
+
+def cell_origin(x, y, w, h, text, font, page_height, align="L"):
+    """Baseline origin in points of `text` in an fpdf cell (see MMCanvas.cell)."""
+    if align == "C":
+        dx = (w - stringWidth(text, *font) / mm) / 2
+    elif align == "R":
+        dx = w - MMCanvas.CELL_MARGIN - stringWidth(text, *font) / mm
+    else:
+        dx = MMCanvas.CELL_MARGIN
+    # Baseline 0.3 font size below the cell's middle, as fpdf places it
+    font_height = font[1] / mm
+    return (x + dx) * mm, (page_height - (y + h / 2 + 0.3 * font_height)) * mm
+
+
+def ellipse_path(boxes, page_height):
+    """
+    PDF path operators stroking the ellipses inscribed in `boxes` ((x, y, w, h)
+    in mm from the top-left corner) with a single stroke, for
+    MMCanvas.stroke_literal. The curves are the ones canvas.ellipse draws.
+    """
+    ops = []
+    for x, y, w, h in boxes:
+        rx, ry = w * mm / 2, h * mm / 2
+        cx, cy = x * mm + rx, (page_height - y) * mm - ry
+        kx, ky = KAPPA * rx, KAPPA * ry
+        ops.append(
+            f"{cx + rx:.2f} {cy:.2f} m "
+            f"{cx + rx:.2f} {cy + ky:.2f} {cx + kx:.2f} {cy + ry:.2f} {cx:.2f} {cy + ry:.2f} c "
+            f"{cx - kx:.2f} {cy + ry:.2f} {cx - rx:.2f} {cy + ky:.2f} {cx - rx:.2f} {cy:.2f} c "
+            f"{cx - rx:.2f} {cy - ky:.2f} {cx - kx:.2f} {cy - ry:.2f} {cx:.2f} {cy - ry:.2f} c "
+            f"{cx + kx:.2f} {cy - ry:.2f} {cx + rx:.2f} {cy - ky:.2f} {cx + rx:.2f} {cy:.2f} c"
+        )
+    ops.append("S")
+    return "\n".join(ops)
+
+
+class MMCanvas:
+    """
+    Draws on a canvas in millimetres from the top-left corner of the page,
+    with fpdf's conventions: a cell is a box whose text sits in its middle,
+    1 mm in from the edge when aligned left or right, and lines are 0.2 mm.
+    """
+
+    CELL_MARGIN = 1.0
+
+    def __init__(self, c, page_height):
+        self.canvas = c
+        self.page_height = page_height
+        self.font = ("Helvetica", 8)
+        c.setLineWidth(0.2 * mm)
+
+    def show_page(self):
+        """Ends the page; the next one keeps the font and line width (showPage resets them)."""
+        self.canvas.showPage()
+        self.canvas.setLineWidth(0.2 * mm)
+        self.canvas.setFont(*self.font)
+
+    def _y(self, y):
+        return (self.page_height - y) * mm
+
+    def set_font(self, name, size):
+        self.font = (name, size)
+        self.canvas.setFont(name, size)
+
+    def string_width(self, text):
+        return stringWidth(text, *self.font) / mm
+
+    def cell(self, x, y, w, h, text="", border=False, align="L"):
+        if border:
+            self.rect(x, y, w, h)
+        if not text:
+            return
+        self.canvas.drawString(*cell_origin(x, y, w, h, text, self.font, self.page_height, align), text)
+
+    def texts(self, runs):
+        """Draws (x, y, text) runs, origins in points (cell_origin), in the current font as one text object."""
+        t = self.canvas.beginText()
+        t.setFont(*self.font)
+        for x, y, text in runs:
+            t.setTextOrigin(x, y)
+            t.textOut(text)
+        self.canvas.drawText(t)
+
+    def stroke_literal(self, path):
+        """Strokes a precomputed path (ellipse_path) in the current line width."""
+        self.canvas.addLiteral(path)
+
+    def rect(self, x, y, w, h):
+        self.canvas.rect(x * mm, self._y(y + h), w * mm, h * mm, stroke=1, fill=0)
+
+    def line(self, x1, y1, x2, y2):
+        self.canvas.line(x1 * mm, self._y(y1), x2 * mm, self._y(y2))
+
+    def ellipse(self, x, y, w, h):
+        self.canvas.ellipse(x * mm, self._y(y + h), (x + w) * mm, self._y(y), stroke=1, fill=0)
+
+    def image(self, path, x, y, w, h):
+        # By path: reportlab embeds a file once per document and keeps JPEGs as they are
+        self.canvas.drawImage(path, x * mm, self._y(y + h), w * mm, h * mm)
+
+    def begin_form(self, name):
+        """Draws into a reusable form (PDF Form XObject) until end_form; place it with do_form."""
+        self.canvas.beginForm(name)
+        # A form starts from the graphics state of the page placing it, so set what is drawn with
+        self.canvas.setLineWidth(0.2 * mm)
+        self.canvas.setFont(*self.font)
+
+    def end_form(self):
+        self.canvas.endForm()
+
+    def do_form(self, name):
+        self.canvas.doForm(name)
+
+
+def render_workers():
+    return PDF_RENDER_WORKERS or os.cpu_count() or 1
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked: the app process runs threads whose held locks a fork would copy
+            _pool = ProcessPoolExecutor(
+                max_workers=render_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=pdf_fonts.preload,
+            )
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def render_all(calls):
+    """
+    Runs each (function, args) render in the worker pool and returns their
+    results in order. The functions and arguments must be picklable
+    (module-level functions, plain data). A single call, a single worker or a
+    broken pool renders in this process instead.
+    """
+    if len(calls) < 2 or render_workers() < 2:
+        return [function(*args) for function, args in calls]
+    try:
+        pool = _get_pool()
+        futures = [pool.submit(function, *args) for function, args in calls]
+        return [future.result() for future in futures]
+    except BrokenProcessPool:
+        logger.warning("⚠️ PDF render pool broke; rendering in this process")
+        _reset_pool()
+        return [function(*args) for function, args in calls]
@@ -0,0 +1,74 @@
+"""
+Process-wide font registration for the PDF renderers (see pdf_engine).
+
+The bundled DejaVu fonts are parsed and registered with reportlab once per
+process; every document then refers to them by name, and reportlab embeds
+only the glyphs each document uses. Only DejaVuSans.ttf ships in fonts/; a
+bold or italic face whose .ttf is missing falls back to the regular DejaVu
+face, which keeps the glyphs (symbols such as √ and π, non-Latin scripts)
+that Helvetica lacks at the cost of the emphasis. Without DejaVuSans.ttf
+itself the Helvetica faces are used.
+preload() registers them at startup (PDF_FONT_PRELOAD) so the first render
+does not pay for parsing the fonts.
+"""
+import functools
+import logging
+import os
+from collections import namedtuple
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from config import FONTS_DIR
+
+logger = logging.getLogger(__name__)
+
+# DejaVu files by style ("" regular, "B" bold, "I" italic)
+DEJAVU_FILES = {
+    "": "DejaVuSans.ttf",
+    "B": "DejaVuSans-Bold.ttf",
+    "I": "DejaVuSans-Oblique.ttf",
+}
+FONT_NAMES = {"": "DejaVu", "B": "DejaVu-Bold", "I": "DejaVu-Oblique"}
+FALLBACK_NAMES = {"": "Helvetica", "B": "Helvetica-Bold", "I": "Helvetica-Oblique"}
+
+FontSet = namedtuple("FontSet", "regular bold italic")
+
+
+def font_path(style=""):
+    return os.path.join(FONTS_DIR, DEJAVU_FILES[style])
+
+
+@functools.lru_cache(maxsize=None)
+def available_styles():
+    """DejaVu styles whose font files exist, checked once per process."""
+    return frozenset(style for style in DEJAVU_FILES if os.path.exists(font_path(style)))
+
+
+@functools.lru_cache(maxsize=None)
+def fonts():
+    """Names of the regular, bold and italic body fonts, registered on first use."""
+    if "" not in available_styles():
+        logger.warning(f"Font file not found at {font_path()}. Using Helvetica, which lacks non-Latin glyphs.")
+        return FontSet(FALLBACK_NAMES[""], FALLBACK_NAMES["B"], FALLBACK_NAMES["I"])
+
+    names = {}
+    for style in DEJAVU_FILES:
+        if style in available_styles():
+            pdfmetrics.registerFont(TTFont(FONT_NAMES[style], font_path(style)))
+            names[style] = FONT_NAMES[style]
+        else:
+            # Expected: only the regular face is bundled
+            logger.debug(f"Font file not found at {font_path(style)}. Using {FONT_NAMES['']} instead.")
+            names[style] = FONT_NAMES[""]
+
+    # <b> and <i> in paragraph markup resolve through the family
+    pdfmetrics.registerFontFamily(names[""], normal=names[""], bold=names["B"],
+                                  italic=names["I"], boldItalic=names["B"])
+    return FontSet(names[""], names["B"], names["I"])
+
+
+def preload():
+    """Registers the bundled DejaVu fonts."""
+    font_set = fonts()
+    logger.info(f"🔤 Preloaded PDF fonts: {', '.join(dict.fromkeys(font_set))}")
@@ -0,0 +1,199 @@
+"""
+Background computation of the full candidate prerequisite graph.
+
+As soon as the top-level chapters are chosen, a job discovers the
+prerequisites of every candidate chapter down to PREREQ_GRAPH_DEPTH levels,
+so /recursive_prereq only has to look up (and the teacher only has to prune)
+nodes that are already computed.
+
+The levels run as a pipeline: the chapter lists of all levels (level 0
+being the selected class's own) are fetched up front (they do not depend on
+the model's answers), and the chapters found for a node at level L are
+queued for level L + 1 as soon as that node finishes, without waiting for
+the rest of level L. Nodes are keyed
+exactly like the prompts recursive_prereq sends - (level, subject, chapter)
+for every selected subject - so a lookup hit is the same answer a live call
+would have produced.
+"""
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+import llm_client
+import llm_telemetry
+import request_deadline
+
+logger = logging.getLogger(__name__)
+
+MAX_JOBS = 20
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+class PrereqGraphJob:
+    def __init__(self, subjects, top_chapters, depth, fetch_level, discover, workers, deadline_seconds):
+        if depth < 1:
+            raise ValueError(f"A prerequisite graph needs at least one level, got depth={depth}")
+        self.id = uuid.uuid4().hex[:12]
+        self.subjects = list(subjects)
+        self.top_chapters = [name for name in dict.fromkeys(top_chapters) if name]
+        self.depth = depth
+        # fetch_level(level) -> chapter lists of the class `level` years below (0: the selected class)
+        # discover(level, current_syllabus, subject, chapter, chapter_index_map, previous_year_data) -> render items,
+        # current_syllabus being the chapter lists of level - 1, which the chapter comes from
+        self.fetch_level = fetch_level
+        self.discover = discover
+        self.workers = workers
+        self.deadline_seconds = deadline_seconds
+
+        self.status = "pending"
+        self.started = None
+        self.finished = None
+        self.nodes = {}
+        self.errors = {}
+        # Created here rather than in _run, so that cancel() works before the job thread starts
+        self.deadline = request_deadline.Deadline(deadline_seconds)
+        self._submitted = set()
+        self._outstanding = 0
+        self._cond = threading.Condition()
+        self._levels = {}
+        self._executor = None
+
+    # ---------------------------------------------------------------- running
+
+    def start(self):
+        threading.Thread(target=self._run, name=f"prereq-graph-{self.id}", daemon=True).start()
+
+    def cancel(self, reason="superseded"):
+        self.deadline.cancel(reason)
+
+    def _run(self):
+        telemetry_job, telemetry_token = llm_telemetry.start_job("prereq_graph")
+        deadline_token = request_deadline.install(self.deadline)
+        # Its calls take a bounded share of the LLM slots, so interactive requests are not queued behind it
+        background_token = llm_client.start_background()
+        self.status = "running"
+        self.started = time()
+        try:
+            # A job cancelled before it got here fetches and asks nothing
+            if not self.deadline.done():
+                with ThreadPoolExecutor(max_workers=self.depth + 1) as fetcher, \
+                        ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    self._levels = {
+                        level: llm_client.submit(fetcher, self._load_level, level)
+                        for level in range(self.depth + 1)
+                    }
+                    self._executor = executor
+                    self._schedule(1, self.top_chapters)
+                    with self._cond:
+                        self._cond.wait_for(lambda: self._outstanding == 0)
+            self.status = "cancelled" if self.deadline.done() else "done"
+        except Exception as e:
+            logger.error(f"Prerequisite graph {self.id} failed: {e}")
+            self.status = "failed"
+        finally:
+            self.finished = time()
+            llm_client.finish_background(background_token)
+            request_deadline.finish(deadline_token)
+            llm_telemetry.finish_job(telemetry_job, telemetry_token)
+        logger.info(f"🗺️ Prerequisite graph {self.id} {self.status}: {len(self.nodes)} node(s), "
+                    f"{len(self.errors)} error(s) in {self.finished - self.started:.1f}s")
+
+    def _load_level(self, level):
+        previous_year_data = self.fetch_level(level)
+        chapter_index_map = {
+            subject: {ch['number']: ch['chapter'] for ch in chapters}
+            for subject, chapters in previous_year_data.items()
+        }
+        return previous_year_data, chapter_index_map
+
+    def _schedule(self, level, chapter_names):
+        for subject in self.subjects:
+            for chapter_name in dict.fromkeys(chapter_names):
+                key = (level, subject, chapter_name)
+                with self._cond:
+                    if not chapter_name or key in self._submitted:
+                        continue
+                    self._submitted.add(key)
+                    self._outstanding += 1
+                llm_client.submit(self._executor, self._discover_node, key)
+
+    def _discover_node(self, key):
+        level, subject, chapter_name = key
+        try:
+            if self.deadline.done():
+                raise llm_client.LLMCancelled(self.deadline.reason)
+            previous_year_data, chapter_index_map = self._levels[level].result()
+            current_syllabus, _ = self._levels[level - 1].result()
+            items = self.discover(level, current_syllabus, subject, chapter_name, chapter_index_map, previous_year_data)
+            with self._cond:
+                self.nodes[key] = items
+            if level < self.depth:
+                self._schedule(level + 1, [item["chapter"] for item in items])
+        except Exception as e:
+            with self._cond:
+                self.errors[key] = str(e)
+        finally:
+            with self._cond:
+                self._outstanding -= 1
+                self._cond.notify_all()
+
+    # ---------------------------------------------------------------- queries
+
+    def lookup(self, level, jobs):
+        """Precomputed render items for the (subject, chapter) jobs of a level that are ready."""
+        with self._cond:
+            return {
+                job: self.nodes[(level,) + tuple(job)]
+                for job in jobs
+                if (level,) + tuple(job) in self.nodes
+            }
+
+    def summary(self):
+        with self._cond:
+            per_level = {}
+            for level, _, _ in self._submitted:
+                per_level.setdefault(level, {"queued": 0, "done": 0, "errors": 0})["queued"] += 1
+            for level, _, _ in self.nodes:
+                per_level[level]["done"] += 1
+            for level, _, _ in self.errors:
+                per_level[level]["errors"] += 1
+            return {
+                "id": self.id,
+                "status": self.status,
+                "depth": self.depth,
+                "subjects": self.subjects,
+                "top_chapters": self.top_chapters,
+                "nodes": len(self.nodes),
+                "pending": self._outstanding,
+                "levels": {str(level): counts for level, counts in sorted(per_level.items())},
+                "errors": {" / ".join(map(str, key)): error for key, error in self.errors.items()},
+                "elapsed_seconds": round((self.finished or time()) - self.started, 1) if self.started else 0,
+            }
+
+
+def start_job(subjects, top_chapters, depth, fetch_level, discover, workers, deadline_seconds, replaces=None):
+    """Starts a graph job in the background, cancelling the job it replaces (if any)."""
+    previous = get_job(replaces)
+    if previous is not None:
+        previous.cancel()
+
+    job = PrereqGraphJob(subjects, top_chapters, depth, fetch_level, discover, workers, deadline_seconds)
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_JOBS:
+            _, oldest = _jobs.popitem(last=False)
+            oldest.cancel("evicted")
+    job.start()
+    return job
+
+
+def get_job(job_id):
+    if not job_id:
+        return None
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,120 @@
+"""
+PDF rendering of the prerequisite tree (Prerequisite_Tree.pdf), drawn on a
+canvas from the shared rendering layer (see pdf_engine) in its body fonts.
+
+Text is wrapped to the width left at its indentation level. The wrapped
+lines of each node are computed once and reused wherever the same text
+appears at the same level. cached_prerequisite_pdf renders a tree once per
+distinct tree (see pdf_cache) so downloads are served from disk.
+"""
+import io
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import simpleSplit
+
+import pdf_cache
+import pdf_engine
+
+# Bump when the layout changes so cached PDFs are re-rendered
+PDF_KIND = "prereq_tree_v3"
+
+
+def render_prerequisite_pdf(tree, output):
+    """Draws `tree` into `output` (a path or a binary file object)."""
+    c = pdf_engine.new_canvas(output, pagesize=A4, title="Prerequisite Tree")
+    width, height = A4
+    regular, bold, italic = pdf_engine.fonts()
+
+    margin_left = 30
+    margin_right = 30
+    margin_top = 40
+    margin_bottom = 40
+
+    y = height - margin_top
+    line_height = 22
+    max_indent = 80
+    sidebar_width = 5
+
+    background_colors = [colors.whitesmoke, colors.lightgrey]
+    sidebar_colors = [
+        colors.red, colors.orange, colors.green,
+        colors.cadetblue, colors.purple, colors.brown, colors.teal
+    ]
+
+    line_counter = 0  # for background color alternation
+    wrapped = {}
+
+    def wrap(text, font, font_size, max_width):
+        key = (text, font, font_size, max_width)
+        if key not in wrapped:
+            wrapped[key] = simpleSplit(text, font, font_size, max_width) or [""]
+        return wrapped[key]
+
+    def draw_text_block(text, level, font=regular, font_size=11):
+        nonlocal y, line_counter
+
+        indent = min(level * 20, max_indent)
+        x_pos = margin_left + indent + sidebar_width + 5
+        lines = wrap(text, font, font_size, width - margin_right - x_pos - 5)
+        # The first line keeps the usual band height; wrapped lines add font-sized rows
+        wrapped_line_height = font_size + 4
+        block_height = line_height + (len(lines) - 1) * wrapped_line_height
+
+        if y - block_height < margin_bottom:
+            c.showPage()
+            y = height - margin_top
+            line_counter = 0  # reset background alternation
+
+        # Draw background band
+        bg_color = background_colors[line_counter % 2]
+        c.setFillColor(bg_color)
+        c.rect(margin_left, y - block_height + 4, width - margin_left - margin_right, block_height, fill=1, stroke=0)
+
+        # Draw left color sidebar
+        sidebar_color = sidebar_colors[level % len(sidebar_colors)]
+        c.setFillColor(sidebar_color)
+        c.rect(margin_left, y - block_height + 4, sidebar_width, block_height, fill=1, stroke=0)
+
+        # Draw text
+        c.setFillColor(colors.black)
+        c.setFont(font, font_size)
+        for i, line in enumerate(lines):
+            c.drawString(x_pos, y - i * wrapped_line_height, line)
+
+        y -= block_height
+        line_counter += 1
+
+    def draw_chapters(chapters, level=0):
+        for chapter in chapters:
+            chapter_text = f"{chapter['chapter']} (Chapter {chapter['number']}, {chapter['class']})"
+            draw_text_block(chapter_text, level, font=bold, font_size=12)
+
+            if "reason" in chapter:
+                reason_text = f"Reason: {chapter['reason']}"
+                draw_text_block(reason_text, level + 1, font=italic, font_size=10)
+
+            if chapter.get("prerequisites"):
+                draw_chapters(chapter["prerequisites"], level + 1)
+
+    for class_key, subjects in tree.items():
+        for subject, chapters in subjects.items():
+            heading_text = f"{subject} - {class_key}"
+            draw_text_block(heading_text, 0, font=bold, font_size=14)
+            draw_chapters(chapters, level=1)
+            y -= line_height // 2  # small space between subjects
+
+    c.save()
+
+
+def generate_prerequisite_pdf(tree):
+    """The tree PDF in an in-memory buffer."""
+    buffer = io.BytesIO()
+    render_prerequisite_pdf(tree, buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def cached_prerequisite_pdf(tree):
+    """(path, key) of the cached PDF for `tree`, rendering it on first use."""
+    return pdf_cache.get_or_render(PDF_KIND, tree, lambda path: render_prerequisite_pdf(tree, path))
@@ -0,0 +1,156 @@
+"""
+Local lexical ranking of previous-year chapters for the prerequisite prompt.
+
+Instead of listing the whole previous-year syllabus in every prompt, the
+chapters are ranked with BM25 over their title, topic and subtopic text,
+queried with the selected chapter's own title, topics and subtopics, and only
+the top PREREQ_SHORTLIST_K candidates that share a term with it are sent.
+When the query shares no terms with any chapter the ranking carries no signal
+and the full list is kept.
+
+The same ranking backs the LLM-free "local" prerequisite engine
+(suggest_prerequisites), which answers in milliseconds from the curriculum
+structure alone.
+"""
+import math
+import re
+from collections import Counter
+
+_TOKEN_RE = re.compile(r"[a-z]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "by", "for", "from", "in", "into", "is", "it", "its",
+    "of", "on", "or", "the", "to", "with", "our", "their", "we", "you", "your", "how", "what",
+    "why", "some", "other", "about", "chapter", "introduction", "exercise", "summary",
+}
+# Chapter titles count this many times in a chapter's document
+TITLE_WEIGHT = 2
+
+
+def _stem(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [_stem(w) for w in _TOKEN_RE.findall((text or "").lower()) if len(w) > 2 and w not in _STOPWORDS]
+
+
+def chapter_document(chapter):
+    """Tokens for one previous-year chapter: title (weighted), topics and subtopics."""
+    tokens = tokenize(chapter.get("chapter", "")) * TITLE_WEIGHT
+    for topic in chapter.get("topics", []):
+        tokens.extend(tokenize(topic.get("text") or topic.get("topic", "")))
+        for sub in topic.get("subtopics", []):
+            tokens.extend(tokenize(sub.get("text", "") if isinstance(sub, dict) else sub))
+    return tokens
+
+
+class BM25:
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in documents]
+        self.lengths = [len(doc) for doc in documents]
+        self.avg_length = (sum(self.lengths) / len(documents)) if documents else 0
+        doc_freq = Counter(term for tf in self.term_freqs for term in tf)
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def scores(self, query_tokens):
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length) if self.avg_length else self.k1
+            for term in query_tokens:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+
+def shortlist_chapters(selected_chapter, chapters, k):
+    """
+    Returns up to `k` chapters that best match `selected_chapter` (a chapter
+    with its topics, or just its title), in their syllabus order. Chapters
+    sharing no term with it are left out. All chapters are returned when
+    k <= 0, when there are at most k of them or when none shares a term.
+    """
+    if k <= 0 or len(chapters) <= k:
+        return list(chapters)
+    if isinstance(selected_chapter, str):
+        selected_chapter = {"chapter": selected_chapter}
+    query_tokens = chapter_document(selected_chapter)
+    if not query_tokens:
+        return list(chapters)
+
+    scores = BM25([chapter_document(ch) for ch in chapters]).scores(query_tokens)
+    if not any(scores):
+        return list(chapters)
+
+    ranked = sorted((i for i in range(len(chapters)) if scores[i] > 0), key=lambda i: (-scores[i], i))[:k]
+    return [chapters[i] for i in sorted(ranked)]
+
+
+# Weights of the local engine's score; overlap is normalised to the best match
+OVERLAP_WEIGHT = 0.75
+ALIGNMENT_WEIGHT = 0.25
+# Chapters matching less than this fraction of the best overlap are not suggested
+MIN_RELATIVE_OVERLAP = 0.3
+REASON_TERMS = 4
+
+
+def _relative_position(number, count):
+    if not isinstance(number, int) or count <= 1:
+        return None
+    return min(max((number - 1) / (count - 1), 0.0), 1.0)
+
+
+def suggest_prerequisites(selected_chapter, syllabus_size, previous_year_chapters, max_items):
+    """
+    LLM-free prerequisite suggestions for one chapter, in the same shape as
+    the model's answer ({"number", "chapter", "reason", "for"}).
+
+    Previous-year chapters are scored on the terms their title, topics and
+    subtopics share with the selected chapter's (BM25, normalised to the best
+    match) and on chapter-number alignment: syllabi progress in step, so a
+    chapter at the same relative position of its book is a likelier
+    prerequisite. Only chapters that share terms are suggested, best first.
+    """
+    if max_items <= 0 or not previous_year_chapters:
+        return []
+    query_tokens = chapter_document(selected_chapter)
+    if not query_tokens:
+        return []
+
+    bm25 = BM25([chapter_document(ch) for ch in previous_year_chapters])
+    overlap = bm25.scores(query_tokens)
+    best = max(overlap)
+    if best <= 0:
+        return []
+
+    selected_position = _relative_position(selected_chapter.get("number"), syllabus_size)
+    scored = []
+    for i, ch in enumerate(previous_year_chapters):
+        relative_overlap = overlap[i] / best
+        if relative_overlap < MIN_RELATIVE_OVERLAP:
+            continue
+        position = _relative_position(ch.get("number"), len(previous_year_chapters))
+        alignment = 1 - abs(selected_position - position) if None not in (selected_position, position) else 0.0
+        scored.append((OVERLAP_WEIGHT * relative_overlap + ALIGNMENT_WEIGHT * alignment, i))
+
+    suggestions = []
+    for _, i in sorted(scored, key=lambda s: (-s[0], s[1]))[:max_items]:
+        ch = previous_year_chapters[i]
+        shared = set(query_tokens) & bm25.term_freqs[i].keys()
+        terms = sorted(shared, key=lambda t: (-bm25.idf[t], t))[:REASON_TERMS]
+        suggestions.append({
+            "number": ch.get("number"),
+            "chapter": ch.get("chapter", ""),
+            "reason": f"Shares key terms with the selected chapter: {', '.join(terms)}",
+            "for": selected_chapter.get("chapter", ""),
+        })
+    return suggestions
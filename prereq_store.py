@@ -0,0 +1,227 @@
+"""
+Persistent prerequisite knowledge graph shared by every user of the server.
+
+Edges go from a chapter (board, class, subject, chapter) to a prerequisite
+chapter of the class below, with the reason, a confidence and the provenance
+of the edge ("llm:<model>"). A chapter is also marked as analysed when it has
+been asked about, so an empty answer is remembered as well. /recursive_prereq
+and the background prerequisite graph read the store before asking the model
+and only add what is new; when a teacher selects a suggested prerequisite its
+edge is confirmed and its confidence raised.
+
+The store is a SQLite database at PREREQ_STORE_PATH. Every operation opens
+its own connection, so it is safe to use from the executor threads.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from time import time
+
+from config import PREREQ_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+# Initial confidence of an edge by the kind of source that produced it
+SOURCE_CONFIDENCE = {"llm": 0.6}
+DEFAULT_CONFIDENCE = 0.5
+# Each teacher confirmation removes this fraction of the remaining doubt
+CONFIRMATION_WEIGHT = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysed (
+    board TEXT NOT NULL,
+    class INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    chapter TEXT NOT NULL,
+    provenance TEXT NOT NULL,
+    analysed_at REAL NOT NULL,
+    PRIMARY KEY (board, class, subject, chapter)
+);
+CREATE TABLE IF NOT EXISTS edges (
+    board TEXT NOT NULL,
+    class INTEGER NOT NULL,
+    subject TEXT NOT NULL,
+    chapter TEXT NOT NULL,
+    prereq_class INTEGER NOT NULL,
+    prereq_number INTEGER,
+    prereq_chapter TEXT NOT NULL,
+    reason TEXT,
+    confidence REAL NOT NULL,
+    provenance TEXT NOT NULL,
+    confirmations INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (board, class, subject, chapter, prereq_chapter)
+);
+"""
+
+_init_lock = threading.Lock()
+_initialised = False
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "recorded_chapters": 0, "recorded_edges": 0, "confirmations": 0}
+
+
+def _connect():
+    global _initialised
+    if not _initialised:
+        os.makedirs(os.path.dirname(PREREQ_STORE_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(PREREQ_STORE_PATH, timeout=30)
+    if not _initialised:
+        with _init_lock:
+            if not _initialised:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+                _initialised = True
+    return conn
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def initial_confidence(provenance):
+    return SOURCE_CONFIDENCE.get(provenance.split(":", 1)[0], DEFAULT_CONFIDENCE)
+
+
+def lookup(board, chapter_class, jobs):
+    """
+    Stored prerequisites of the (subject, chapter) jobs of one class that were
+    analysed before: {job: [{"number", "chapter", "reason", "for"}]}.
+    """
+    found = {}
+    try:
+        with closing(_connect()) as conn:
+            found = _lookup(conn, board, chapter_class, jobs)
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Prerequisite store lookup failed: {e}")
+    _count("hits", len(found))
+    _count("misses", len(jobs) - len(found))
+    return found
+
+
+def _lookup(conn, board, chapter_class, jobs):
+    found = {}
+    for subject, chapter_name in jobs:
+        analysed = conn.execute(
+            "SELECT 1 FROM analysed WHERE board = ? AND class = ? AND subject = ? AND chapter = ?",
+            (board or "", chapter_class, subject, chapter_name),
+        ).fetchone()
+        if not analysed:
+            continue
+        rows = conn.execute(
+            "SELECT prereq_number, prereq_chapter, reason FROM edges "
+            "WHERE board = ? AND class = ? AND subject = ? AND chapter = ? "
+            "ORDER BY confidence DESC, prereq_number",
+            (board or "", chapter_class, subject, chapter_name),
+        ).fetchall()
+        found[(subject, chapter_name)] = [
+            {"number": number, "chapter": prereq_chapter, "reason": reason, "for": chapter_name}
+            for number, prereq_chapter, reason in rows
+        ]
+    return found
+
+
+def record(board, chapter_class, subject, chapter_name, prereqs, provenance):
+    """
+    Marks a chapter as analysed and adds the edges of `prereqs` (render items
+    or {"number", "chapter", "reason"}) that are not stored yet.
+    """
+    now = time()
+    confidence = initial_confidence(provenance)
+    added = 0
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO analysed (board, class, subject, chapter, provenance, analysed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (board or "", chapter_class, subject, chapter_name, provenance, now),
+            )
+            for req in prereqs:
+                if not req.get("chapter"):
+                    continue
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO edges (board, class, subject, chapter, prereq_class, prereq_number, "
+                    "prereq_chapter, reason, confidence, provenance, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (board or "", chapter_class, subject, chapter_name, chapter_class - 1, req.get("number"),
+                     req["chapter"], req.get("reason"), confidence, provenance, now, now),
+                )
+                added += cursor.rowcount
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Could not store prerequisites of {subject} - {chapter_name}: {e}")
+        return
+    _count("recorded_chapters")
+    _count("recorded_edges", added)
+    logger.info(f"📚 Stored {subject} - {chapter_name} (class {chapter_class}) with {added} new edge(s)")
+
+
+def confirm(board, chapter_class, subject, chapter_name, prereq_chapter):
+    """Raises the confidence of a stored edge the teacher selected. Returns False if there is no such edge."""
+    try:
+        with closing(_connect()) as conn, conn:
+            cursor = conn.execute(
+                "UPDATE edges SET confidence = 1 - (1 - confidence) * ?, confirmations = confirmations + 1, "
+                "updated_at = ? WHERE board = ? AND class = ? AND subject = ? AND chapter = ? AND prereq_chapter = ?",
+                (1 - CONFIRMATION_WEIGHT, time(), board or "", chapter_class, subject, chapter_name, prereq_chapter),
+            )
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Could not confirm prerequisite {prereq_chapter} of {subject} - {chapter_name}: {e}")
+        return False
+    if cursor.rowcount:
+        _count("confirmations")
+    return bool(cursor.rowcount)
+
+
+def coverage():
+    """
+    Store contents per (board, class, subject) plus this process's lookup hit
+    rate. If the store cannot be read the report is empty and carries an "error".
+    """
+    analysed, edges, by_provenance, error = [], {}, {}, None
+    try:
+        with closing(_connect()) as conn:
+            analysed = conn.execute(
+                "SELECT board, class, subject, COUNT(*) FROM analysed GROUP BY board, class, subject"
+            ).fetchall()
+            edges = {
+                (board, chapter_class, subject): (count, confirmed, avg_confidence)
+                for board, chapter_class, subject, count, confirmed, avg_confidence in conn.execute(
+                    "SELECT board, class, subject, COUNT(*), SUM(confirmations > 0), AVG(confidence) "
+                    "FROM edges GROUP BY board, class, subject"
+                )
+            }
+            by_provenance = dict(conn.execute("SELECT provenance, COUNT(*) FROM edges GROUP BY provenance").fetchall())
+    except sqlite3.Error as e:
+        logger.warning(f"⚠️ Could not read the prerequisite store coverage: {e}")
+        analysed, edges, by_provenance, error = [], {}, {}, str(e)
+
+    groups = []
+    for board, chapter_class, subject, chapters in sorted(analysed):
+        count, confirmed, avg_confidence = edges.get((board, chapter_class, subject), (0, 0, None))
+        groups.append({
+            "board": board,
+            "class": chapter_class,
+            "subject": subject,
+            "chapters_analysed": chapters,
+            "edges": count,
+            "confirmed_edges": confirmed or 0,
+            "avg_confidence": round(avg_confidence, 3) if avg_confidence is not None else None,
+        })
+
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    report = {
+        "path": os.path.abspath(PREREQ_STORE_PATH),
+        "chapters_analysed": sum(group["chapters_analysed"] for group in groups),
+        "edges": sum(by_provenance.values()),
+        "edges_by_provenance": by_provenance,
+        "groups": groups,
+        "since_start": dict(stats, hit_rate=round(stats["hits"] / lookups, 3) if lookups else None),
+    }
+    if error:
+        report["error"] = error
+    return report
@@ -0,0 +1,97 @@
+"""
+Prerequisite tree of the selected chapters, built as a memoized DAG.
+
+Each class in selected_structure ("class_<n>": {subject: [chapters]}) holds
+the prerequisites of the class above it: a chapter is attached under the
+chapter named in its "for" field, and a chapter without "for" under every
+chapter of the classes above it. Expanding that naively re-copies the same
+subtree under every parent, which grows exponentially with depth and fan-in.
+
+Here every subtree is computed once and shared by all parents that reach it.
+Along a path a chapter name is never repeated, so a subtree depends on the
+path above it only through the names that can still occur below it; those
+are part of the memo key, which keeps the result identical to a full
+expansion. The returned dicts share references, so they serialize to the
+usual nested JSON (json.dump writes each shared subtree in place) and must be
+treated as read-only.
+"""
+
+
+def class_number(class_key):
+    return int(class_key.split('_')[1])
+
+
+class PrerequisiteGraph:
+    def __init__(self, selected_structure):
+        self.structure = selected_structure
+        # Sort class keys by descending class number
+        self.classes = sorted(selected_structure.keys(), key=class_number, reverse=True)
+        self._candidates = {}
+        self._names_below = {}
+        self._subtrees = {}
+
+    def candidates(self, subject, class_index, chapter_name):
+        """Chapters of one class that may be prerequisites of `chapter_name`, in syllabus order."""
+        key = (subject, class_index, chapter_name)
+        if key not in self._candidates:
+            chapters = self.structure.get(self.classes[class_index], {}).get(subject, [])
+            self._candidates[key] = [
+                ch for ch in chapters
+                if ch.get("for") == chapter_name or not ch.get("for")
+            ]
+        return self._candidates[key]
+
+    def names_below(self, subject, class_index):
+        """Chapter names that occur in the classes below `class_index`."""
+        key = (subject, class_index)
+        if key not in self._names_below:
+            self._names_below[key] = frozenset(
+                ch.get("chapter")
+                for lower_class in self.classes[class_index + 1:]
+                for ch in self.structure.get(lower_class, {}).get(subject, [])
+            )
+        return self._names_below[key]
+
+    def prerequisites(self, subject, chapter_name, class_index, path=frozenset()):
+        """Prerequisite subtrees of one chapter; `path` holds the chapter names above it."""
+        path = path | {chapter_name}
+        blocked = path & self.names_below(subject, class_index)
+        key = (subject, chapter_name, class_index, blocked)
+        if key in self._subtrees:
+            return self._subtrees[key]
+
+        prerequisites = []
+        for lower_class_index in range(class_index + 1, len(self.classes)):
+            class_key = self.classes[lower_class_index]
+            for ch in self.candidates(subject, lower_class_index, chapter_name):
+                ch_name = ch.get("chapter")
+                if ch_name in blocked:
+                    continue
+                node = dict(ch)
+                node.pop("for", None)
+                node["class"] = class_key
+                node["prerequisites"] = self.prerequisites(subject, ch_name, lower_class_index, blocked)
+                prerequisites.append(node)
+
+        self._subtrees[key] = prerequisites
+        return prerequisites
+
+    def tree(self):
+        if not self.classes:
+            return {}
+
+        top_class_key = self.classes[0]
+        result = {}
+        for subject, chapters in self.structure[top_class_key].items():
+            result[subject] = []
+            for ch in chapters:
+                node = dict(ch)
+                node["class"] = top_class_key
+                node["prerequisites"] = self.prerequisites(subject, ch.get("chapter"), 0)
+                result[subject].append(node)
+        return {top_class_key: result}
+
+
+def build_prerequisite_tree(selected_structure):
+    """Nested prerequisite tree {top_class: {subject: [chapter + "class" + "prerequisites"]}}."""
+    return PrerequisiteGraph(selected_structure).tree()
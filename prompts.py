@@ -0,0 +1,48 @@
+"""
+Prompt templates split into a fixed prefix and a variable suffix.
+
+Ollama reuses the KV cache for the longest prefix a prompt shares with the
+previous prompt evaluated on the same model, so the constant instructions
+are sent as the `system` prompt (which the model template places first) and
+the per-call data goes last, ordered from most to least shared.
+"""
+import json
+
+PREREQ_SYSTEM_PROMPT = """You are an academic AI assistant helping to identify prerequisite chapters.
+
+Context:
+- The user has selected a specific chapter from a current year's syllabus.
+- You are also given the chapter list from the previous year's syllabus for the same subject and board.
+
+Instructions:
+1. Identify only those prerequisite chapters that are clearly and directly related.
+2. Avoid abstract or general background prerequisites.
+3. All suggested prerequisites must come from the previous year's chapter list.
+
+Output Format (use the given subject as the key and the selected chapter as "for"):
+{
+"prerequisites": {
+    "<Subject>": [
+    {
+        "number": 1,
+        "chapter": "Exact Chapter Name",
+        "reason": "Why this chapter is needed",
+        "for": "<Selected Chapter>"
+    }
+    ]
+}
+}"""
+
+
+def build_prereq_prompt(subject, chapter_name, previous_year_chapters, shared_list=True):
+    """
+    Variable part of the prerequisite prompt. When the previous-year chapter
+    list is the same for every chapter of the subject (`shared_list`, the full
+    list) it precedes the selected chapter, so that it is part of the cached
+    prefix. A list shortlisted for this chapter follows it instead: it differs
+    from chapter to chapter, so only the subject is shared.
+    """
+    chapters = f"Previous Year Chapters:\n{json.dumps(previous_year_chapters, indent=2)}"
+    selected = f"Selected Chapter:\n{json.dumps([{'chapter': chapter_name}], indent=2)}"
+    parts = [f"Subject: {subject}"] + ([chapters, selected] if shared_list else [selected, chapters])
+    return "\n\n".join(parts)
@@ -0,0 +1,168 @@
+"""
+Per-request deadlines and client-disconnect cancellation for LLM calls.
+
+Each request gets a Deadline (REQUEST_DEADLINE seconds) held in a context
+variable, so it follows work into executor threads submitted through
+llm_client.submit. llm_client.generate clamps its timeout to the time left,
+checks the deadline between streamed chunks and refuses to start once the
+deadline has passed or the request was cancelled. A monitor thread watches
+the client socket of every active request and cancels its deadline when the
+client goes away, which stops the in-flight generation on the server.
+"""
+import contextvars
+import logging
+import math
+import select
+import socket
+import threading
+from contextlib import contextmanager, nullcontext
+from time import monotonic, sleep
+
+from config import DISCONNECT_POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+CLIENT_DISCONNECTED = "client disconnected"
+DEADLINE_EXCEEDED = "deadline exceeded"
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+
+
+class Deadline:
+    def __init__(self, seconds=None, expires_at=None, cancel_event=None, cancel_state=None):
+        if expires_at is None and seconds:
+            expires_at = monotonic() + seconds
+        self.expires_at = expires_at
+        # Slices share their parent's cancellation so a disconnect stops every call
+        self._cancel_event = cancel_event or threading.Event()
+        self._cancel_state = cancel_state if cancel_state is not None else {"reason": None}
+
+    def remaining(self):
+        if self.expires_at is None:
+            return math.inf
+        return max(self.expires_at - monotonic(), 0.0)
+
+    def cancel(self, reason):
+        if not self._cancel_event.is_set():
+            self._cancel_state["reason"] = reason
+            self._cancel_event.set()
+
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def done(self):
+        return self.cancelled() or self.expired()
+
+    @property
+    def reason(self):
+        if self.cancelled():
+            return self._cancel_state["reason"]
+        return DEADLINE_EXCEEDED if self.expired() else None
+
+    def slice(self, seconds):
+        """A deadline that ends after `seconds` (or with this one, if sooner) and shares its cancellation."""
+        expires_at = monotonic() + seconds
+        if self.expires_at is not None:
+            expires_at = min(expires_at, self.expires_at)
+        return Deadline(expires_at=expires_at, cancel_event=self._cancel_event, cancel_state=self._cancel_state)
+
+
+def current():
+    return _current.get()
+
+
+def start(seconds):
+    """Installs a new deadline for the current context. Returns (deadline, reset token)."""
+    deadline = Deadline(seconds)
+    return deadline, _current.set(deadline)
+
+
+def install(deadline):
+    """Installs an existing deadline for the current context. Returns the reset token."""
+    return _current.set(deadline)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+@contextmanager
+def _scoped(deadline):
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def share(parts):
+    """
+    Splits what is left of the current deadline evenly across `parts`
+    sequential calls and scopes the next one to its share; time a call
+    does not use rolls over to the remaining ones.
+    """
+    deadline = _current.get()
+    if deadline is None or deadline.expires_at is None:
+        return nullcontext(deadline)
+    return _scoped(deadline.slice(deadline.remaining() / max(parts, 1)))
+
+
+def incomplete_reason():
+    """Why the current request stopped early ("client disconnected"/"deadline exceeded"), or None."""
+    deadline = _current.get()
+    return deadline.reason if deadline is not None else None
+
+
+# ------------------------------- Client disconnect monitor -------------------------------
+
+_watched = {}
+_watched_lock = threading.Lock()
+_monitor_thread = None
+
+
+def client_socket(environ):
+    """The raw client socket exposed by the werkzeug dev server or gunicorn, if any."""
+    return environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+
+
+def _peer_closed(sock):
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        # Readable with nothing to read means the peer closed the connection
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except ValueError:
+        # e.g. TLS sockets do not support MSG_PEEK; cannot tell, assume connected
+        return False
+    except OSError:
+        return True
+
+
+def _monitor():
+    while True:
+        sleep(DISCONNECT_POLL_INTERVAL)
+        with _watched_lock:
+            watched = list(_watched.values())
+        for sock, deadline in watched:
+            if not deadline.cancelled() and _peer_closed(sock):
+                logger.info("Client disconnected; cancelling in-flight LLM calls for the request")
+                deadline.cancel(CLIENT_DISCONNECTED)
+
+
+def watch(deadline, sock):
+    """Cancels `deadline` if the client behind `sock` disconnects."""
+    global _monitor_thread
+    with _watched_lock:
+        _watched[id(deadline)] = (sock, deadline)
+        if _monitor_thread is None:
+            _monitor_thread = threading.Thread(target=_monitor, name="disconnect-monitor", daemon=True)
+            _monitor_thread.start()
+
+
+def unwatch(deadline):
+    with _watched_lock:
+        _watched.pop(id(deadline), None)
@@ -0,0 +1,78 @@
+"""
+PDF rendering of generated study material on the shared rendering layer
+(see pdf_engine).
+
+StudyMaterialWriter takes the material one chapter at a time, as its content
+is generated, and lays the document out once all chapters are in.
+"""
+import logging
+import os
+import uuid
+
+import pdf_engine
+from pdf_engine import PlainText
+
+logger = logging.getLogger(__name__)
+
+
+class StudyMaterialWriter:
+    """
+    Study material PDF assembled chapter by chapter: add_chapter() in reading
+    order turns a chapter into flowables, close() lays them out and writes
+    `output_pdf`, discard() drops them. The file only appears complete: it is
+    written to a temporary path first.
+    """
+
+    def __init__(self, output_pdf):
+        self.output_pdf = output_pdf
+        self.tmp_path = f"{output_pdf}.{uuid.uuid4().hex}.tmp"
+        self.styles = pdf_engine.stylesheet()
+        self.subject = None
+        self.chapters = 0
+        self.story = [PlainText("Study Material", self.styles["StudyTitle"])]
+
+    def add_chapter(self, subject, chapter_data):
+        """Adds a chapter ({"number", "chapter", "content": {content type: text}}) of `subject`."""
+        styles = self.styles
+        story = self.story
+        if subject != self.subject:
+            story.append(PlainText(f"Subject: {subject}", styles["StudySubject"]))
+            self.subject = subject
+        story.append(PlainText(f"Chapter {chapter_data['number']}: {chapter_data['chapter']}", styles["StudyChapter"]))
+        for content_type, content in chapter_data['content'].items():
+            if content:
+                story.append(PlainText(content_type, styles["StudyContentType"]))
+                story.append(PlainText(content, styles["StudyText"]))
+        self.chapters += 1
+
+    def close(self):
+        try:
+            pdf_engine.build_document(self.tmp_path, self.story, "study", title="Study Material")
+            os.replace(self.tmp_path, self.output_pdf)
+        finally:
+            self._remove_tmp()
+        logger.info(f"PDF generated successfully at {self.output_pdf} ({self.chapters} chapters)")
+
+    def discard(self):
+        self.story = []
+        self._remove_tmp()
+
+    def _remove_tmp(self):
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def generate_study_material_pdf(study_material, output_pdf):
+    """Study material grouped by subject and chapter, one section per content type."""
+    writer = None
+    try:
+        writer = StudyMaterialWriter(output_pdf)
+        for subject_data in study_material:
+            for chapter_data in subject_data['chapters']:
+                writer.add_chapter(subject_data['subject'], chapter_data)
+        writer.close()
+    except Exception as e:
+        if writer is not None:
+            writer.discard()
+        logger.error(f"Error generating PDF: {str(e)}")
+        raise
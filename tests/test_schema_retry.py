@@ -0,0 +1,134 @@
+"""
+Schema validation and item-level retries of the generation prompts, against
+a stubbed llm_client.generate (no Ollama needed).
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Importing app must not start the model warm-up thread or the font preload
+os.environ["LLM_WARMUP_ON_START"] = "0"
+os.environ["PDF_FONT_PRELOAD"] = "0"
+
+import app  # noqa: E402
+from llm_schemas import MCQ_QUESTION_SCHEMA, validate  # noqa: E402
+
+ITEMS = [
+    {"class": "10", "subject": "Mathematics", "chapter": "Real Numbers", "topic": "Euclid", "subtopic": None},
+    {"class": "10", "subject": "Mathematics", "chapter": "Polynomials", "topic": "Zeroes", "subtopic": None},
+]
+
+
+def mcq(item, options=("1", "2", "3", "4")):
+    return dict(item, question=f"A question on {item['topic']}?", options=list(options), correct_option=2)
+
+
+class StubGenerate:
+    """Stands in for llm_client.generate: returns the queued responses in turn and records each call."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def __call__(self, model, prompt, call_site="other", **kwargs):
+        self.calls.append({"prompt": prompt, "call_site": call_site, **kwargs})
+        return self.responses.pop(0)
+
+
+class ValidateTest(unittest.TestCase):
+    def test_valid_question(self):
+        self.assertEqual(validate(mcq(ITEMS[0]), MCQ_QUESTION_SCHEMA), [])
+
+    def test_reports_each_problem(self):
+        question = mcq(ITEMS[0], options=("1", "2", "3"))
+        del question["question"]
+        errors = validate(question, MCQ_QUESTION_SCHEMA)
+        self.assertEqual(len(errors), 2)
+
+    def test_non_object(self):
+        self.assertTrue(validate(["not", "an", "object"], MCQ_QUESTION_SCHEMA))
+
+
+@mock.patch.object(app, "LLM_SCHEMA_RETRIES", 1)
+@mock.patch.object(app, "verify_answer_with_models", lambda q: None)
+class MCQRetryTest(unittest.TestCase):
+    def test_only_invalid_items_are_requested_again(self):
+        stub = StubGenerate(
+            json.dumps({"questions": [mcq(ITEMS[0]), mcq(ITEMS[1], options=("1", "2"))]}),
+            json.dumps({"questions": [mcq(ITEMS[1])]}),
+        )
+        with mock.patch("llm_client.generate", stub):
+            questions, missing = app.generate_mcq_chunk("task", "class_10", "Mathematics", ITEMS)
+
+        self.assertEqual([q["chapter"] for q in questions], ["Real Numbers", "Polynomials"])
+        self.assertEqual(missing, [])
+        self.assertEqual(len(stub.calls), 2)
+        # The retry asks for the invalid item alone, with a schema sized to it
+        self.assertEqual(json.loads(stub.calls[1]["prompt"])["items"], [ITEMS[1]])
+        self.assertEqual(stub.calls[1]["format"]["properties"]["questions"]["minItems"], 1)
+
+    def test_items_still_invalid_after_the_retries_are_reported(self):
+        invalid = json.dumps({"questions": [mcq(ITEMS[1], options=())]})
+        stub = StubGenerate(json.dumps({"questions": [mcq(ITEMS[0])]}), invalid)
+        with mock.patch("llm_client.generate", stub):
+            questions, missing = app.generate_mcq_chunk("task", "class_10", "Mathematics", ITEMS)
+
+        self.assertEqual(len(questions), 1)
+        self.assertEqual(missing, [ITEMS[1]])
+        self.assertEqual(len(stub.calls), 2)
+
+    def test_raises_when_nothing_valid_came_back(self):
+        stub = StubGenerate("not json", "still not json")
+        with mock.patch("llm_client.generate", stub):
+            with self.assertRaises(ValueError):
+                app.generate_mcq_chunk("task", "class_10", "Mathematics", ITEMS)
+
+
+@mock.patch.object(app, "LLM_SCHEMA_RETRIES", 1)
+class PrerequisiteRetryTest(unittest.TestCase):
+    def response(self, items, subject="Mathematics"):
+        return json.dumps({"prerequisites": {subject: items}})
+
+    def test_invalid_list_is_requested_again(self):
+        stub = StubGenerate(
+            self.response([{"number": "one", "chapter": ""}]),
+            self.response([{"number": 1, "chapter": "Fractions", "reason": "Used throughout"}]),
+        )
+        with mock.patch("llm_client.generate", stub):
+            items = app.request_prerequisites("Mathematics", "Real Numbers", "prompt")
+
+        self.assertEqual([item["chapter"] for item in items], ["Fractions"])
+        self.assertEqual(len(stub.calls), 2)
+        self.assertEqual(stub.calls[0]["format"], app.prereq_list_schema("Mathematics"))
+
+    def test_well_formed_empty_list_is_an_answer(self):
+        stub = StubGenerate(self.response([]))
+        with mock.patch("llm_client.generate", stub):
+            self.assertEqual(app.request_prerequisites("Mathematics", "Real Numbers", "prompt"), [])
+        self.assertEqual(len(stub.calls), 1)
+
+    def test_other_subjects_items_are_not_taken(self):
+        stub = StubGenerate(json.dumps({"prerequisites": {
+            "Mathematics": [{"number": 1, "chapter": "Fractions"}],
+            "Science": [{"number": 2, "chapter": "Cells"}],
+        }}))
+        with mock.patch("llm_client.generate", stub):
+            items = app.request_prerequisites("Mathematics", "Real Numbers", "prompt")
+        self.assertEqual([item["chapter"] for item in items], ["Fractions"])
+
+    def test_failure_raises_instead_of_returning_no_prerequisites(self):
+        stub = StubGenerate("garbage", self.response([{"chapter": "no number"}]))
+        with mock.patch("llm_client.generate", stub):
+            with self.assertRaises(app.PrerequisiteOutputError):
+                app.request_prerequisites("Mathematics", "Real Numbers", "prompt")
+        self.assertEqual(len(stub.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
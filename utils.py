@@ -1,14 +1,14 @@
 import os
 import re
-import io
 import json
-import copy
 import requests
 from fpdf import FPDF
 from flask import request, render_template
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+
+from config import PREREQ_SHORTLIST_K
+from prereq_ranking import shortlist_chapters
+from prereq_tree import build_prerequisite_tree
+from prompts import build_prereq_prompt
 
 TEXTBOOKS_API = "https://staticapis.pragament.com/textbooks/allbooks.json"
 
@@ -165,58 +165,6 @@ def generate_pdf(data, output_pdf):
         pdf.ln(5)
     pdf.output(output_pdf)
 
-def generate_prerequisite_pdf(tree):
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    margin_left, margin_right, margin_top, margin_bottom = 30, 30, 40, 40
-    y = height - margin_top
-    line_height = 22
-    max_indent = 80
-    sidebar_width = 5
-    background_colors = [colors.whitesmoke, colors.lightgrey]
-    sidebar_colors = [colors.red, colors.orange, colors.green, colors.cadetblue, colors.purple, colors.brown, colors.teal]
-    line_counter = 0
-
-    def draw_text_block(text, level, font="Helvetica", font_size=11):
-        nonlocal y, line_counter
-        if y < margin_bottom + line_height:
-            c.showPage()
-            y = height - margin_top
-            line_counter = 0
-        indent = min(level * 20, max_indent)
-        x_pos = margin_left + indent + sidebar_width + 5
-        bg_color = background_colors[line_counter % 2]
-        c.setFillColor(bg_color)
-        c.rect(margin_left, y - line_height + 4, width - margin_left - margin_right, line_height, fill=1, stroke=0)
-        sidebar_color = sidebar_colors[level % len(sidebar_colors)]
-        c.setFillColor(sidebar_color)
-        c.rect(margin_left, y - line_height + 4, sidebar_width, line_height, fill=1, stroke=0)
-        c.setFillColor(colors.black)
-        c.setFont(font, font_size)
-        c.drawString(x_pos, y, text)
-        y -= line_height
-        line_counter += 1
-
-    def draw_chapters(chapters, level=0):
-        for chapter in chapters:
-            chapter_text = f"{chapter['chapter']} (Chapter {chapter['number']}, {chapter['class']})"
-            draw_text_block(chapter_text, level, font="Helvetica-Bold", font_size=12)
-            if "reason" in chapter:
-                draw_text_block(f"Reason: {chapter['reason']}", level + 1, font="Helvetica-Oblique", font_size=10)
-            if chapter.get("prerequisites"):
-                draw_chapters(chapter["prerequisites"], level + 1)
-
-    for class_key, subjects in tree.items():
-        for subject, chapters in subjects.items():
-            draw_text_block(f"{subject} - {class_key}", 0, font="Helvetica-Bold", font_size=14)
-            draw_chapters(chapters, level=1)
-            y -= line_height // 2
-
-    c.save()
-    buffer.seek(0)
-    return buffer
-
 # === File I/O ===
 def save_json(data, path):
     os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -310,41 +258,6 @@ def handle_final_level(level, class_name, subjects, selected_structure_path):
     return render_template("next_step.html", tree_json=tree)
 
 # === Tree Builders ===
-def build_prerequisite_tree(selected_structure):
-    sorted_classes = sorted(selected_structure.keys(), key=lambda k: int(k.split('_')[1]), reverse=True)
-    if not sorted_classes: return {}
-
-    top_class_key = sorted_classes[0]
-    result = copy.deepcopy(selected_structure[top_class_key])
-    for subject, chapters in result.items():
-        for chapter in chapters:
-            chapter["class"] = top_class_key
-
-    def attach(subject, chapter_name, cur_idx, visited=None):
-        visited = visited or set()
-        if chapter_name in visited: return []
-        visited.add(chapter_name)
-
-        prereqs = []
-        for lower_idx in range(cur_idx + 1, len(sorted_classes)):
-            class_key = sorted_classes[lower_idx]
-            chapters = selected_structure.get(class_key, {}).get(subject, [])
-            for ch in chapters:
-                if ch.get("chapter") in visited: continue
-                if ch.get("for") == chapter_name or not ch.get("for"):
-                    ch_copy = copy.deepcopy(ch)
-                    ch_copy.pop("for", None)
-                    ch_copy["class"] = class_key
-                    ch_copy["prerequisites"] = attach(subject, ch.get("chapter"), lower_idx, visited.copy())
-                    prereqs.append(ch_copy)
-        return prereqs
-
-    for subject, chapters in result.items():
-        for chapter in chapters:
-            chapter["prerequisites"] = attach(subject, chapter.get("chapter"), 0)
-
-    return {top_class_key: result}
-
 def build_prerequisite_tree_minimal(selected_structure):
     sorted_classes = sorted(selected_structure.keys(), key=lambda k: int(k.split('_')[1]), reverse=True)
     if not sorted_classes: return {}
@@ -442,35 +355,8 @@ def fetch_structured_previous_year_content(board, class_name, subjects, depth=1,
 
 # === Prompt Builder ===
 def build_prompt(subject, chapter_name, previous_year_chapters):
-    return f"""
-    You are an academic AI assistant helping to identify prerequisite chapters.
-
-    Context:
-    - The user has selected a specific chapter from a current year's syllabus.
-    - You are also given the chapter list from the previous year's syllabus for the same subject and board.
-
-    Instructions:
-    1. Identify only those prerequisite chapters that are clearly and directly related.
-    2. Avoid abstract or general background prerequisites.
-    3. All suggested prerequisites must come from the previous year's chapter list.
-
-    Output Format:
-    {{
-    "prerequisites": {{
-        "{subject}": [
-        {{
-            "number": 1,
-            "chapter": "Exact Chapter Name",
-            "reason": "Why this chapter is needed",
-            "for": "{chapter_name}"
-        }}
-        ]
-    }}
-    }}
-
-    Selected Chapter:
-    {json.dumps([{"chapter": chapter_name}], indent=2)}
-
-    Previous Year Chapters:
-    {json.dumps(previous_year_chapters, indent=2)}
-    """
\ No newline at end of file
+    # Variable suffix only; send prompts.PREREQ_SYSTEM_PROMPT as the system prompt.
+    # Only the best lexical matches among the previous-year chapters are listed.
+    candidates = shortlist_chapters(chapter_name, previous_year_chapters, PREREQ_SHORTLIST_K)
+    return build_prereq_prompt(subject, chapter_name, candidates,
+                               shared_list=len(candidates) == len(previous_year_chapters))